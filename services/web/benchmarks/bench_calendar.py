@@ -0,0 +1,18 @@
+import pytest
+
+from thermostart.ts.routes import calendar_xml
+
+from .conftest import large_exceptions, large_standard_week
+
+
+def test_calendar_default(benchmark, device):
+    assert benchmark(calendar_xml, device, 2).startswith("<CAL>v0002")
+
+
+@pytest.mark.parametrize("exceptions", [10, 200])
+def test_calendar_large(benchmark, device, exceptions):
+    device.standard_week = large_standard_week()
+    device.exceptions = large_exceptions(exceptions)
+
+    xml = benchmark(calendar_xml, device, 2)
+    assert xml.count("x") == exceptions
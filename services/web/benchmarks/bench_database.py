@@ -0,0 +1,74 @@
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+import pytest
+
+from thermostart import create_app, db
+from thermostart.conftest import PASSWORD, TestConfig
+from thermostart.ts.utils import encrypt_request
+from thermostart.writebehind import write_behind
+
+DEVICES = 20
+POLLS = 200
+THREADS = 8
+
+# SQLite defaults against the tuned pragmas of Config, with and without
+# batched telemetry writes
+PROFILES = {
+    "default": {
+        "SQLITE_JOURNAL_MODE": "DELETE",
+        "SQLITE_SYNCHRONOUS": "FULL",
+        "SQLITE_CACHE_SIZE_KB": 2000,
+        "SQLITE_MMAP_SIZE": 0,
+    },
+    "tuned": {},
+    "write_behind": {"WRITE_BEHIND": True},
+}
+
+
+@pytest.fixture(params=PROFILES)
+def file_app(request, tmp_path):
+    from thermostart.models import Device
+
+    config = type(
+        "ProfileConfig",
+        (TestConfig,),
+        {
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'ts.db'}",
+            "WRITE_BEHIND_JOURNAL": str(tmp_path / "telemetry.journal"),
+        }
+        | PROFILES[request.param],
+    )
+    app = create_app(config)
+    with app.app_context():
+        db.create_all()
+        for i in range(DEVICES):
+            device = Device(hardware_id=f"bench-{i}", password=PASSWORD)
+            device.location_id = 1
+            device.outside_temperature_timestamp = 2**31 - 1
+            db.session.add(device)
+        db.session.commit()
+    yield app
+    write_behind.flush()
+    with app.app_context():
+        db.engine.dispose()
+
+
+def test_poll_throughput(benchmark, file_app):
+    """POLLS polls from THREADS threads, each one writes a room temperature."""
+    client = file_app.test_client()
+    urls = []
+    for i in range(POLLS):
+        hardware_id = f"bench-{i % DEVICES}"
+        query = urlencode(
+            {"u": hardware_id, "p": PASSWORD, "pv": str(150 + i), "hw": "4"}
+            | {"fw": "30040043"}
+        )
+        urls.append(f"/api?_{hardware_id}_{encrypt_request(query, PASSWORD)}")
+
+    def run():
+        with ThreadPoolExecutor(THREADS) as pool:
+            return list(pool.map(lambda url: client.get(url).status_code, urls))
+
+    statuses = benchmark.pedantic(run, rounds=3)
+    assert set(statuses) == {200}
@@ -0,0 +1,11 @@
+import pytest
+
+from thermostart.ts.utils import get_firmware
+
+
+@pytest.mark.parametrize("hw", [1, 2, 3, 4, 5])
+def test_get_firmware(benchmark, hw):
+    def patch():
+        return {"hostname": "thermostart", "port": 3888, "replace_yourowl.com": True}
+
+    assert benchmark(lambda: get_firmware(hw, patch()))
@@ -0,0 +1,32 @@
+from datetime import datetime
+
+import pytest
+
+from .conftest import large_exceptions, large_standard_week
+
+
+def test_utc_offset_in_seconds(benchmark, device):
+    assert benchmark(device.utc_offset_in_seconds, datetime(2024, 7, 1)) == 7200
+
+
+def test_thermostatmodel(benchmark, logged_in_client):
+    response = benchmark(logged_in_client.get, "/thermostatmodel")
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("cached", [True, False], ids=["cached", "jsonify"])
+def test_thermostat_model_encoding(benchmark, app, device, cached):
+    from flask import jsonify
+
+    from thermostart.ui.routes import THERMOSTAT_MODEL
+
+    device.exceptions = large_exceptions()
+    device.standard_week = large_standard_week()
+    with app.test_request_context():
+        if cached:
+            body = benchmark(lambda: THERMOSTAT_MODEL.response(device).get_data())
+        else:
+            body = benchmark(
+                lambda: jsonify(THERMOSTAT_MODEL.values(device)).get_data()
+            )
+    assert body.startswith(b'{"dhw_programs"')
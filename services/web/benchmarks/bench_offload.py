@@ -0,0 +1,81 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+
+import pytest
+import requests
+
+from thermostart.ts.utils import encrypt_request
+
+from .eventlet_server import DEVICE, PASSWORD
+
+
+def request_path(path, **params):
+    query = urlencode({"u": DEVICE, "p": PASSWORD} | params)
+    return f"{path}?_{DEVICE}_{encrypt_request(query, PASSWORD)}"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(params=["inline", "offload"])
+def server(request, tmp_path):
+    port = free_port()
+    env = os.environ | {"OFFLOAD": str(request.param == "offload")}
+    log = open(tmp_path / "server.log", "w")
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.eventlet_server",
+            str(port),
+            f"sqlite:///{tmp_path / 'ts.db'}",
+        ],
+        cwd=os.path.dirname(os.path.dirname(__file__)),
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            requests.get(url + "/metrics", timeout=1)
+            break
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    yield url
+    process.terminate()
+    process.wait()
+    log.close()
+
+
+def test_poll_latency_during_firmware_download(benchmark, server):
+    """Polls while another client keeps downloading firmware images."""
+    session = requests.Session()
+    poll = server + request_path("/api", pv="205", hw="4", fw="30040043")
+    firmware = server + request_path("/fw", hw="4")
+    downloading = threading.Event()
+    done = threading.Event()
+
+    def download():
+        with requests.Session() as downloads:
+            while not done.is_set():
+                downloading.set()
+                assert downloads.get(firmware, timeout=30).status_code == 200
+
+    downloader = threading.Thread(target=download)
+    downloader.start()
+    downloading.wait()
+    try:
+        response = benchmark.pedantic(session.get, (poll,), rounds=40, warmup_rounds=2)
+    finally:
+        done.set()
+        downloader.join()
+    assert response.status_code == 200
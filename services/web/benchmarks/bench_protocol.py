@@ -0,0 +1,40 @@
+from urllib.parse import parse_qs, urlencode
+
+from thermostart.conftest import HARDWARE_ID, PASSWORD
+from thermostart.ts.utils import decrypt_request, encrypt_request, encrypt_response
+
+REQUEST = urlencode(
+    {
+        "u": HARDWARE_ID,
+        "p": PASSWORD,
+        "pv": "205",
+        "hw": "4",
+        "fw": "30040043",
+        "src": "3",
+        "csv": "1",
+        "ts": "1700000000",
+        "oo": "0",
+        "kp": "20.0",
+        "ti": "600.0",
+        "td": "-1.00",
+    }
+    | {f"ot{i}": "0000" for i in (0, 1, 3, 17, 18, 19, 25, 26, 27, 28, 34, 56, 125)}
+)
+
+REPLY = (
+    "<ITHERMOSTAT><PVSET>205</PVSET><TZ>+60</TZ><TA>0</TA><DIM>100</DIM>"
+    "<SLS>2</SLS><SD>0</SD><TH>0</TH><TS>1700000000</TS></ITHERMOSTAT>"
+)
+
+
+def test_decrypt_request(benchmark):
+    payload = encrypt_request(REQUEST, PASSWORD)
+    assert benchmark(decrypt_request, payload, PASSWORD) == REQUEST
+
+
+def test_encrypt_response(benchmark):
+    assert benchmark(encrypt_response, REPLY, PASSWORD)
+
+
+def test_parse_request(benchmark):
+    assert benchmark(parse_qs, REQUEST)["pv"] == ["205"]
@@ -0,0 +1,28 @@
+import pytest
+import pytz
+
+from thermostart.schedule import Schedule
+
+from .conftest import large_exceptions, large_standard_week
+
+AMSTERDAM = pytz.timezone("Europe/Amsterdam")
+# monday 2024-07-01 12:00 UTC
+NOW = 1719835200
+
+
+@pytest.mark.parametrize("exceptions", [10, 200])
+def test_schedule_compile(benchmark, device, exceptions):
+    device.standard_week = large_standard_week()
+    device.exceptions = large_exceptions(exceptions)
+
+    schedule = benchmark(Schedule.of, device, AMSTERDAM)
+    assert schedule.block_at(NOW).program == "home"
+
+
+def test_schedule_lookup(benchmark, device):
+    device.standard_week = large_standard_week()
+    device.exceptions = large_exceptions()
+    schedule = Schedule.of(device, AMSTERDAM)
+
+    block = benchmark(lambda: (schedule.block_at(NOW), schedule.next_block(NOW)))
+    assert block[1].start == block[0].end
@@ -0,0 +1,73 @@
+import os
+import time
+
+import pytest
+
+from thermostart import create_app, db
+from thermostart.conftest import HARDWARE_ID, PASSWORD, TestConfig
+
+os.environ.setdefault("APP_FOLDER", os.path.dirname(os.path.dirname(__file__)))
+
+
+def large_standard_week():
+    return [
+        {"start": [day, hour, 0], "temperature": ("home", "not_home")[hour % 2]}
+        for day in range(7)
+        for hour in range(24)
+    ]
+
+
+def large_exceptions(count=200):
+    return [
+        {
+            "start": [2024, i % 12, 1 + i % 28, 8, 0],
+            "end": [2024, i % 12, 1 + i % 28, 24, 0],
+            "temperature": "comfort",
+        }
+        for i in range(count)
+    ]
+
+
+@pytest.fixture(scope="session")
+def app():
+    from thermostart.models import Device, Location
+
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+        location = Location(
+            country="Netherlands",
+            city="Amsterdam",
+            latitude=52.37,
+            longitude=4.89,
+            timezone="Europe/Amsterdam",
+        )
+        db.session.add(location)
+        db.session.flush()
+        device = Device(hardware_id=HARDWARE_ID, password=PASSWORD)
+        device.location_id = location.id
+        device.outside_temperature_timestamp = int(time.time())
+        db.session.add(device)
+        db.session.commit()
+
+    yield app
+
+    with app.app_context():
+        db.drop_all()
+
+
+@pytest.fixture()
+def device(app):
+    from thermostart.models import Device
+
+    with app.app_context():
+        yield db.session.get(Device, HARDWARE_ID)
+
+
+@pytest.fixture()
+def logged_in_client(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = HARDWARE_ID
+        session["_fresh"] = True
+    return client
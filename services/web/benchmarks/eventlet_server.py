@@ -0,0 +1,50 @@
+"""
+Serves the app from an eventlet WSGI server, like the production worker.
+
+    python -m benchmarks.eventlet_server <port> <database uri>
+
+The database is created with one registered device, see DEVICE and PASSWORD.
+"""
+
+import os
+import sys
+
+import eventlet
+from eventlet import wsgi
+
+DEVICE = "bench-0"
+PASSWORD = "secret"
+
+
+def main(port, uri):
+    os.environ["DATABASE_URL"] = uri
+    from thermostart import create_app, db
+    from thermostart.config import Config
+    from thermostart.models import Device
+
+    class ServerConfig(Config):
+        SQLALCHEMY_DATABASE_URI = uri
+        SECRET_KEY = "benchmark"
+        WRITE_BEHIND_JOURNAL = ""
+        # one client polls as fast as it can
+        RATE_LIMIT_DEVICE_RATE = 0
+        RATE_LIMIT_ADDRESS_RATE = 0
+        LOAD_SHED_CONCURRENCY = 0
+
+    app = create_app(ServerConfig)
+    with app.app_context():
+        db.create_all()
+        device = Device(hardware_id=DEVICE, password=PASSWORD)
+        device.location_id = 1
+        device.outside_temperature_timestamp = 2**31 - 1
+        device.cal_synced = True
+        db.session.add(device)
+        db.session.commit()
+
+    wsgi.server(eventlet.listen(("127.0.0.1", port)), app, log_output=False)
+
+
+if __name__ == "__main__":
+    # only here, the benchmarks import DEVICE and PASSWORD from this module
+    eventlet.monkey_patch()
+    main(int(sys.argv[1]), sys.argv[2])
@@ -0,0 +1,28 @@
+#!/bin/sh
+# Runs the micro-benchmarks against an in-memory database, saves the results
+# in benchmarks/results and fails when the median of a benchmark regressed by
+# more than BENCHMARK_THRESHOLD compared to the previous saved run, or to the
+# run numbered BENCHMARK_BASELINE.
+#
+#   benchmarks/run.sh
+#   BENCHMARK_THRESHOLD=5% benchmarks/run.sh -k calendar
+#   BENCHMARK_BASELINE=0001 benchmarks/run.sh
+cd "$(dirname "$0")/.." || exit 1
+
+export APP_FOLDER="${APP_FOLDER:-$PWD}"
+export SECRET_KEY="${SECRET_KEY:-benchmark}"
+export DATABASE_URL="sqlite://"
+
+# the first run only records a baseline
+if [ -n "$(find benchmarks/results -name '*.json' 2>/dev/null | head -n 1)" ]; then
+    set -- --benchmark-compare${BENCHMARK_BASELINE:+=$BENCHMARK_BASELINE} \
+        --benchmark-compare-fail="median:${BENCHMARK_THRESHOLD:-25%}" "$@"
+fi
+
+exec python -m pytest benchmarks \
+    -o python_files="bench_*.py" \
+    -p no:cacheprovider \
+    --benchmark-only \
+    --benchmark-storage=benchmarks/results \
+    --benchmark-autosave \
+    "$@"
@@ -0,0 +1,74 @@
+"""
+Start-up cost of the app factories, each measured in a fresh interpreter.
+
+    python -m benchmarks.startup [--runs 5]
+
+Reports the median time to import thermostart and create the app, the peak
+resident memory of the process and the number of loaded modules.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+FACTORIES = ["create_app", "create_gateway_app"]
+
+CHILD = """
+import json, resource, sys, time
+
+start = time.perf_counter()
+if {factory!r}:
+    import thermostart
+
+    getattr(thermostart, {factory!r})()
+seconds = time.perf_counter() - start
+usage = resource.getrusage(resource.RUSAGE_SELF)
+# ru_maxrss is in KiB on Linux and in bytes on macOS
+scale = 1 if sys.platform == "darwin" else 1024
+print(json.dumps([seconds, usage.ru_maxrss * scale, len(sys.modules)]))
+"""
+
+
+def measure(factory, env):
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD.format(factory=factory)],
+        env=env,
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def startup(runs=5):
+    """{factory: (seconds, rss bytes, modules)}, medians of ``runs`` runs."""
+    env = os.environ | {
+        "SECRET_KEY": os.getenv("SECRET_KEY", "benchmark"),
+        "DATABASE_URL": "sqlite://",
+        "WRITE_BEHIND_JOURNAL": "",
+    }
+    results = {}
+    # the bare interpreter shows what the app itself adds
+    for factory in ["", *FACTORIES]:
+        samples = [measure(factory, env) for _ in range(runs)]
+        results[factory or "python"] = tuple(
+            statistics.median(column) for column in zip(*samples)
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'':20} {'start-up':>10} {'max rss':>10} {'modules':>8}")
+    for name, (seconds, rss, modules) in startup(args.runs).items():
+        print(f"{name:20} {seconds * 1000:8.0f}ms {rss / 2**20:8.1f}MB {modules:8.0f}")
+
+
+if __name__ == "__main__":
+    main()
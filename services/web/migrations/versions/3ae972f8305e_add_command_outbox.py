@@ -0,0 +1,92 @@
+"""Add command outbox.
+
+Revision ID: 3ae972f8305e
+Revises: dd1fab5001db
+Create Date: 2026-10-19 02:10:00.000000
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3ae972f8305e"
+down_revision = "dd1fab5001db"
+branch_labels = None
+depends_on = None
+
+device = sa.table(
+    "device",
+    sa.column("hardware_id", sa.String),
+    sa.column("ui_synced", sa.Boolean),
+    sa.column("ui_source", sa.String),
+)
+command = sa.table(
+    "command",
+    sa.column("hardware_id", sa.String),
+    sa.column("kind", sa.String),
+    sa.column("sent", sa.Integer),
+)
+
+# commands for the pending ui change of a device, the old poll sent all
+# settings for sources other than these
+UI_SOURCE_KINDS = {
+    "pause_button": ["source"],
+    "direct_temperature_setter_up": ["setpoint"],
+    "direct_temperature_setter_down": ["setpoint"],
+}
+SETTINGS_KINDS = ["ta", "dim", "locale", "sl", "sd"]
+
+
+def upgrade():
+    op.create_table(
+        "command",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("hardware_id", sa.String(length=20), nullable=False),
+        sa.Column("kind", sa.String(length=20), nullable=False),
+        sa.Column("sent", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["hardware_id"],
+            ["device.hardware_id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    with op.batch_alter_table("command", schema=None) as batch_op:
+        batch_op.create_index(
+            batch_op.f("ix_command_hardware_id"), ["hardware_id"], unique=False
+        )
+
+    unsynced = op.get_bind().execute(
+        sa.select(device.c.hardware_id, device.c.ui_source).where(
+            device.c.ui_synced == sa.false()
+        )
+    )
+    rows = [
+        {"hardware_id": hardware_id, "kind": kind}
+        for hardware_id, ui_source in unsynced
+        for kind in UI_SOURCE_KINDS.get(ui_source, SETTINGS_KINDS)
+    ]
+    if rows:
+        op.bulk_insert(command, rows)
+
+    with op.batch_alter_table("device", schema=None) as batch_op:
+        batch_op.drop_column("ui_source")
+        batch_op.drop_column("ui_synced")
+
+
+def downgrade():
+    with op.batch_alter_table("device", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("ui_synced", sa.Boolean(), nullable=True))
+        batch_op.add_column(sa.Column("ui_source", sa.String(length=40), nullable=True))
+
+    # devices with unsent commands get all their settings sent again
+    unsent = sa.select(command.c.hardware_id).where(command.c.sent.is_(None))
+    op.execute(device.update().values(ui_synced=True))
+    op.execute(
+        device.update().where(device.c.hardware_id.in_(unsent)).values(ui_synced=False)
+    )
+
+    with op.batch_alter_table("command", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_command_hardware_id"))
+
+    op.drop_table("command")
@@ -0,0 +1,28 @@
+"""Add command sends.
+
+Revision ID: 7c41d2e9b0a3
+Revises: 3ae972f8305e
+Create Date: 2026-10-19 18:20:00.000000
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "7c41d2e9b0a3"
+down_revision = "3ae972f8305e"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("command", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column("sends", sa.Integer(), server_default="0", nullable=False)
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("command", schema=None) as batch_op:
+        batch_op.drop_column("sends")
@@ -1,24 +1,43 @@
 import csv
 import logging
 import os
+from logging import BASIC_FORMAT
 
 from flask import Flask
 from flask_login import LoginManager
-from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 
 from thermostart.config import Config
+from thermostart.database import engine_options, tune_sqlite
+from thermostart.devicelog import DeviceLogFilter, JsonFormatter, start_queue_listener
 from thermostart.events import socketio
+from thermostart.feed import feed, message_queue
+from thermostart.identity import identity_cache
+from thermostart.metrics import metrics
+from thermostart.offload import offload
+from thermostart.profiling import profiler
+from thermostart.throttle import throttle
+from thermostart.transitions import transitions
+from thermostart.ts.capture import capture
+from thermostart.ts.fastpath import reply_cache
+from thermostart.ts.negcache import negative_cache
+from thermostart.ts.ratelimit import rate_limiter
+from thermostart.ts.rollout import rollout
+from thermostart.writebehind import write_behind
 
 db = SQLAlchemy()
-migrate = Migrate()
 login_manager = LoginManager()
 login_manager.login_view = "auth.login_page"
 login_manager.login_message_category = "info"
 
 
 def setup_log(
-    debug: bool = False, quiet: bool = False, include_timestamp: bool = False
+    debug: bool = False,
+    quiet: bool = False,
+    include_timestamp: bool = False,
+    json_format: bool = False,
+    asynchronous: bool = False,
+    log_filter: logging.Filter | None = None,
 ) -> None:
     if debug:
         log_level = logging.DEBUG
@@ -26,7 +45,21 @@ def setup_log(
         log_level = logging.CRITICAL
     else:
         log_level = logging.INFO
-    logging.basicConfig(level=log_level)
+
+    # like basicConfig, leave logging alone when it has been configured before
+    if not logging.getLogger().handlers:
+        handler = logging.StreamHandler()
+        if json_format:
+            handler.setFormatter(JsonFormatter())
+        elif include_timestamp:
+            handler.setFormatter(logging.Formatter("%(asctime)s " + BASIC_FORMAT))
+        else:
+            handler.setFormatter(logging.Formatter(BASIC_FORMAT))
+        if asynchronous:
+            handler = start_queue_listener(handler)
+        if log_filter is not None:
+            handler.addFilter(log_filter)
+        logging.basicConfig(level=log_level, handlers=[handler])
 
     logging.getLogger("urllib3").setLevel(logging.WARNING)
 
@@ -64,18 +97,59 @@ def needs_alembic_version_in_db():
     )
 
 
-def create_app(config_class=Config):
+def _new_app(config_class):
     app = Flask(__name__)
     app.config.from_object(config_class)
 
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(
+        app.config
+    ) | app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {})
     db.init_app(app=app)
-    migrate.init_app(app, db)
+    with app.app_context():
+        tune_sqlite(db.engine, app.config)
     login_manager.init_app(app=app)
+    return app
+
+
+def _init_services(app):
+    options = {}
+    if url := app.config["SOCKETIO_MESSAGE_QUEUE"]:
+        # the change feed rides along with the browser updates
+        options["client_manager"] = message_queue(url)
+    socketio.init_app(app, logger=app.config["SOCKETIO_LOGGER"], **options)
+    feed.init_app(app)
+    identity_cache.init_app(app)
+    metrics.init_app(app)
+    profiler.init_app(app)
+    capture.init_app(app)
+    throttle.init_app(app)
+    reply_cache.init_app(app)
+    rate_limiter.init_app(app)
+    negative_cache.init_app(app)
+    rollout.init_app(app)
+    write_behind.init_app(app)
+    transitions.init_app(app)
+    offload.init_app(app)
+    setup_log(
+        json_format=app.config["LOG_FORMAT"] == "json",
+        asynchronous=app.config["LOG_ASYNC"],
+        log_filter=DeviceLogFilter.from_config(app.config),
+    )
+
+
+def create_app(config_class=Config):
+    app = _new_app(config_class)
+
+    # alembic is only needed by the flask db commands of this app
+    from flask_migrate import Migrate
+
+    Migrate(app, db)
 
+    from thermostart.admin.routes import admin  # noqa F401
     from thermostart.auth.routes import auth  # noqa F401
     from thermostart.errors.handlers import errors  # noqa F401
     from thermostart.main.routes import main  # noqa F401
-    from thermostart.ts.routes import ts  # noqa F401
+    from thermostart.ts.routes import integrations, ts  # noqa F401
     from thermostart.ui.routes import ui  # noqa F401
 
     app.register_blueprint(main)
@@ -83,8 +157,34 @@ def create_app(config_class=Config):
     app.register_blueprint(ui)
     app.register_blueprint(errors)
     app.register_blueprint(ts)
+    app.register_blueprint(integrations)
+    app.register_blueprint(admin)
+
+    from thermostart.assets import assets
+
+    assets.init_app(app)
+
+    _init_services(app)
+    return app
+
 
-    socketio.init_app(app)
-    setup_log()
+def create_gateway_app(config_class=Config):
+    """App that only speaks the thermostat protocol (/api and /fw).
+
+    Gateway processes start faster and use less memory than the full app, as
+    they never import the UI, forms, templates or migrations. Run them next to
+    a full app that serves the browsers and integrations, with a shared
+    SOCKETIO_MESSAGE_QUEUE. The reply cache is off, it would not see the
+    changes browsers make through the full app, and so is the negative cache
+    of unknown devices, which would not see their registration.
+    """
+    app = _new_app(config_class)
+    app.config["REPLY_CACHE"] = False
+    app.config["NEGATIVE_CACHE_UNKNOWN"] = False
+
+    from thermostart.ts.routes import ts  # noqa F401
+
+    app.register_blueprint(ts)
 
+    _init_services(app)
     return app
@@ -0,0 +1,50 @@
+import hmac
+from functools import wraps
+
+from flask import Blueprint, abort, current_app, jsonify, request
+
+from thermostart.profiling import profiler
+
+admin = Blueprint("admin", __name__, url_prefix="/admin")
+
+
+def token_required(view):
+    """Only allow requests carrying the configured ADMIN_TOKEN as bearer token."""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = current_app.config["ADMIN_TOKEN"]
+        if not token:
+            abort(404)
+        auth = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(auth, f"Bearer {token}"):
+            abort(403)
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+@admin.route("/profiler", methods=["GET", "POST"])
+@token_required
+def profiler_settings():
+    """
+    Show or change the poll profiler. POST a JSON object with any of:
+    sample_rate -- profile one in N /api requests, 0 disables profiling
+    dump -- write the aggregated results to the profile directory now
+    reset -- drop the aggregated results
+    """
+    if request.method == "POST":
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data, dict):
+            return jsonify(error="expected a JSON object"), 400
+        if "sample_rate" in data:
+            sample_rate = data["sample_rate"]
+            # bool is an int as well
+            if type(sample_rate) is not int or sample_rate < 0:
+                return jsonify(error="sample_rate must be an integer >= 0"), 400
+            profiler.configure(sample_rate=sample_rate)
+        if data.get("dump"):
+            profiler.dump()
+        if data.get("reset"):
+            profiler.reset()
+    return jsonify(profiler.status())
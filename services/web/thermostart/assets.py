@@ -0,0 +1,262 @@
+"""
+Bundles the stylesheets and scripts of the UI.
+
+    python -m thermostart.assets
+
+minifies each bundle into one content hashed file in thermostart/static/dist,
+next to gzip and brotli variants and a manifest. Templates list a bundle with
+asset_urls(), which gives the built bundle, served from /assets with immutable
+cache headers, or its source files when nothing was built.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+
+from flask import current_app, request, send_from_directory
+from werkzeug.security import safe_join
+
+STATIC_FOLDER = os.path.join(os.path.dirname(__file__), "static")
+DIST = "dist"
+# url paths of the source files and of the bundles, relative to the app
+STATIC_URL = "static"
+ASSETS_URL = "assets"
+MANIFEST = "manifest.json"
+
+# bundle name to its source files in static, in load order
+BUNDLES = {
+    "base.css": [
+        "css/general.css",
+        "css/basic-layout.css",
+        "css/navigation.css",
+        "css/top-bar.css",
+        "css/footer.css",
+        "css/page-login.css",
+        "css/dialog.css",
+    ],
+    "base.js": [
+        "lib/jquery-1.7.1.js",
+        "lib/underscore-1.5.2.min.js",
+        "lib/backbone-1.0.0.min.js",
+        "js/i18n.js",
+        "js/ProfileView.js",
+    ],
+    "home.css": [
+        "lib/jquery-ui-1.8.16.custom.css",
+        "lib/grey.css",
+        "lib/selectordie.css",
+        "css/general.css",
+        "css/basic-layout.css",
+        "css/navigation.css",
+        "css/top-bar.css",
+        "css/footer.css",
+        "css/page-login.css",
+        "css/page-overview.css",
+        "css/page-exceptions.css",
+        "css/page-standard-week.css",
+        "css/dialog.css",
+        "css/dim-toggle.css",
+        "css/firmware-toggle.css",
+        "css/statusled-toggle.css",
+        "css/display-mode-toggle.css",
+        "css/locale-toggle.css",
+        "css/schedule.css",
+        "css/settings.css",
+    ],
+    "i18n.js": ["js/i18n.js"],
+    "home.js": [
+        "lib/jquery-1.7.1.js",
+        "lib/jquery-ui-1.8.16.custom.min.js",
+        "lib/jquery.ui.datepicker-nl.js",
+        "lib/underscore-1.5.2.min.js",
+        "lib/backbone-1.0.0.min.js",
+        "lib/moment.min.js",
+        "lib/moment-round.min.js",
+        "lib/jquery.flot.min.js",
+        "lib/jquery.flot.time.min.js",
+        "lib/icheck.min.js",
+        "lib/selectordie.min.js",
+        "lib/socket.io.min.js",
+        "lib/keyboard.js",
+        "js/config.js",
+        "js/util.js",
+        "js/ThermostatModel.js",
+        "js/dialogs.js",
+        "js/WeatherView.js",
+        "js/ScheduleView.js",
+        "js/StandardWeek.js",
+        "js/ProfileView.js",
+        "js/Exceptions.js",
+        "js/Overview.js",
+        "js/DirectTemperatureSetter.js",
+        "js/ProgramBlock.js",
+        "js/CurrentProgram.js",
+        "js/PauseButton.js",
+        "js/DimToggle.js",
+        "js/StatusledToggle.js",
+        "js/LocaleToggle.js",
+        "js/DisplayModeToggle.js",
+        "js/FirmwareToggle.js",
+        "js/temperatureCalibration.js",
+        "js/Schedule.js",
+        "js/OpenTherm.js",
+        "js/ithermostat.js",
+    ],
+}
+
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+CSS_IMPORT = re.compile(r"@import[^;]+;")
+# bundles are requested with either encoding, identity is always there
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+
+def _rebase(match, source):
+    url = match.group(2)
+    if re.match(r"^([a-z]+:|/|#)", url):
+        return match.group(0)
+    path = posixpath.normpath(posixpath.join(posixpath.dirname(source), url))
+    # relative to where the bundle is served, not to where it is stored
+    path = posixpath.relpath(posixpath.join(STATIC_URL, path), ASSETS_URL)
+    return f'url("{path}")'
+
+
+def bundle_css(static_folder, sources):
+    import rcssmin
+
+    imports, styles = [], []
+    for source in sources:
+        with open(os.path.join(static_folder, source), encoding="utf-8") as f:
+            style = f.read()
+        # @import only works at the top of the bundle
+        imports += [i for i in CSS_IMPORT.findall(style) if i not in imports]
+        style = CSS_IMPORT.sub("", style)
+        styles.append(CSS_URL.sub(lambda m, s=source: _rebase(m, s), style))
+    return rcssmin.cssmin("\n".join(imports + styles), keep_bang_comments=True)
+
+
+def bundle_js(static_folder, sources):
+    import rjsmin
+
+    scripts = []
+    for source in sources:
+        with open(os.path.join(static_folder, source), encoding="utf-8") as f:
+            scripts.append(rjsmin.jsmin(f.read(), keep_bang_comments=True))
+    # a script may end without a semicolon
+    return ";\n".join(scripts)
+
+
+def _compress(path, data):
+    # no file name or time in the header, equal bundles give equal files
+    with open(path + ".gz", "wb") as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    try:
+        import brotli
+    except ImportError:
+        return
+    with open(path + ".br", "wb") as f:
+        f.write(brotli.compress(data))
+
+
+def build(static_folder=STATIC_FOLDER, output=None):
+    """Write all bundles and their manifest to ``output``, returns the manifest."""
+    output = output or os.path.join(static_folder, DIST)
+    os.makedirs(output, exist_ok=True)
+    manifest = {}
+    for name, sources in BUNDLES.items():
+        stem, ext = os.path.splitext(name)
+        if ext == ".css":
+            data = bundle_css(static_folder, sources).encode()
+        else:
+            data = bundle_js(static_folder, sources).encode()
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        manifest[name] = f"{stem}.{digest}{ext}"
+        path = os.path.join(output, manifest[name])
+        with open(path, "wb") as f:
+            f.write(data)
+        _compress(path, data)
+
+    # drop bundles of earlier builds
+    keep = {MANIFEST} | {
+        filename + suffix
+        for filename in manifest.values()
+        for suffix in ["", ".gz", ".br"]
+    }
+    for filename in os.listdir(output):
+        if filename not in keep:
+            os.remove(os.path.join(output, filename))
+    with open(os.path.join(output, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+class Assets:
+    """Points templates at the built bundles and serves them."""
+
+    def __init__(self):
+        self.folder = None
+        self.manifest = {}
+
+    def init_app(self, app):
+        self.folder = os.path.join(app.static_folder, DIST)
+        self.manifest = {}
+        if app.config["ASSET_BUNDLES"]:
+            self.load(self.folder)
+        app.add_template_global(self.urls, "asset_urls")
+        app.add_url_rule(f"/{ASSETS_URL}/<path:filename>", "assets", self.view)
+        app.extensions["assets"] = self
+
+    def load(self, folder):
+        self.folder = folder
+        path = os.path.join(folder, MANIFEST)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.manifest = json.load(f)
+
+    def urls(self, bundle):
+        # relative, like the other links, for the Home Assistant ingress path
+        if bundle in self.manifest:
+            return [f"{ASSETS_URL}/{self.manifest[bundle]}"]
+        return [f"{STATIC_URL}/{source}" for source in BUNDLES[bundle]]
+
+    def view(self, filename):
+        encoded = filename
+        for encoding, suffix in ENCODINGS:
+            path = safe_join(self.folder, filename + suffix)
+            if request.accept_encodings[encoding] and path and os.path.exists(path):
+                encoded = filename + suffix
+                break
+        else:
+            encoding = None
+
+        response = send_from_directory(
+            self.folder,
+            encoded,
+            mimetype=mimetypes.guess_type(filename)[0],
+            max_age=current_app.config["ASSET_MAX_AGE"],
+        )
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+        # the name changes with the content
+        response.cache_control.immutable = True
+        return response
+
+
+assets = Assets()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the UI asset bundles.")
+    parser.add_argument("--output", help="defaults to thermostart/static/dist")
+    args = parser.parse_args()
+    for name, filename in build(output=args.output).items():
+        print(f"{name} -> {filename}")
+
+
+if __name__ == "__main__":
+    main()
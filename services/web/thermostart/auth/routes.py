@@ -55,7 +55,11 @@ def login_page():
     else:
         form = LoginForm()
         if form.validate_on_submit():
-            device = Device.query.filter_by(hardware_id=form.hardware_id.data).first()
+            device = (
+                Device.query.options(Device.profile("login"))
+                .filter_by(hardware_id=form.hardware_id.data)
+                .first()
+            )
             try:
                 if device and device.password == form.password.data:
                     login_user(user=device)
@@ -101,8 +105,9 @@ def account_page():
         form.city.data = (location_id, city)
 
     if form.validate_on_submit():
-        current_user.location_id = form.city.data[0]
-        current_user.password = form.password.data
+        device = current_user.device
+        device.location_id = form.city.data[0]
+        device.password = form.password.data
         db.session.commit()
         flash("Your account has been updated.", "success")
         return redirect(url_for("auth.account_page"))
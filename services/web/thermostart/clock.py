@@ -0,0 +1,20 @@
+import time
+
+
+class Clock:
+    """Wall clock of the device protocol, which a replay can freeze."""
+
+    def __init__(self):
+        self.frozen = None
+
+    def time(self):
+        return time.time() if self.frozen is None else self.frozen
+
+    def freeze(self, at):
+        self.frozen = at
+
+    def unfreeze(self):
+        self.frozen = None
+
+
+clock = Clock()
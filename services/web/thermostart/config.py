@@ -5,12 +5,44 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+def env_flag(name, default=False):
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+
+def data_path(filename):
+    """``filename`` next to a SQLite database, else in DB_HOME or the cwd."""
+    from sqlalchemy.engine import make_url
+
+    url = os.getenv("DATABASE_URL")
+    database = make_url(url).database if url else None
+    if url and url.startswith("sqlite") and database and database != ":memory:":
+        return os.path.join(os.path.dirname(database), filename)
+    return os.path.join(os.getenv("DB_HOME", ""), filename)
+
+
 class Config:
     STATIC_FOLDER = f"{os.getenv('APP_FOLDER')}/thermostart/static"
     SECRET_KEY = os.environ.get("SECRET_KEY")
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Engine tuning, see thermostart/database.py. A file based SQLite database
+    # gets these pragmas on every connection, an empty value leaves one at the
+    # SQLite default.
+    SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+    SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", 16384))
+    SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 64 * 1024 * 1024))
+    # PostgreSQL connection pool, timeouts in seconds unless stated otherwise
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+    DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+    DB_POOL_PRE_PING = env_flag("DB_POOL_PRE_PING", True)
+    DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", 10))
+    DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 30000))
+
     # In app values that are changeable via environment variables
     AI_MOVE_DELAY_SECONDS = float(os.getenv("AI_MOVE_DELAY_SECONDS", 1.5))
 
@@ -19,3 +51,113 @@ class Config:
     # Autologin feature, this is used by Home Assistant
     AUTOLOGIN_USERNAME = os.getenv("AUTOLOGIN_USERNAME", "")
     AUTOLOGIN_PASSWORD = os.getenv("AUTOLOGIN_PASSWORD", "")
+
+    # Change feed for integrations, see /thermostat/<device_id>/events
+    FEED_BUFFER_SIZE = int(os.getenv("FEED_BUFFER_SIZE", 256))
+    FEED_KEEPALIVE_SECONDS = float(os.getenv("FEED_KEEPALIVE_SECONDS", 15))
+
+    # Bearer token for the /admin endpoints, which are disabled when empty
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+    # Profile one in PROFILE_SAMPLE_RATE device polls, 0 disables profiling
+    PROFILE_SAMPLE_RATE = int(os.getenv("PROFILE_SAMPLE_RATE", 0))
+    PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+    PROFILE_FLUSH_EVERY = int(os.getenv("PROFILE_FLUSH_EVERY", 10))
+
+    # Logging: LOG_FORMAT is "text" or "json", LOG_ASYNC writes from a
+    # background thread. Device traffic is logged for one in LOG_SAMPLE_RATE
+    # polls and at most LOG_RATE_LIMIT lines per device per minute (0 is no
+    # limit). Full request and response payloads are only logged for the
+    # comma separated LOG_FULL_PAYLOAD_IDS, "*" logs them for every device.
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+    LOG_ASYNC = env_flag("LOG_ASYNC")
+    LOG_SAMPLE_RATE = int(os.getenv("LOG_SAMPLE_RATE", 1))
+    LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", 0))
+    LOG_FULL_PAYLOAD_IDS = os.getenv("LOG_FULL_PAYLOAD_IDS", "*")
+    SOCKETIO_LOGGER = env_flag("SOCKETIO_LOGGER", True)
+
+    # Message queue (e.g. redis://redis:6379/0) shared by the full app and
+    # the gateway processes, so browser updates of polls answered by a gateway
+    # reach the process the browsers are connected to
+    SOCKETIO_MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE", "")
+
+    # Thermostats without an open browser, pending changes or UI activity in
+    # the last THROTTLE_ACTIVE_SECONDS are told to poll with this <TH>
+    # throttle factor, 0 leaves the poll rate to the thermostat
+    THROTTLE_IDLE_FACTOR = int(os.getenv("THROTTLE_IDLE_FACTOR", 3))
+    THROTTLE_ACTIVE_SECONDS = int(os.getenv("THROTTLE_ACTIVE_SECONDS", 300))
+
+    # Logged in devices are known for this many seconds without a query,
+    # changes of their password or location in another process show up
+    # after at most this long, 0 checks every request
+    IDENTITY_CACHE_SECONDS = int(os.getenv("IDENTITY_CACHE_SECONDS", 300))
+
+    # Token buckets for /api and /fw: every hardware id and every remote
+    # address may send BURST requests at once and RATE per second after that,
+    # a RATE of 0 disables the limit. Thermostats poll every 5 seconds at
+    # most. The address limit is off unless set, behind a reverse proxy all
+    # devices would share its address.
+    RATE_LIMIT_DEVICE_RATE = float(os.getenv("RATE_LIMIT_DEVICE_RATE", 1))
+    RATE_LIMIT_DEVICE_BURST = int(os.getenv("RATE_LIMIT_DEVICE_BURST", 10))
+    RATE_LIMIT_ADDRESS_RATE = float(os.getenv("RATE_LIMIT_ADDRESS_RATE", 0))
+    RATE_LIMIT_ADDRESS_BURST = int(os.getenv("RATE_LIMIT_ADDRESS_BURST", 100))
+    # While more than LOAD_SHED_CONCURRENCY device requests are in progress,
+    # polls only get <TH>LOAD_SHED_FACTOR</TH>, 0 never sheds load
+    LOAD_SHED_CONCURRENCY = int(os.getenv("LOAD_SHED_CONCURRENCY", 50))
+    LOAD_SHED_FACTOR = int(os.getenv("LOAD_SHED_FACTOR", 6))
+
+    # Requests of unknown hardware ids and repeated undecodable requests are
+    # rejected from memory for NEGATIVE_CACHE_SECONDS (0 disables this), and
+    # logged in one line every NEGATIVE_CACHE_LOG_SECONDS
+    NEGATIVE_CACHE_SECONDS = int(os.getenv("NEGATIVE_CACHE_SECONDS", 300))
+    NEGATIVE_CACHE_SIZE = int(os.getenv("NEGATIVE_CACHE_SIZE", 10000))
+    NEGATIVE_CACHE_LOG_SECONDS = int(os.getenv("NEGATIVE_CACHE_LOG_SECONDS", 60))
+    # Unknown hardware ids too, gateways never do as they would not see the
+    # registrations made through the full app
+    NEGATIVE_CACHE_UNKNOWN = env_flag("NEGATIVE_CACHE_UNKNOWN", True)
+
+    # Polls of FIRMWARE_ROLLOUT_HW thermostats (comma separated hardware
+    # revisions) with older firmware get <FW>1</FW> while fewer than
+    # FIRMWARE_ROLLOUT_SLOTS downloads are offered or in progress. A device
+    # that is not upgraded within FIRMWARE_ROLLOUT_TIMEOUT seconds is offered
+    # the image again, at most FIRMWARE_ROLLOUT_RETRIES times.
+    FIRMWARE_ROLLOUT = env_flag("FIRMWARE_ROLLOUT")
+    FIRMWARE_ROLLOUT_HW = os.getenv("FIRMWARE_ROLLOUT_HW", "5")
+    FIRMWARE_ROLLOUT_SLOTS = int(os.getenv("FIRMWARE_ROLLOUT_SLOTS", 2))
+    FIRMWARE_ROLLOUT_TIMEOUT = int(os.getenv("FIRMWARE_ROLLOUT_TIMEOUT", 600))
+    FIRMWARE_ROLLOUT_RETRIES = int(os.getenv("FIRMWARE_ROLLOUT_RETRIES", 3))
+
+    # Answer polls that change nothing from memory, needs a single worker
+    REPLY_CACHE = env_flag("REPLY_CACHE", True)
+
+    # Telemetry of polls (room temperature, OpenTherm values, PID settings,
+    # hw and fw) is written in one batch every WRITE_BEHIND_INTERVAL seconds
+    # or once WRITE_BEHIND_MAX_DEVICES devices are waiting. The journal is
+    # kept next to a SQLite database, or in DB_HOME, so it survives a new
+    # container. It is synced once per batch, an OS crash or power loss can
+    # still take the values of the last interval.
+    WRITE_BEHIND = env_flag("WRITE_BEHIND", True)
+    WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", 0.25))
+    WRITE_BEHIND_MAX_DEVICES = int(os.getenv("WRITE_BEHIND_MAX_DEVICES", 200))
+    WRITE_BEHIND_JOURNAL = os.getenv(
+        "WRITE_BEHIND_JOURNAL", data_path("write-behind.journal")
+    )
+
+    # Push a "program" event to the browsers of a device when its program
+    # switches, from a timer wheel that turns every PROGRAM_EVENTS_TICK
+    # seconds while any browser is connected
+    PROGRAM_EVENTS = env_flag("PROGRAM_EVENTS", True)
+    PROGRAM_EVENTS_TICK = float(os.getenv("PROGRAM_EVENTS_TICK", 1))
+
+    # Under eventlet, run firmware builds and big JSON documents on a pool of
+    # OFFLOAD_THREADS native threads instead of the hub
+    OFFLOAD = env_flag("OFFLOAD", True)
+    OFFLOAD_THREADS = int(os.getenv("OFFLOAD_THREADS", 4))
+
+    # Serve the UI bundles built by python -m thermostart.assets when there
+    # are any, cached by browsers for ASSET_MAX_AGE seconds
+    ASSET_BUNDLES = env_flag("ASSET_BUNDLES", True)
+    ASSET_MAX_AGE = int(os.getenv("ASSET_MAX_AGE", 365 * 24 * 3600))
+
+    # Append decrypted device traffic to this file for thermostart.ts.replay
+    CAPTURE_FILE = os.getenv("CAPTURE_FILE", "")
@@ -1,6 +1,27 @@
+import time
+from urllib.parse import urlencode
+
 import pytest
 
-from thermostart import create_app
+from thermostart import create_app, db
+from thermostart.config import Config
+from thermostart.ts.utils import encrypt_request
+
+HARDWARE_ID = "ts-1234"
+PASSWORD = "secret"
+
+
+class TestConfig(Config):
+    TESTING = True
+    SECRET_KEY = "testing"
+    SQLALCHEMY_DATABASE_URI = "sqlite://"
+    WTF_CSRF_ENABLED = False
+    WRITE_BEHIND = False
+    PROGRAM_EVENTS = False
+    # tests poll far more often than thermostats do
+    RATE_LIMIT_DEVICE_RATE = 0
+    RATE_LIMIT_ADDRESS_RATE = 0
+    LOAD_SHED_CONCURRENCY = 0
 
 
 @pytest.fixture()
@@ -18,3 +39,54 @@ def app():
 @pytest.fixture()
 def client(app):
     return app.test_client()
+
+
+@pytest.fixture()
+def app_config():
+    """Config class of ``db_app``, override it in a module to change settings."""
+    return TestConfig
+
+
+@pytest.fixture()
+def db_app(app_config):
+    from thermostart.models import Device
+
+    app = create_app(app_config)
+    with app.app_context():
+        db.create_all()
+        device = Device(hardware_id=HARDWARE_ID, password=PASSWORD)
+        device.location_id = 1
+        # keep polls from reaching out to the weather service
+        device.outside_temperature_timestamp = int(time.time())
+        db.session.add(device)
+        db.session.commit()
+
+    yield app
+
+    with app.app_context():
+        db.drop_all()
+
+
+@pytest.fixture()
+def db_client(db_app):
+    return db_app.test_client()
+
+
+@pytest.fixture()
+def device(db_app):
+    from thermostart.models import Device
+
+    with db_app.app_context():
+        yield db.session.get(Device, HARDWARE_ID)
+
+
+@pytest.fixture()
+def poll(db_client):
+    """Send an encrypted device request to /api and return the response."""
+
+    def poll(path="/api", hardware_id=HARDWARE_ID, password=PASSWORD, **params):
+        params = {"u": hardware_id, "p": password} | params
+        payload = encrypt_request(urlencode(params), password)
+        return db_client.get(f"{path}?_{hardware_id}_{payload}")
+
+    return poll
@@ -0,0 +1,60 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
+def _is_file_sqlite(url):
+    return url.get_backend_name() == "sqlite" and url.database not in (
+        None,
+        "",
+        ":memory:",
+    )
+
+
+def engine_options(config):
+    """SQLAlchemy engine options for the database backend of ``config``."""
+    uri = config["SQLALCHEMY_DATABASE_URI"]
+    if not uri:
+        return {}
+    url = make_url(uri)
+    if url.get_backend_name() == "postgresql":
+        return {
+            "pool_size": config["DB_POOL_SIZE"],
+            "max_overflow": config["DB_MAX_OVERFLOW"],
+            "pool_recycle": config["DB_POOL_RECYCLE"],
+            "pool_timeout": config["DB_POOL_TIMEOUT"],
+            "pool_pre_ping": config["DB_POOL_PRE_PING"],
+            "connect_args": {
+                "connect_timeout": config["DB_CONNECT_TIMEOUT"],
+                "options": f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}",
+            },
+        }
+    if _is_file_sqlite(url):
+        # the sqlite3 module waits for locks itself before busy_timeout applies
+        return {"connect_args": {"timeout": config["SQLITE_BUSY_TIMEOUT_MS"] / 1000}}
+    return {}
+
+
+def sqlite_pragmas(config):
+    pragmas = {
+        "journal_mode": config["SQLITE_JOURNAL_MODE"],
+        "synchronous": config["SQLITE_SYNCHRONOUS"],
+        "busy_timeout": config["SQLITE_BUSY_TIMEOUT_MS"],
+        # negative sizes are in KiB
+        "cache_size": -config["SQLITE_CACHE_SIZE_KB"],
+        "mmap_size": config["SQLITE_MMAP_SIZE"],
+    }
+    return {name: value for name, value in pragmas.items() if value != ""}
+
+
+def tune_sqlite(engine, config):
+    """Apply the SQLITE_* pragmas to every connection of a file database."""
+    if not _is_file_sqlite(engine.url):
+        return
+    pragmas = sqlite_pragmas(config)
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
@@ -0,0 +1,134 @@
+import atexit
+import json
+import logging
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+# the per device state is dropped when scanners make it grow beyond this
+MAX_TRACKED_DEVICES = 10000
+
+
+class Payload:
+    """Renders a device request or response only when a handler formats it.
+
+    Requests are parsed query strings; the password is left out.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        if isinstance(self.value, dict):
+            return str(self.value | {"p": None})
+        return str(self.value)
+
+
+class DeviceLogFilter(logging.Filter):
+    """Samples and rate limits INFO records about device traffic.
+
+    Records are recognised by a ``hardware_id`` attribute (pass it through
+    ``extra``). Each message of a device is kept once every ``sample_rate``
+    times, so the lines belonging to one poll are kept or dropped together,
+    and at most ``rate_limit`` records per device per minute get through.
+    Records flagged with ``payload`` are only kept for the hardware ids in
+    ``full_payload_ids`` ("*" keeps them for every device); those devices
+    are never sampled. Warnings and errors always pass.
+    """
+
+    def __init__(
+        self, sample_rate=1, rate_limit=0, full_payload_ids=("*",), clock=None
+    ):
+        super().__init__()
+        self.sample_rate = max(sample_rate, 1)
+        self.rate_limit = rate_limit
+        self.full_payload_ids = set(full_payload_ids)
+        self.clock = clock or time.monotonic
+        self._seen = {}
+        self._buckets = {}
+        self._suppressed = {}
+
+    @classmethod
+    def from_config(cls, config):
+        ids = [i.strip() for i in config["LOG_FULL_PAYLOAD_IDS"].split(",")]
+        return cls(
+            sample_rate=config["LOG_SAMPLE_RATE"],
+            rate_limit=config["LOG_RATE_LIMIT"],
+            full_payload_ids=[i for i in ids if i],
+        )
+
+    def filter(self, record):
+        hardware_id = getattr(record, "hardware_id", None)
+        if hardware_id is None or record.levelno >= logging.WARNING:
+            return True
+        if getattr(record, "payload", False):
+            if not self.full_payload_ids & {"*", hardware_id}:
+                return False
+        if hardware_id in self.full_payload_ids:
+            return True
+
+        if len(self._seen) > MAX_TRACKED_DEVICES:
+            self._seen.clear()
+            self._buckets.clear()
+            self._suppressed.clear()
+
+        key = (hardware_id, record.msg)
+        seen = self._seen.get(key, 0)
+        self._seen[key] = seen + 1
+        if seen % self.sample_rate:
+            return False
+
+        if self.rate_limit > 0 and not self._take_token(hardware_id):
+            self._suppressed[hardware_id] = self._suppressed.get(hardware_id, 0) + 1
+            return False
+        if suppressed := self._suppressed.pop(hardware_id, 0):
+            record.suppressed = suppressed
+        return True
+
+    def _take_token(self, hardware_id):
+        now = self.clock()
+        tokens, last = self._buckets.get(hardware_id, (self.rate_limit, now))
+        tokens = min(self.rate_limit, tokens + (now - last) * self.rate_limit / 60)
+        if tokens < 1:
+            self._buckets[hardware_id] = (tokens, now)
+            return False
+        self._buckets[hardware_id] = (tokens - 1, now)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including the device fields of a record."""
+
+    FIELDS = ("hardware_id", "remote_addr", "suppressed")
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in self.FIELDS:
+            if (value := getattr(record, field, None)) is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Queues records unformatted, so messages are rendered by the listener."""
+
+    def prepare(self, record):
+        return record
+
+
+def start_queue_listener(handler):
+    """Move ``handler`` behind a queue and return the handler to log to."""
+    records = queue.SimpleQueue()
+    listener = QueueListener(records, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return DeferredQueueHandler(records)
@@ -1,15 +1,41 @@
+from collections import Counter
+
 from flask_login import current_user
 from flask_socketio import SocketIO, join_room, leave_room
 
+from thermostart.clock import clock
+from thermostart.feed import FEED_NAMESPACE, feed
+from thermostart.metrics import SOCKET_ROOMS, SOCKETIO_EMITS
+from thermostart.transitions import transitions
+from thermostart.ts import outbox
+
 socketio = SocketIO(cors_allowed_origins="*", logger=True)
 
+# connected browsers per device room
+rooms = Counter()
+# protocol time of the last browser activity per device
+ui_activity = {}
+
+
+def notify(hardware_id, event, data):
+    """Push a device state change to the browsers in its room and to the feed."""
+    socketio.emit(event, data, namespace="/", to=hardware_id)
+    SOCKETIO_EMITS.inc(event=event)
+    if feed.queued:
+        # to the feeds of all processes, see FeedRelay
+        socketio.emit(event, data, namespace=FEED_NAMESPACE, to=hardware_id)
+    else:
+        feed.publish(hardware_id, event, data)
+
 
 @socketio.on("store-thermostat", namespace="/")
 def on_store_thermostat(req):
     from thermostart import db
-    from thermostart.models import Device
 
-    device = Device.query.get(current_user.get_id())
+    device = current_user.device
+    command = None
+    if req.get("ui_synced") is False:
+        command = outbox.command_for(device, req, req.get("ui_source"))
     device.exceptions = req["exceptions"]
     device.predefined_temperatures = req["predefined_temperatures"]
     device.predefined_labels = req["predefined_labels"]
@@ -24,17 +50,32 @@ def on_store_thermostat(req):
     device.port = req["port"]
     device.source = req["source"]
     device.target_temperature = req["target_temperature"]
-    device.ui_synced = req["ui_synced"]
-    device.ui_source = req["ui_source"]
+    outbox.queue(device, command)
     device.cal_synced = False
     db.session.commit()
+    ui_activity[device.hardware_id] = clock.time()
 
 
 @socketio.on("connect")
 def on_join():
-    join_room(current_user.get_id())
+    room = current_user.get_id()
+    join_room(room)
+    if room is not None:
+        rooms[room] += 1
+        if rooms[room] == 1:
+            transitions.join(room)
+        ui_activity[room] = clock.time()
+        SOCKET_ROOMS.set(len(rooms))
 
 
 @socketio.on("disconnect")
 def on_leave():
-    leave_room(current_user.get_id())
+    room = current_user.get_id()
+    leave_room(room)
+    if room in rooms:
+        ui_activity[room] = clock.time()
+        rooms[room] -= 1
+        if rooms[room] <= 0:
+            del rooms[room]
+            transitions.leave(room)
+        SOCKET_ROOMS.set(len(rooms))
@@ -0,0 +1,97 @@
+import threading
+from collections import deque
+
+import socketio
+
+# Socket.IO namespace that carries feed events through the message queue,
+# no browser connects to it
+FEED_NAMESPACE = "/feed"
+
+
+class ChangeFeed:
+    """Per-device buffer of state changes for integrations.
+
+    Every change gets a process wide, increasing event id. Subscribers resume
+    by passing the last id they have seen; when that id has already fallen out
+    of the buffer (or was issued by a previous process) they get ``None`` back
+    and should fetch a fresh snapshot instead.
+    """
+
+    def __init__(self, maxlen=256):
+        self.maxlen = maxlen
+        # changes go through the Socket.IO message queue, see FeedRelay
+        self.queued = False
+        self._events = {}
+        self._evicted = {}
+        self._last_id = 0
+        self._condition = threading.Condition()
+
+    def init_app(self, app):
+        self.maxlen = app.config.get("FEED_BUFFER_SIZE", self.maxlen)
+        self.queued = bool(app.config.get("SOCKETIO_MESSAGE_QUEUE"))
+        app.extensions["feed"] = self
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def publish(self, hardware_id, event, data):
+        with self._condition:
+            self._last_id += 1
+            events = self._events.get(hardware_id)
+            if events is None:
+                events = self._events[hardware_id] = deque(maxlen=self.maxlen)
+            if len(events) == events.maxlen:
+                self._evicted[hardware_id] = events[0][0]
+            events.append((self._last_id, event, data))
+            self._condition.notify_all()
+            return self._last_id
+
+    def since(self, hardware_id, last_id):
+        with self._condition:
+            return self._since(hardware_id, last_id)
+
+    def wait(self, hardware_id, last_id, timeout):
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._since(hardware_id, last_id) != [], timeout=timeout
+            )
+            return self._since(hardware_id, last_id)
+
+    def _since(self, hardware_id, last_id):
+        if last_id > self._last_id or last_id < self._evicted.get(hardware_id, 0):
+            return None
+        return [e for e in self._events.get(hardware_id, ()) if e[0] > last_id]
+
+
+feed = ChangeFeed()
+
+
+class FeedRelay:
+    """Socket.IO client manager mixin that feeds the changes of all processes.
+
+    With a message queue, changes are emitted in FEED_NAMESPACE instead of
+    published directly. The manager of every process, the sending one too,
+    hands them to its own feed, so the feed of the full app carries the
+    changes of polls answered by gateways.
+    """
+
+    def _handle_emit(self, message):
+        if message.get("namespace") != FEED_NAMESPACE:
+            return super()._handle_emit(message)
+        [data] = message["data"]
+        feed.publish(message["room"], message["event"], data)
+
+
+def message_queue(url, channel="flask-socketio"):
+    """The client manager for ``url``, picked as Flask-SocketIO does."""
+    if url.startswith(("redis://", "rediss://")):
+        base = socketio.RedisManager
+    elif url.startswith("kafka://"):
+        base = socketio.KafkaManager
+    elif url.startswith("zmq"):
+        base = socketio.ZmqManager
+    else:
+        base = socketio.KombuManager
+    manager = type(f"Feed{base.__name__}", (FeedRelay, base), {})
+    return manager(url, channel=channel)
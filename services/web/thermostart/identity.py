@@ -0,0 +1,111 @@
+import threading
+import time
+
+from flask_login import UserMixin
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+# changes to these columns end the cached identity of a device
+ACCOUNT_COLUMNS = ("password", "location_id")
+
+
+class Principal(UserMixin):
+    """The logged in device, as far as sessions need to know it.
+
+    Checking a login and joining socket rooms only needs the hardware id, so
+    the device is only read, with the columns of the "ui" profile, on first
+    use of any other attribute or of ``device``.
+    """
+
+    def __init__(self, hardware_id, location_id):
+        self.hardware_id = hardware_id
+        self.location_id = location_id
+
+    def get_id(self):
+        return self.hardware_id
+
+    @property
+    def device(self):
+        from thermostart import db
+        from thermostart.models import Device
+
+        if "_device" not in self.__dict__:
+            self._device = db.session.get(
+                Device, self.hardware_id, options=[Device.profile("ui")]
+            )
+        return self._device
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.device, name)
+
+    def __repr__(self):
+        return f"<Principal [{self.hardware_id}]>"
+
+
+class IdentityCache:
+    """Remembers which devices exist for ``seconds``, to load users cheaply.
+
+    Flask-Login loads the user of every authenticated request and Socket.IO
+    event. A cached device becomes a Principal without a query; others are
+    looked up by their id and location only. Changing the password or
+    location of a device, or deleting it, drops it from the cache of this
+    process, the expiry bounds how long other processes keep it.
+    """
+
+    def __init__(self):
+        self.seconds = 300
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.seconds = app.config["IDENTITY_CACHE_SECONDS"]
+        self._entries.clear()
+        app.extensions["identity_cache"] = self
+
+    def load(self, hardware_id):
+        from thermostart import db
+        from thermostart.models import Device
+
+        now = time.monotonic()
+        entry = self._entries.get(hardware_id)
+        if entry is None or entry[1] <= now:
+            location_id = (
+                db.session.query(Device.location_id)
+                .filter_by(hardware_id=hardware_id)
+                .scalar()
+            )
+            if location_id is None:
+                self.invalidate(hardware_id)
+                return None
+            entry = (location_id, now + self.seconds)
+            if self.seconds > 0:
+                with self._lock:
+                    self._entries[hardware_id] = entry
+        return Principal(hardware_id, entry[0])
+
+    def invalidate(self, hardware_id):
+        with self._lock:
+            self._entries.pop(hardware_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+identity_cache = IdentityCache()
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_accounts(session, flush_context):
+    from thermostart.models import Device
+
+    for instance in session.deleted:
+        if isinstance(instance, Device):
+            identity_cache.invalidate(instance.hardware_id)
+    for instance in session.dirty:
+        if isinstance(instance, Device):
+            attrs = inspect(instance).attrs
+            if any(attrs[column].history.has_changes() for column in ACCOUNT_COLUMNS):
+                identity_cache.invalidate(instance.hardware_id)
@@ -0,0 +1,273 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+# request latency is tracked for these routes only, keyed by their url rule
+TRACKED_ROUTES = {
+    "/api",
+    "/fw",
+    "/fw/hcu",
+    "/thermostat/<device_id>",
+    "/thermostatmodel",
+    "/firmware",
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        counts, _ = self._values.get(self._key(labels), ([0], 0))
+        return counts[-1]
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                for bound, count in zip(self.buckets, counts):
+                    labels = key + (("le", _format_value(float(bound))),)
+                    samples.append((f"{self.name}_bucket", labels, count))
+                samples.append((f"{self.name}_sum", key, total))
+                samples.append((f"{self.name}_count", key, counts[-1]))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        return "\n".join(m.render() for m in self._metrics.values()) + "\n"
+
+    def init_app(self, app):
+        app.before_request(_start_request)
+        app.teardown_request(_finish_request)
+        app.add_url_rule("/metrics", "metrics", self.view)
+        app.extensions["metrics"] = self
+
+    def view(self):
+        return Response(self.render(), mimetype="text/plain; version=0.0.4")
+
+
+metrics = Registry()
+
+REQUEST_LATENCY = metrics.histogram(
+    "thermostart_request_duration_seconds",
+    "Time spent handling a request.",
+    ["route"],
+)
+DB_STATEMENTS = metrics.histogram(
+    "thermostart_db_statements_per_request",
+    "Database statements executed per request.",
+    ["route"],
+    buckets=COUNT_BUCKETS,
+)
+DB_COMMITS = metrics.histogram(
+    "thermostart_db_commits_per_request",
+    "Database commits per request.",
+    ["route"],
+    buckets=COUNT_BUCKETS,
+)
+WEATHER_FETCHES = metrics.counter(
+    "thermostart_weather_fetches_total", "Outside temperature lookups."
+)
+WEATHER_LATENCY = metrics.histogram(
+    "thermostart_weather_fetch_duration_seconds",
+    "Time spent fetching the outside temperature.",
+)
+SOCKETIO_EMITS = metrics.counter(
+    "thermostart_socketio_emits_total", "Socket.IO events emitted.", ["event"]
+)
+CALENDAR_SYNCS = metrics.counter(
+    "thermostart_calendar_syncs_total", "Calendars sent to thermostats."
+)
+FIRMWARE_BYTES = metrics.counter(
+    "thermostart_firmware_bytes_total", "Firmware bytes served.", ["route"]
+)
+REPLY_CACHE_HITS = metrics.counter(
+    "thermostart_reply_cache_hits_total", "Polls answered from the reply cache."
+)
+WRITE_BEHIND_BATCH = metrics.histogram(
+    "thermostart_write_behind_batch_devices",
+    "Devices written per batched telemetry update.",
+    buckets=(1, 10, 50, 100, 200, 500, 1000),
+)
+JSON_FRAGMENTS = metrics.counter(
+    "thermostart_json_fragments_encoded_total",
+    "Device fields encoded to JSON, the others came from the cache.",
+    ["view"],
+)
+REQUESTS_LIMITED = metrics.counter(
+    "thermostart_requests_limited_total",
+    "Device requests refused, or only told to back off, by the rate limiter.",
+    ["route", "reason"],
+)
+REQUESTS_REJECTED = metrics.counter(
+    "thermostart_requests_rejected_total",
+    "Device requests rejected from the negative cache.",
+    ["reason"],
+)
+FIRMWARE_ROLLOUT_DEVICES = metrics.gauge(
+    "thermostart_firmware_rollout_devices",
+    "Devices of the firmware rollout by state.",
+    ["state"],
+)
+FIRMWARE_RETRIES = metrics.counter(
+    "thermostart_firmware_retries_total",
+    "Firmware transfers that timed out or failed and are offered again.",
+)
+SOCKET_ROOMS = metrics.gauge(
+    "thermostart_socket_rooms", "Device rooms with connected browsers."
+)
+PROGRAM_TIMERS = metrics.gauge(
+    "thermostart_program_timers",
+    "Device rooms with a timer for their next program switch.",
+)
+
+
+def _start_request():
+    g.metrics_start = time.perf_counter()
+    g.db_statements = 0
+    g.db_commits = 0
+
+
+def _finish_request(exc):
+    rule = request.url_rule
+    if rule is None or rule.rule not in TRACKED_ROUTES or "metrics_start" not in g:
+        return
+    REQUEST_LATENCY.observe(time.perf_counter() - g.metrics_start, route=rule.rule)
+    DB_STATEMENTS.observe(g.db_statements, route=rule.rule)
+    DB_COMMITS.observe(g.db_commits, route=rule.rule)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context() and "db_statements" in g:
+        g.db_statements += 1
+
+
+@event.listens_for(Session, "after_commit")
+def _count_commit(session):
+    if has_app_context() and "db_commits" in g:
+        g.db_commits += 1
@@ -1,10 +1,10 @@
 import os
 from datetime import datetime
 
-import pytz
 from flask_login import UserMixin
 from sqlalchemy import JSON, DateTime
 from sqlalchemy.ext.mutable import MutableDict, MutableList
+from sqlalchemy.orm import deferred, load_only
 from sqlalchemy.sql import func
 
 from thermostart import db, login_manager
@@ -13,7 +13,9 @@ from thermostart.ts.utils import Display, Source, StatusLed
 
 @login_manager.user_loader
 def load_user(id):
-    return Device.query.get(id)
+    from thermostart.identity import identity_cache
+
+    return identity_cache.load(id)
 
 
 class Location(db.Model):
@@ -92,38 +94,54 @@ class Device(UserMixin, db.Model):
     hardware_id = db.Column(db.String(20), primary_key=True)
     password = db.Column(db.String(20), index=True)
     location_id = db.Column(db.Integer, db.ForeignKey("location.id"), nullable=False)
-    exceptions = db.Column(MutableList.as_mutable(JSON), default=get_default_exceptions)
-    predefined_temperatures = db.Column(
-        MutableDict.as_mutable(JSON), default=get_default_predefined_temperatures
+    # polls leave the deferred columns alone, using one loads its whole
+    # group, see PROFILES
+    exceptions = deferred(
+        db.Column(MutableList.as_mutable(JSON), default=get_default_exceptions),
+        group="calendar",
+    )
+    predefined_temperatures = deferred(
+        db.Column(
+            MutableDict.as_mutable(JSON), default=get_default_predefined_temperatures
+        ),
+        group="calendar",
     )
-    predefined_labels = db.Column(
-        MutableDict.as_mutable(JSON), default=get_default_predefined_labels
+    predefined_labels = deferred(
+        db.Column(MutableDict.as_mutable(JSON), default=get_default_predefined_labels),
+        group="ui",
     )
-    standard_week = db.Column(
-        MutableList.as_mutable(JSON), default=get_default_standard_week
+    standard_week = deferred(
+        db.Column(MutableList.as_mutable(JSON), default=get_default_standard_week),
+        group="calendar",
     )
-    dhw_programs = db.Column(
-        MutableList.as_mutable(JSON), default=get_default_dhw_programs
+    dhw_programs = deferred(
+        db.Column(MutableList.as_mutable(JSON), default=get_default_dhw_programs),
+        group="ui",
     )
     ta = db.Column(db.Integer, default=0)  # no temperature adjustment
     dim = db.Column(db.Integer, default=100)  # leds on 100%
     sl = db.Column(db.Integer, default=StatusLed.ENABLED.value)
     sd = db.Column(db.Integer, default=Display.TEMPERATURE.value)
     locale = db.Column(db.String(10), default="en-GB")
-    port = db.Column(db.Integer, default=os.getenv("FLASK_PORT", 3888))
-    host = db.Column(db.String(17), default=os.getenv("FLASK_HOST", "yourhostname"))
+    port = deferred(
+        db.Column(db.Integer, default=os.getenv("FLASK_PORT", 3888)), group="ui"
+    )
+    host = deferred(
+        db.Column(db.String(17), default=os.getenv("FLASK_HOST", "yourhostname")),
+        group="ui",
+    )
     room_temperature = db.Column(db.Integer, default=0)
     outside_temperature = db.Column(db.Integer, default=0)
     outside_temperature_timestamp = db.Column(db.Integer, default=0)
     target_temperature = db.Column(db.Integer, default=0)
     source = db.Column(db.Integer, default=Source.STD_WEEK.value)
-    ui_synced = db.Column(db.Boolean, default=False)
-    ui_source = db.Column(db.String(40))
     fw = db.Column(db.Integer, default=0)
     hw = db.Column(db.Integer, default=0)
     cal_synced = db.Column(db.Boolean, default=False)
     cal_version = db.Column(db.Integer, default=1)
-    creation_time = db.Column(DateTime(timezone=True), server_default=func.now())
+    creation_time = deferred(
+        db.Column(DateTime(timezone=True), server_default=func.now())
+    )
     oo = db.Column(db.Integer, default=0)
     ot0 = db.Column(db.Integer, default=0)
     ot1 = db.Column(db.Integer, default=0)
@@ -141,9 +159,95 @@ class Device(UserMixin, db.Model):
     kp = db.Column(db.Float)
     ti = db.Column(db.Float)
     td = db.Column(db.Float)
+    commands = db.relationship(
+        "Command", order_by="Command.id", cascade="all, delete-orphan"
+    )
 
     order = ["hardware_id", "password"]
 
+    # OpenTherm data ids reported by the thermostat
+    OT_COLUMNS = [
+        "ot0",
+        "ot1",
+        "ot3",
+        "ot17",
+        "ot18",
+        "ot19",
+        "ot25",
+        "ot26",
+        "ot27",
+        "ot28",
+        "ot34",
+        "ot56",
+        "ot125",
+    ]
+    # columns each kind of request reads, see profile(), "poll" is what a
+    # plain query loads and "calendar" the deferred group calendar_xml() uses
+    PROFILES = {
+        "login": ["hardware_id", "password"],
+        "poll": [
+            "hardware_id",
+            "password",
+            "location_id",
+            "ta",
+            "dim",
+            "sl",
+            "sd",
+            "locale",
+            "room_temperature",
+            "outside_temperature",
+            "outside_temperature_timestamp",
+            "target_temperature",
+            "source",
+            "fw",
+            "hw",
+            "cal_synced",
+            "cal_version",
+            "oo",
+            "kp",
+            "ti",
+            "td",
+        ]
+        + OT_COLUMNS,
+        "calendar": [
+            "hardware_id",
+            "standard_week",
+            "exceptions",
+            "predefined_temperatures",
+        ],
+        "schedule": [
+            "hardware_id",
+            "location_id",
+            "standard_week",
+            "exceptions",
+            "predefined_temperatures",
+        ],
+        "ui": [
+            "hardware_id",
+            "location_id",
+            "exceptions",
+            "predefined_temperatures",
+            "predefined_labels",
+            "standard_week",
+            "dhw_programs",
+            "ta",
+            "dim",
+            "sl",
+            "sd",
+            "locale",
+            "port",
+            "host",
+            "room_temperature",
+            "outside_temperature",
+            "target_temperature",
+            "source",
+            "fw",
+            "hw",
+            "oo",
+        ]
+        + OT_COLUMNS,
+    }
+
     def __init__(self, hardware_id, password):
         self.hardware_id = hardware_id
         self.password = password
@@ -151,12 +255,41 @@ class Device(UserMixin, db.Model):
     def get_id(self):
         return self.hardware_id
 
+    @classmethod
+    def profile(cls, name):
+        """Loader option that only reads the columns of profile ``name``.
+
+        Other columns are read when first used, one query per column or
+        deferred group, so use the narrowest profile that covers a request.
+        """
+        return load_only(*(getattr(cls, column) for column in cls.PROFILES[name]))
+
     def utc_offset_in_seconds(self, date=None):
         location = Location.query.get(self.location_id)
         if location is not None:
-            return pytz.timezone(location.timezone).utcoffset(datetime.now()).seconds
+            import pytz
+
+            date = date or datetime.now()
+            return pytz.timezone(location.timezone).utcoffset(date).seconds
         else:
             return 0
 
     def __repr__(self):
         return f"<Entry [{self.hardware_id}] {self.source}>"
+
+
+class Command(db.Model):
+    """A change for a thermostat, see thermostart/ts/outbox.py."""
+
+    id = db.Column(db.Integer, primary_key=True)
+    hardware_id = db.Column(
+        db.String(20), db.ForeignKey("device.hardware_id"), index=True, nullable=False
+    )
+    kind = db.Column(db.String(20), nullable=False)
+    # protocol time of the poll whose reply carried it
+    sent = db.Column(db.Integer)
+    # replies that carried it
+    sends = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+    def __repr__(self):
+        return f"<Command [{self.id}] {self.hardware_id} {self.kind}>"
@@ -0,0 +1,66 @@
+import logging
+import sys
+
+from sqlalchemy.engine import make_url
+
+_LOGGER = logging.getLogger(__name__)
+
+# schedules with more blocks than this are serialised off the hub
+LARGE_SCHEDULE = 100
+
+
+def _monkey_patched():
+    if "eventlet" not in sys.modules:
+        return False
+    from eventlet import patcher
+
+    return patcher.is_monkey_patched("thread")
+
+
+def _green_psycopg():
+    try:
+        from psycogreen.eventlet import patch_psycopg
+    except ImportError:
+        _LOGGER.warning(
+            "Install psycogreen to keep PostgreSQL queries from blocking eventlet"
+        )
+    else:
+        patch_psycopg()
+
+
+class Offloader:
+    """Runs blocking work on a bounded pool of native threads under eventlet.
+
+    An eventlet worker runs all greenlets on one OS thread, so building a
+    firmware image or serialising a big schedule stalls every other
+    thermostat and socket meanwhile. ``run`` hands such work to eventlet's
+    tpool (``threads`` native threads) in a monkey patched process and calls
+    it inline otherwise. Only pass plain data, never database sessions or
+    ORM objects.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.threads = 20
+
+    def init_app(self, app):
+        self.enabled = app.config["OFFLOAD"] and _monkey_patched()
+        self.threads = app.config["OFFLOAD_THREADS"]
+        if self.enabled:
+            from eventlet import tpool
+
+            tpool.set_num_threads(self.threads)
+            uri = app.config["SQLALCHEMY_DATABASE_URI"]
+            if uri and make_url(uri).get_backend_name() == "postgresql":
+                _green_psycopg()
+        app.extensions["offload"] = self
+
+    def run(self, func, *args, **kwargs):
+        if not self.enabled:
+            return func(*args, **kwargs)
+        from eventlet import tpool
+
+        return tpool.execute(func, *args, **kwargs)
+
+
+offload = Offloader()
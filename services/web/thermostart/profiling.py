@@ -0,0 +1,177 @@
+import cProfile
+import itertools
+import logging
+import os
+import pstats
+import threading
+import tracemalloc
+from collections import Counter
+
+from flask import g, request
+
+_LOGGER = logging.getLogger(__name__)
+
+PROFILED_ROUTES = {"/api"}
+MAX_STACK_DEPTH = 64
+
+
+def _frame_name(func):
+    filename, lineno, name = func
+    if filename == "~":
+        return name.replace(";", ":")
+    return f"{os.path.basename(filename)}:{lineno}:{name}".replace(";", ":")
+
+
+def collapsed_stacks(stats):
+    """Approximate flamegraph stacks (in microseconds) from a pstats call graph.
+
+    cProfile only records caller/callee pairs, so the time of a function is
+    spread over its callers in proportion to the time each caller spent in it.
+    """
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+    roots = [
+        func
+        for func, (_, _, _, _, callers) in stats.stats.items()
+        if not any(caller in stats.stats for caller in callers)
+    ]
+
+    stacks = Counter()
+
+    def walk(func, path, scale):
+        _, _, tottime, cumtime, _ = stats.stats[func]
+        path = path + (_frame_name(func),)
+        if (own := int(tottime * scale * 1e6)) > 0:
+            stacks[";".join(path)] += own
+        if len(path) >= MAX_STACK_DEPTH:
+            return
+        for callee, edge_time in callees.get(func, ()):
+            callee_cumtime = stats.stats[callee][3]
+            if callee_cumtime <= 0 or _frame_name(callee) in path:
+                continue
+            child_scale = scale * edge_time / callee_cumtime
+            if edge_time * scale * 1e6 >= 1:
+                walk(callee, path, child_scale)
+
+    for root in roots:
+        walk(root, (), 1.0)
+    return stacks
+
+
+class Profiler:
+    """Samples one in N device polls with cProfile and tracemalloc.
+
+    Results are aggregated in memory and written to ``output_dir`` every
+    ``flush_every`` samples: ``api.pstats`` for pstats/snakeviz,
+    ``api.collapsed`` for flamegraph.pl/speedscope and ``allocations.txt``
+    with the lines that allocated the most memory. Under eventlet the profile
+    also covers greenlets that run while the sampled request waits.
+    """
+
+    def __init__(self):
+        self.sample_rate = 0
+        self.output_dir = "profiles"
+        self.flush_every = 10
+        self.samples = 0
+        self._stats = None
+        self._allocations = Counter()
+        self._counter = itertools.count()
+        self._active = False
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.configure(
+            sample_rate=app.config["PROFILE_SAMPLE_RATE"],
+            output_dir=app.config["PROFILE_DIR"],
+        )
+        self.flush_every = app.config["PROFILE_FLUSH_EVERY"]
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+        app.extensions["profiler"] = self
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0
+
+    def configure(self, sample_rate=None, output_dir=None):
+        if sample_rate is not None:
+            self.sample_rate = max(int(sample_rate), 0)
+        if output_dir is not None:
+            self.output_dir = output_dir
+
+    def status(self):
+        return {
+            "sample_rate": self.sample_rate,
+            "output_dir": self.output_dir,
+            "samples": self.samples,
+        }
+
+    def reset(self):
+        with self._lock:
+            self.samples = 0
+            self._stats = None
+            self._allocations.clear()
+
+    def _should_sample(self):
+        if not self.enabled or self._active:
+            return False
+        return next(self._counter) % self.sample_rate == 0
+
+    def _before_request(self):
+        rule = request.url_rule
+        if rule is None or rule.rule not in PROFILED_ROUTES:
+            return
+        if not self._should_sample():
+            return
+        self._active = True
+        g.profile_tracemalloc = not tracemalloc.is_tracing()
+        if g.profile_tracemalloc:
+            tracemalloc.start()
+        g.profile = cProfile.Profile()
+        g.profile.enable()
+
+    def _teardown_request(self, exc):
+        profile = g.pop("profile", None)
+        if profile is None:
+            return
+        profile.disable()
+        snapshot = tracemalloc.take_snapshot()
+        if g.pop("profile_tracemalloc"):
+            tracemalloc.stop()
+        self._active = False
+        self._collect(profile, snapshot)
+
+    def _collect(self, profile, snapshot):
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+            for stat in snapshot.statistics("lineno")[:50]:
+                frame = stat.traceback[0]
+                self._allocations[f"{frame.filename}:{frame.lineno}"] += stat.size
+            self.samples += 1
+            flush = self.samples % self.flush_every == 0
+        if flush:
+            self.dump()
+
+    def dump(self):
+        with self._lock:
+            if self._stats is None:
+                return None
+            os.makedirs(self.output_dir, exist_ok=True)
+            self._stats.dump_stats(os.path.join(self.output_dir, "api.pstats"))
+            with open(os.path.join(self.output_dir, "api.collapsed"), "w") as f:
+                for stack, value in collapsed_stacks(self._stats).items():
+                    f.write(f"{stack} {value}\n")
+            with open(os.path.join(self.output_dir, "allocations.txt"), "w") as f:
+                f.write(f"# {self.samples} sampled requests, bytes per line\n")
+                for line, size in self._allocations.most_common(100):
+                    f.write(f"{size} {line}\n")
+        _LOGGER.info("Wrote %d profile samples to %s", self.samples, self.output_dir)
+        return self.output_dir
+
+
+profiler = Profiler()
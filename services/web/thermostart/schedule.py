@@ -0,0 +1,208 @@
+import heapq
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from thermostart.ts.utils import Source
+
+WEEK = 7 * 24 * 3600
+# local seconds since the epoch of the first monday after it, 1970-01-05
+MONDAY = 4 * 24 * 3600
+EPOCH = datetime(1970, 1, 1)
+
+STD_WEEK = Source.STD_WEEK.value
+EXCEPTION = Source.EXCEPTION.value
+
+# an active program, between two unix times
+Block = namedtuple("Block", "source program setpoint start end")
+
+
+def exception_time(moment):
+    """Naive local datetime of the start or end of an exception.
+
+    Months count from 0 as in javascript, and an exception may end at 24:00.
+    """
+    year, month, day, hour, minute = moment
+    return datetime(year, month + 1, day) + timedelta(hours=hour, minutes=minute)
+
+
+def timezones(location_ids):
+    """pytz time zones by location id, locations without one are left out."""
+    import pytz
+
+    from thermostart import db
+    from thermostart.models import Location
+
+    location_ids = {i for i in location_ids if i is not None}
+    if not location_ids:
+        return {}
+    rows = db.session.query(Location.id, Location.timezone).filter(
+        Location.id.in_(location_ids)
+    )
+    return {id: pytz.timezone(name) for id, name in rows if name}
+
+
+def _local_seconds(moment):
+    return int((moment - EPOCH).total_seconds())
+
+
+class Schedule:
+    """The standard week and exceptions of a device, ready for lookups.
+
+    Standard week blocks are kept as sorted offsets into the week and
+    exceptions as sorted intervals that do not overlap (the last exception
+    of the list wins, as in the ui), both in local time of ``tz`` (a pytz
+    time zone, UTC when None). Finding the program at a time, or the next
+    time it changes, is a binary search in both.
+    """
+
+    def __init__(self, standard_week, exceptions, temperatures, tz=None):
+        self.temperatures = temperatures or {}
+        self.tz = tz
+        self._compile_week(standard_week or [])
+        self._compile_exceptions(exceptions or [])
+
+    @classmethod
+    def of(cls, device, tz=None):
+        return cls(
+            device.standard_week,
+            device.exceptions,
+            device.predefined_temperatures,
+            tz,
+        )
+
+    def _compile_week(self, standard_week):
+        blocks = sorted(
+            (day * 86400 + hour * 3600 + minute * 60, block["temperature"])
+            for block in standard_week
+            for day, hour, minute in [block["start"]]
+        )
+        # a block that continues the program before it is no switch
+        self._week_starts = []
+        self._week_programs = []
+        for start, program in blocks:
+            if not self._week_programs or self._week_programs[-1] != program:
+                self._week_starts.append(start)
+                self._week_programs.append(program)
+        if len(self._week_programs) > 1 and (
+            self._week_programs[0] == self._week_programs[-1]
+        ):
+            del self._week_starts[0], self._week_programs[0]
+
+    def _compile_exceptions(self, exceptions):
+        intervals = [
+            (
+                _local_seconds(exception_time(block["start"])),
+                _local_seconds(exception_time(block["end"])),
+                block["temperature"],
+            )
+            for block in exceptions
+        ]
+        # later exceptions win, the heap holds the active ones by position
+        order = sorted(
+            (start, -i, end, program)
+            for i, (start, end, program) in enumerate(intervals)
+            if start < end
+        )
+        bounds = sorted({t for start, end, _ in intervals for t in (start, end)})
+        active = []
+        self._starts = []
+        self._ends = []
+        self._programs = []
+        n = 0
+        for start, end in zip(bounds, bounds[1:]):
+            while n < len(order) and order[n][0] <= start:
+                heapq.heappush(active, order[n][1:])
+                n += 1
+            while active and active[0][1] <= start:
+                heapq.heappop(active)
+            if not active:
+                continue
+            program = active[0][2]
+            if self._ends and self._ends[-1] == start and self._programs[-1] == program:
+                self._ends[-1] = end
+            else:
+                self._starts.append(start)
+                self._ends.append(end)
+                self._programs.append(program)
+
+    def _to_local(self, t):
+        if self.tz is None:
+            return int(t)
+        moment = datetime.fromtimestamp(t, self.tz).replace(tzinfo=timezone.utc)
+        return int(moment.timestamp())
+
+    def _to_utc(self, local):
+        moment = EPOCH + timedelta(seconds=local)
+        if self.tz is None:
+            return local
+        return int(self.tz.localize(moment).timestamp())
+
+    def _state(self, local):
+        """(source, program, start, end) at local time ``local``."""
+        i = bisect_right(self._starts, local) - 1
+        if i >= 0 and local < self._ends[i]:
+            return EXCEPTION, self._programs[i], self._starts[i], self._ends[i]
+        # the standard week shows between the exceptions
+        after = self._starts[i + 1] if i + 1 < len(self._starts) else None
+        before = self._ends[i] if i >= 0 else None
+
+        if not self._week_programs:
+            return None, None, before, after
+        offset = (local - MONDAY) % WEEK
+        j = bisect_right(self._week_starts, offset) - 1
+        week = local - offset
+        start = week + self._week_starts[j] - (WEEK if j < 0 else 0)
+        if len(self._week_programs) == 1:
+            start, end = None, None
+        elif j + 1 < len(self._week_starts):
+            end = week + self._week_starts[j + 1]
+        else:
+            end = week + WEEK + self._week_starts[0]
+        if before is not None and (start is None or start < before):
+            start = before
+        if after is not None and (end is None or end > after):
+            end = after
+        return STD_WEEK, self._week_programs[j], start, end
+
+    def _block(self, source, program, start, end):
+        return Block(
+            source,
+            program,
+            self.temperatures.get(program),
+            None if start is None else self._to_utc(start),
+            None if end is None else self._to_utc(end),
+        )
+
+    def block_at(self, t):
+        """The Block active at unix time ``t``, None when nothing is programmed.
+
+        ``start`` and ``end`` are None for a program that never changes.
+        """
+        state = self._state(self._to_local(t))
+        return None if state[1] is None else self._block(*state)
+
+    def setpoint_at(self, t):
+        block = self.block_at(t)
+        return block and block.setpoint
+
+    def next_block(self, t):
+        """The Block that follows the one at ``t``, None when nothing changes."""
+        end = self._state(self._to_local(t))[3]
+        while end is not None:
+            state = self._state(end)
+            if state[1] is not None:
+                return self._block(*state)
+            # between two exceptions without a standard week
+            end = state[3]
+        return None
+
+    def program(self, t):
+        """The blocks at and after unix time ``t``, as JSON."""
+        current = self.block_at(t)
+        following = self.next_block(t)
+        return {
+            "at": t,
+            "current": current and current._asdict(),
+            "next": following and following._asdict(),
+        }
@@ -0,0 +1,119 @@
+import json
+import threading
+from collections import OrderedDict
+from operator import attrgetter
+
+from flask import current_app
+
+from thermostart.metrics import JSON_FRAGMENTS
+from thermostart.offload import offload
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# devices whose encoded fields are kept per view, least recently used go first
+MAX_DEVICES = 1024
+
+_MISSING = object()
+
+
+def dumps(value):
+    """Compact JSON with sorted keys, as bytes.
+
+    Without orjson this is the body jsonify gives. orjson writes non-ASCII
+    characters as UTF-8 instead of escaping them and may format floats
+    differently, which decodes to the same values.
+    """
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(value, sort_keys=True, separators=(",", ":")).encode()
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _encode(values):
+    return {name: dumps(value) for name, value in values.items()}
+
+
+class View:
+    """A JSON object describing a device, encoded one field at a time.
+
+    ``fields`` maps each key to a device attribute name or a function of the
+    device. The encoded fields of a device are kept with a copy of their
+    value, so only the fields whose columns changed since the last request
+    are encoded again and a model with long exception lists is mostly joined
+    from bytes. ``volatile`` fields depend on more than the device row, like
+    the clock, and are encoded every time.
+    """
+
+    def __init__(self, name, fields, volatile=(), max_devices=MAX_DEVICES):
+        self.name = name
+        self.fields = {
+            key: attrgetter(field) if isinstance(field, str) else field
+            for key, field in sorted(fields.items())
+        }
+        self.volatile = set(volatile)
+        self.max_devices = max_devices
+        self._keys = {key: dumps(key) + b":" for key in self.fields}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def values(self, device):
+        return {key: field(device) for key, field in self.fields.items()}
+
+    def encode(self, device, offload_encoding=False):
+        """The JSON document of ``device`` as bytes.
+
+        With ``offload_encoding`` the changed fields are encoded off the
+        eventlet hub, see thermostart/offload.py.
+        """
+        values = self.values(device)
+        with self._lock:
+            cached = self._cache.get(device.hardware_id, {})
+
+        stale = {
+            key: value
+            for key, value in values.items()
+            if key in self.volatile or cached.get(key, (_MISSING,))[0] != value
+        }
+        if offload_encoding and stale:
+            encoded = offload.run(_encode, stale)
+        else:
+            encoded = _encode(stale)
+        JSON_FRAGMENTS.inc(len(encoded), view=self.name)
+
+        fragments = dict(cached)
+        for key, data in encoded.items():
+            if key not in self.volatile:
+                # a decoded copy, the device may change its lists in place
+                fragments[key] = (loads(data), data)
+        with self._lock:
+            self._cache[device.hardware_id] = fragments
+            self._cache.move_to_end(device.hardware_id)
+            while len(self._cache) > self.max_devices:
+                self._cache.popitem(last=False)
+
+        return (
+            b"{"
+            + b",".join(
+                self._keys[key] + (encoded[key] if key in encoded else cached[key][1])
+                for key in self.fields
+            )
+            + b"}"
+        )
+
+    def response(self, device, offload_encoding=False):
+        # ends with a newline, like jsonify
+        return current_app.response_class(
+            self.encode(device, offload_encoding) + b"\n", mimetype="application/json"
+        )
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
@@ -0,0 +1,96 @@
+import gzip
+import re
+from pathlib import Path
+from urllib.parse import urljoin
+
+import brotli
+import pytest
+
+from thermostart.assets import BUNDLES, CSS_URL, STATIC_FOLDER, assets, build
+
+STATIC = Path(STATIC_FOLDER)
+
+
+@pytest.fixture(scope="module")
+def dist(tmp_path_factory):
+    output = tmp_path_factory.mktemp("dist")
+    return output, build(output=str(output))
+
+
+@pytest.fixture()
+def bundled(db_app, dist):
+    output, manifest = dist
+    assets.load(str(output))
+    yield manifest
+    assets.manifest = {}
+
+
+def test_build_is_content_hashed(dist, tmp_path):
+    output, manifest = dist
+    assert set(manifest) == set(BUNDLES)
+    assert build(output=str(tmp_path)) == manifest
+    for filename in manifest.values():
+        data = (output / filename).read_bytes()
+        assert gzip.decompress((output / (filename + ".gz")).read_bytes()) == data
+        assert brotli.decompress((output / (filename + ".br")).read_bytes()) == data
+
+
+def test_css_is_rebased(bundled, db_client):
+    css = db_client.get(f"/assets/{bundled['home.css']}").get_data(as_text=True)
+    assert css.startswith("@import url(https://fonts.googleapis.com")
+    assert 'url("../static/images/icon_Facebook.png")' in css
+    # urls resolve from where the bundle is served as from the sources
+    bundle = {
+        urljoin(f"/assets/{bundled['home.css']}", url)
+        for url in re.findall(r'url\("(\.\./[^"]+)"\)', css)
+    }
+    sources = {
+        urljoin(f"/static/{source}", url)
+        for source in BUNDLES["home.css"]
+        for _, url in CSS_URL.findall((STATIC / source).read_text())
+        if not re.match(r"^([a-z]+:|/|#)", url)
+    }
+    assert bundle == sources
+    assert db_client.get("/static/images/icon_Facebook.png").status_code == 200
+
+
+def test_templates_use_source_files_without_build(db_client):
+    html = db_client.get("/login").text
+    assert '<link rel="stylesheet" href="static/css/general.css">' in html
+    assert "assets/" not in html
+
+
+def test_templates_use_bundles(bundled, db_client):
+    html = db_client.get("/login").text
+    assert f'<link rel="stylesheet" href="assets/{bundled["base.css"]}">' in html
+    assert f'<script src="assets/{bundled["base.js"]}"></script>' in html
+    assert "static/css/" not in html
+    assert "static/js/" not in html
+
+
+@pytest.mark.parametrize(
+    "accept, encoding",
+    [("gzip, deflate, br", "br"), ("gzip", "gzip"), ("", None)],
+)
+def test_encoding_is_negotiated(bundled, db_client, dist, accept, encoding):
+    output, manifest = dist
+    filename = manifest["home.js"]
+    response = db_client.get(f"/assets/{filename}", headers={"Accept-Encoding": accept})
+    assert response.status_code == 200
+    assert response.mimetype == "text/javascript"
+    assert response.headers.get("Content-Encoding") == encoding
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert response.cache_control.immutable
+    assert response.cache_control.max_age == 365 * 24 * 3600
+
+    data = response.get_data()
+    if encoding == "br":
+        data = brotli.decompress(data)
+    elif encoding == "gzip":
+        data = gzip.decompress(data)
+    assert data == (output / filename).read_bytes()
+
+
+def test_unknown_asset(bundled, db_client):
+    assert db_client.get("/assets/../manifest.json").status_code == 404
+    assert db_client.get("/assets/home.0.js").status_code == 404
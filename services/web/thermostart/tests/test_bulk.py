@@ -0,0 +1,130 @@
+import json
+
+import pytest
+
+from thermostart import db
+from thermostart.conftest import HARDWARE_ID
+from thermostart.models import Device
+from thermostart.ts.utils import Source
+
+ADMIN = {"Authorization": "Bearer admin-secret"}
+
+
+@pytest.fixture()
+def fleet(db_app):
+    with db_app.app_context():
+        for i in range(3):
+            device = Device(hardware_id=f"fleet-{i}", password="pw")
+            device.location_id = 1
+            db.session.add(device)
+        db.session.commit()
+    return [HARDWARE_ID] + [f"fleet-{i}" for i in range(3)]
+
+
+def ndjson(response):
+    return [json.loads(line) for line in response.data.splitlines()]
+
+
+class TestBulkRead:
+    def test_reads_all_requested_devices(self, db_client, fleet):
+        response = db_client.get(f"/thermostats?id={','.join(fleet[:2])}&id={fleet[3]}")
+        assert response.mimetype == "application/x-ndjson"
+        lines = ndjson(response)
+        assert sorted(line["name"] for line in lines) == sorted(fleet[:2] + fleet[3:])
+        assert set(lines[0]["ot"]["raw"]) >= {"ot0", "ot125"}
+
+    def test_matches_single_device_endpoint(self, db_client, fleet):
+        single = db_client.get(f"/thermostat/{HARDWARE_ID}").json
+        assert ndjson(db_client.get(f"/thermostats?id={HARDWARE_ID}")) == [single]
+
+    def test_reports_unknown_devices(self, db_client, fleet):
+        lines = ndjson(db_client.get("/thermostats?id=fleet-0,unknown"))
+        assert lines[-1] == {"name": "unknown", "error": "no activated device"}
+
+
+@pytest.fixture()
+def admin_token(db_app, monkeypatch):
+    monkeypatch.setitem(db_app.config, "ADMIN_TOKEN", "admin-secret")
+
+
+class TestBulkWrite:
+    def test_updates_all_devices(self, db_app, db_client, fleet, admin_token):
+        response = db_client.post(
+            "/thermostats",
+            headers=ADMIN,
+            json=[
+                {"name": "fleet-0", "target_temperature": 200},
+                {"name": "fleet-1", "pause": 1},
+            ],
+        )
+        assert response.status_code == 200
+        assert ndjson(response) == [
+            {"name": "fleet-0", "status": "ok"},
+            {"name": "fleet-1", "status": "ok"},
+        ]
+        with db_app.app_context():
+            assert db.session.get(Device, "fleet-0").target_temperature == 200
+            paused = db.session.get(Device, "fleet-1")
+            assert [command.kind for command in paused.commands] == ["source"]
+            assert paused.source == Source.PAUSE.value
+            assert paused.target_temperature == paused.predefined_temperatures["pause"]
+            assert paused.room_temperature == 0
+
+    def test_unknown_device_rolls_back_everything(
+        self, db_app, db_client, fleet, admin_token
+    ):
+        response = db_client.post(
+            "/thermostats",
+            headers=ADMIN,
+            json=[
+                {"name": "fleet-0", "target_temperature": 200},
+                {"name": "unknown", "target_temperature": 200},
+            ],
+        )
+        assert response.status_code == 400
+        with db_app.app_context():
+            assert db.session.get(Device, "fleet-0").target_temperature == 0
+
+    @pytest.mark.parametrize(
+        "headers",
+        [{}, {"Authorization": "Bearer wrong"}],
+        ids=["anonymous", "wrong-token"],
+    )
+    def test_needs_authorization(self, db_app, db_client, fleet, admin_token, headers):
+        response = db_client.post(
+            "/thermostats",
+            headers=headers,
+            json=[{"name": "fleet-0", "target_temperature": 200}],
+        )
+        assert response.status_code == 401
+        assert ndjson(response) == [{"name": "fleet-0", "error": "unauthorized"}]
+        with db_app.app_context():
+            assert db.session.get(Device, "fleet-0").target_temperature == 0
+
+    def test_device_credentials_only_cover_that_device(self, db_app, db_client, fleet):
+        auth = ("fleet-0", "pw")
+        response = db_client.post(
+            "/thermostats",
+            auth=auth,
+            json=[{"name": "fleet-0", "target_temperature": 200}],
+        )
+        assert response.status_code == 200
+        response = db_client.post(
+            "/thermostats",
+            auth=auth,
+            json=[
+                {"name": "fleet-0", "target_temperature": 210},
+                {"name": "fleet-1", "target_temperature": 210},
+            ],
+        )
+        assert ndjson(response) == [{"name": "fleet-1", "error": "unauthorized"}]
+        with db_app.app_context():
+            assert db.session.get(Device, "fleet-0").target_temperature == 200
+
+    def test_single_device_update(self, db_app, db_client):
+        response = db_client.post(
+            f"/thermostat/{HARDWARE_ID}", json={"target_temperature": 195}
+        )
+        assert response.status_code == 200
+        with db_app.app_context():
+            assert db.session.get(Device, HARDWARE_ID).target_temperature == 195
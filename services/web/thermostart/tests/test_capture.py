@@ -0,0 +1,51 @@
+import pytest
+
+from thermostart.conftest import PASSWORD
+from thermostart.ts.capture import capture, load, redact
+from thermostart.ts.replay import replay
+
+
+@pytest.fixture()
+def capture_file(db_app, tmp_path):
+    path = tmp_path / "capture.jsonl"
+    capture.configure(str(path))
+    yield path
+    capture.configure(None)
+
+
+def test_redact_drops_password():
+    assert redact("u=ts-1234&p=secret&fw=30") == "u=ts-1234&fw=30"
+
+
+def test_capture_records_polls(capture_file, poll):
+    assert poll(pv="205", hw="4", fw="30040043").status_code == 200
+    assert poll(pv="205", hw="4", fw="30040043").status_code == 200
+
+    entries = load(capture_file)
+    assert len(entries) == 2
+    assert entries[0]["path"] == "/api"
+    assert "p=" not in entries[0]["q"]
+    assert entries[0]["r"].startswith("<ITHERMOSTAT>")
+
+
+def test_replay_is_byte_identical(capture_file, poll):
+    for _ in range(3):
+        assert poll(pv="205", hw="4", fw="30040043").status_code == 200
+    capture.configure(None)
+
+    result = replay(load(capture_file), PASSWORD)
+
+    assert result["requests"] == 3
+    assert result["matched"] == 3, result["diffs"]
+
+
+def test_replay_is_not_rate_limited(capture_file, poll):
+    # more polls of one device than the burst of the rate limiter
+    for _ in range(30):
+        assert poll(pv="205", hw="4", fw="30040043").status_code == 200
+    capture.configure(None)
+
+    result = replay(load(capture_file), PASSWORD)
+
+    assert result["requests"] == 30
+    assert result["matched"] == 30, result["diffs"]
@@ -0,0 +1,42 @@
+from sqlalchemy import text
+
+from thermostart import create_app, db
+from thermostart.conftest import TestConfig
+from thermostart.database import engine_options
+
+
+def config_for(uri, **overrides):
+    config = {
+        name: getattr(TestConfig, name) for name in dir(TestConfig) if name.isupper()
+    }
+    return config | {"SQLALCHEMY_DATABASE_URI": uri} | overrides
+
+
+def test_postgresql_gets_pool_settings():
+    options = engine_options(
+        config_for("postgresql://ts@db/ts", DB_POOL_SIZE=20, DB_STATEMENT_TIMEOUT_MS=5)
+    )
+    assert options["pool_size"] == 20
+    assert options["pool_pre_ping"] is True
+    assert options["connect_args"]["options"] == "-c statement_timeout=5"
+
+
+def test_memory_sqlite_is_left_alone():
+    assert engine_options(config_for("sqlite://")) == {}
+    assert engine_options(config_for("sqlite:///:memory:")) == {}
+
+
+def test_file_sqlite_gets_pragmas(tmp_path):
+    class FileConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'ts.db'}"
+        SQLITE_SYNCHRONOUS = "OFF"
+
+    def pragma(name):
+        return db.session.execute(text(f"PRAGMA {name}")).scalar()
+
+    app = create_app(FileConfig)
+    with app.app_context():
+        assert pragma("journal_mode") == "wal"
+        assert pragma("synchronous") == 0
+        assert pragma("busy_timeout") == FileConfig.SQLITE_BUSY_TIMEOUT_MS
+        assert pragma("cache_size") == -FileConfig.SQLITE_CACHE_SIZE_KB
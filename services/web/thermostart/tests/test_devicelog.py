@@ -0,0 +1,57 @@
+import json
+import logging
+
+from thermostart.devicelog import DeviceLogFilter, JsonFormatter, Payload
+
+
+def record(hardware_id="ts-1", msg="Got api request", level=logging.INFO, **extra):
+    record = logging.LogRecord("ts", level, __file__, 1, msg, None, None)
+    record.hardware_id = hardware_id
+    record.__dict__.update(extra)
+    return record
+
+
+class TestDeviceLogFilter:
+    def test_samples_each_message_per_device(self):
+        log_filter = DeviceLogFilter(sample_rate=3, full_payload_ids=[])
+        kept = [log_filter.filter(record()) for _ in range(6)]
+        assert kept == [True, False, False, True, False, False]
+        assert log_filter.filter(record(hardware_id="ts-2"))
+
+    def test_rate_limit_reports_suppressed_lines(self):
+        now = [0.0]
+        log_filter = DeviceLogFilter(rate_limit=2, clock=lambda: now[0])
+        assert [log_filter.filter(record()) for _ in range(4)] == [
+            True,
+            True,
+            False,
+            False,
+        ]
+        now[0] += 30
+        passed = record()
+        assert log_filter.filter(passed)
+        assert passed.suppressed == 2
+
+    def test_payloads_only_for_selected_devices(self):
+        log_filter = DeviceLogFilter(sample_rate=10, full_payload_ids=["ts-1"])
+        assert not log_filter.filter(record(hardware_id="ts-2", payload=True))
+        # selected devices are not sampled either
+        assert all(log_filter.filter(record(payload=True)) for _ in range(3))
+
+    def test_warnings_always_pass(self):
+        log_filter = DeviceLogFilter(sample_rate=100, full_payload_ids=[])
+        log_filter.filter(record())
+        assert log_filter.filter(record(level=logging.WARNING))
+
+
+def test_payload_is_rendered_lazily_without_password():
+    payload = Payload({"p": ["secret"], "pv": ["205"]})
+    assert "secret" not in str(payload)
+    assert "205" in str(payload)
+
+
+def test_json_formatter_includes_device_fields():
+    entry = json.loads(JsonFormatter().format(record(remote_addr="10.0.0.2")))
+    assert entry["hardware_id"] == "ts-1"
+    assert entry["remote_addr"] == "10.0.0.2"
+    assert entry["message"] == "Got api request"
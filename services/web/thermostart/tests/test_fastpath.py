@@ -0,0 +1,82 @@
+import pytest
+
+from thermostart import db
+from thermostart.clock import clock
+from thermostart.conftest import HARDWARE_ID, PASSWORD
+from thermostart.metrics import REPLY_CACHE_HITS
+from thermostart.ts import outbox
+from thermostart.ts.fastpath import TZ_PERIOD, reply_cache
+from thermostart.ts.utils import decrypt_response
+
+NOW = 1_700_000_000 - 1_700_000_000 % TZ_PERIOD + 60
+
+
+@pytest.fixture()
+def idle_poll(db_app, poll):
+    """Poll with an unchanged request and the thermostat clock in sync."""
+    clock.freeze(NOW)
+
+    def idle_poll(**params):
+        defaults = {"pv": "205", "hw": "4", "fw": "30040043", "ts": str(clock.time())}
+        response = poll(**defaults | params)
+        assert response.status_code == 200
+        return response.data
+
+    # the first polls sync the calendar, ui settings and throttle factor
+    idle_poll()
+    idle_poll()
+    yield idle_poll
+    clock.unfreeze()
+
+
+def hit(idle_poll, **params):
+    hits = REPLY_CACHE_HITS.value()
+    data = idle_poll(**params)
+    return data, REPLY_CACHE_HITS.value() > hits
+
+
+def test_idle_poll_is_byte_identical(idle_poll, monkeypatch):
+    cached, was_hit = hit(idle_poll)
+    assert was_hit
+    assert decrypt_response(cached, PASSWORD).startswith("<ITHERMOSTAT><TZ>")
+
+    monkeypatch.setattr(reply_cache, "enabled", False)
+    assert idle_poll() == cached
+
+
+def test_thermostat_clock_is_ignored_within_a_minute(idle_poll):
+    clock.freeze(NOW + 30)
+    assert hit(idle_poll)[1]
+
+
+def test_changed_request_misses(idle_poll):
+    assert not hit(idle_poll, pv="210")[1]
+    # the changed temperature was written, the next poll changes nothing
+    assert not hit(idle_poll, pv="210")[1]
+    assert hit(idle_poll, pv="210")[1]
+
+
+def test_clock_drift_misses(idle_poll):
+    data, was_hit = hit(idle_poll, ts=str(NOW - 120))
+    assert not was_hit
+    assert f"<TS>{NOW}</TS>" in decrypt_response(data, PASSWORD)
+
+
+def test_device_write_invalidates(idle_poll, db_app):
+    from thermostart.models import Device
+
+    with db_app.app_context():
+        device = db.session.get(Device, HARDWARE_ID)
+        device.dim = 50
+        outbox.queue(device, "dim")
+        db.session.commit()
+
+    data, was_hit = hit(idle_poll)
+    assert not was_hit
+    assert "<DIM>50</DIM>" in decrypt_response(data, PASSWORD)
+
+
+def test_expires_on_quarter_hour(idle_poll):
+    clock.freeze(NOW - NOW % TZ_PERIOD + TZ_PERIOD)
+    assert not hit(idle_poll)[1]
+    assert hit(idle_poll)[1]
@@ -0,0 +1,121 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+from intelhex import IntelHex
+
+from thermostart.ts import utils
+from thermostart.ts.utils import (
+    FIRMWARE_VERSIONS,
+    UPGRADED_VERSION_MINOR,
+    BinaryImage,
+    firmware_image,
+    firmware_path,
+    get_blocks,
+    get_firmware,
+    image_path,
+    map_image,
+    patchfirmware,
+)
+
+PATCH = {"hostname": "thermostart", "port": 3888, "replace_yourowl.com": True}
+
+
+@pytest.fixture()
+def folder(tmp_path, monkeypatch):
+    """An app folder with a copy of the hw 5 firmware, not converted yet."""
+    (tmp_path / "firmware").mkdir()
+    shutil.copy(firmware_path(5), tmp_path / "firmware")
+    monkeypatch.setenv("APP_FOLDER", str(tmp_path))
+    monkeypatch.setattr(utils, "_images", {})
+    return tmp_path
+
+
+@pytest.mark.parametrize("hw", [1, 2, 3, 4, 5])
+def test_image_is_patched_like_intelhex(hw):
+    patch = PATCH | {"version": FIRMWARE_VERSIONS[hw]["sw"] + UPGRADED_VERSION_MINOR}
+    reference = IntelHex(firmware_path(hw))
+    patchfirmware(reference, hw, dict(patch))
+    image = firmware_image(firmware_path(hw))
+    patchfirmware(image, hw, dict(patch))
+
+    assert image.maxaddr() == reference.maxaddr()
+    assert get_blocks(image, 0, image.maxaddr()) == get_blocks(
+        reference, 0, reference.maxaddr()
+    )
+
+
+def test_images_are_converted_once(folder):
+    filename = firmware_path(5)
+    assert get_firmware(5, dict(PATCH))
+    assert os.path.exists(image_path(filename))
+    assert map_image(filename) is map_image(filename)
+
+    # patching works on a copy of the mapping
+    assert firmware_image(filename).gets(0, 4) == bytes(map_image(filename)[:4])
+    first = get_firmware(5, dict(PATCH))
+    assert get_firmware(5, {}) != first
+    assert get_firmware(5, dict(PATCH)) == first
+
+
+def test_stale_images_are_converted_again(folder):
+    filename = firmware_path(5)
+    with open(image_path(filename), "wb") as f:
+        f.write(b"stale")
+    os.utime(image_path(filename), (0, 0))
+    assert len(map_image(filename)) == IntelHex(filename).maxaddr() + 1
+
+
+def test_corrupt_image_is_converted_again(folder):
+    filename = firmware_path(5)
+    map_image(filename)
+    with open(image_path(filename), "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)[0]
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last ^ 0xFF]))
+    utils._images.clear()
+    # converted again from the .hex file
+    assert bytes(map_image(filename)[-1:]) == bytes([last])
+
+    with open(image_path(filename), "wb"):
+        pass
+    utils._images.clear()
+    assert len(map_image(filename)) == IntelHex(filename).maxaddr() + 1
+
+
+def test_convert_names_unreadable_firmware(folder):
+    with open(firmware_path(1), "w") as f:
+        f.write("not intel hex\n")
+    result = subprocess.run(
+        [sys.executable, utils.__file__, "convert"],
+        env=os.environ | {"APP_FOLDER": str(folder)},
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 1
+    assert firmware_path(1) in result.stderr
+
+
+def test_image_is_kept_in_memory_without_a_writable_folder(folder, monkeypatch):
+    def save_image(path, image):
+        raise PermissionError(path)
+
+    monkeypatch.setattr(utils, "save_image", save_image)
+    assert len(map_image(firmware_path(5))) == IntelHex(firmware_path(5)).maxaddr() + 1
+    assert not os.path.exists(image_path(firmware_path(5)))
+
+
+def test_binary_image():
+    image = BinaryImage(b"\x01\x02\x03")
+    assert image.find(b"\x02\x03") == 1
+    assert image.find(b"\x04") == -1
+    assert bytes(image.tobinarray(2, size=3)) == b"\x03\xff\xff"
+    with pytest.raises(IndexError):
+        image.gets(2, 2)
+
+    image.puts(5, b"\x06")
+    assert image.maxaddr() == 5
+    assert image.gets(0, 6) == b"\x01\x02\x03\xff\xff\x06"
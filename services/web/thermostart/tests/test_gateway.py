@@ -0,0 +1,79 @@
+import os
+import subprocess
+import sys
+import time
+from urllib.parse import urlencode
+
+import pytest
+
+from thermostart import create_gateway_app, db
+from thermostart.conftest import HARDWARE_ID, PASSWORD, TestConfig
+from thermostart.ts.fastpath import reply_cache
+from thermostart.ts.negcache import negative_cache
+from thermostart.ts.utils import encrypt_request
+
+
+@pytest.fixture()
+def gateway():
+    from thermostart.models import Device
+
+    app = create_gateway_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+        device = Device(hardware_id=HARDWARE_ID, password=PASSWORD)
+        device.location_id = 1
+        device.outside_temperature_timestamp = int(time.time())
+        db.session.add(device)
+        db.session.commit()
+
+    yield app
+
+    with app.app_context():
+        db.drop_all()
+
+
+def test_gateway_answers_polls(gateway):
+    params = {"u": HARDWARE_ID, "p": PASSWORD, "pv": "205", "hw": "4", "fw": "30040043"}
+    payload = encrypt_request(urlencode(params), PASSWORD)
+    response = gateway.test_client().get(f"/api?_{HARDWARE_ID}_{payload}")
+    assert response.status_code == 200
+    assert not reply_cache.enabled
+
+
+def test_gateway_does_not_remember_unknown_devices(gateway):
+    # it would not see them being registered through the full app
+    params = {"u": "ts-new", "p": PASSWORD, "pv": "205", "hw": "4", "fw": "30040043"}
+    payload = encrypt_request(urlencode(params), PASSWORD)
+    response = gateway.test_client().get(f"/api?_ts-new_{payload}")
+    assert response.text == "no activated device"
+    assert negative_cache.reject("ts-new", payload) is None
+
+
+@pytest.mark.parametrize("path", ["/", "/login", "/thermostats", "/thermostatmodel"])
+def test_gateway_serves_no_ui_or_integrations(gateway, path):
+    assert gateway.test_client().get(path).status_code == 404
+
+
+def test_full_app_serves_integrations(db_client):
+    assert db_client.get(f"/thermostat/{HARDWARE_ID}").status_code == 200
+
+
+def test_gateway_skips_heavy_imports():
+    code = (
+        "import sys\n"
+        "from thermostart import create_gateway_app\n"
+        "create_gateway_app()\n"
+        "print(' '.join(sorted(sys.modules)))\n"
+    )
+    env = os.environ | {"DATABASE_URL": "sqlite://", "WRITE_BEHIND_JOURNAL": ""}
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        env=env,
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    modules = set(output.split())
+    assert "thermostart.ts.routes" in modules
+    for name in ["wtforms", "intelhex", "flask_migrate", "thermostart.ui.routes"]:
+        assert name not in modules
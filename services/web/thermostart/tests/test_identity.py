@@ -0,0 +1,98 @@
+import pytest
+from sqlalchemy import event
+
+from thermostart import db
+from thermostart.conftest import HARDWARE_ID
+from thermostart.events import rooms, socketio
+from thermostart.identity import Principal, identity_cache
+from thermostart.models import load_user
+
+
+@pytest.fixture()
+def device_reads(db_app):
+    """Statements reading whole device rows, by the password column."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        if statement.startswith("SELECT") and "device.password" in statement:
+            statements.append(statement)
+
+    with db_app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield statements
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture()
+def logged_in(db_client):
+    with db_client.session_transaction() as session:
+        session["_user_id"] = HARDWARE_ID
+    return db_client
+
+
+def test_requests_do_not_read_the_device(logged_in, device_reads):
+    assert logged_in.get("/ui").status_code == 200
+    assert logged_in.get("/ui").status_code == 200
+    assert device_reads == []
+
+
+def test_socket_events_do_not_read_the_device(db_app, logged_in, device_reads):
+    socket = socketio.test_client(db_app, flask_test_client=logged_in)
+    assert socket.is_connected()
+    assert rooms[HARDWARE_ID] == 1
+    socket.disconnect()
+    assert device_reads == []
+
+
+def test_device_is_loaded_on_use(db_app, device_reads):
+    with db_app.app_context():
+        user = load_user(HARDWARE_ID)
+        assert isinstance(user, Principal)
+        assert user.get_id() == HARDWARE_ID
+        assert device_reads == []
+        assert user.password == "secret"
+        assert user.device is user.device
+        assert len(device_reads) == 1
+
+
+def test_unknown_device(db_app):
+    with db_app.app_context():
+        assert load_user("unknown") is None
+
+
+@pytest.mark.parametrize("change", ["password", "location", "delete"])
+def test_account_changes_invalidate(db_app, change):
+    from thermostart.models import Device
+
+    with db_app.app_context():
+        assert load_user(HARDWARE_ID) is not None
+        assert HARDWARE_ID in identity_cache._entries
+
+        # telemetry leaves the identity alone
+        device = db.session.get(Device, HARDWARE_ID)
+        device.room_temperature = 215
+        db.session.commit()
+        assert HARDWARE_ID in identity_cache._entries
+
+        if change == "password":
+            device.password = "changed"
+        elif change == "location":
+            device.location_id = 2
+        else:
+            db.session.delete(device)
+        db.session.commit()
+        assert HARDWARE_ID not in identity_cache._entries
+        if change == "delete":
+            assert load_user(HARDWARE_ID) is None
+
+
+def test_expired_entries_are_checked(db_app, device_reads, monkeypatch):
+    from thermostart.models import Device
+
+    monkeypatch.setattr(identity_cache, "seconds", 0)
+    with db_app.app_context():
+        assert load_user(HARDWARE_ID) is not None
+        db.session.execute(db.delete(Device))
+        db.session.commit()
+        assert load_user(HARDWARE_ID) is None
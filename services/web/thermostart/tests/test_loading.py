@@ -0,0 +1,90 @@
+import re
+
+import pytest
+from sqlalchemy import event
+
+from thermostart import db
+from thermostart.conftest import HARDWARE_ID, PASSWORD
+from thermostart.models import Device
+
+POLL = {"pv": "205", "hw": "4", "fw": "30040043"}
+DEVICE_SELECT = re.compile(r"SELECT (.*?)\s+FROM device\b", re.DOTALL)
+
+
+@pytest.fixture()
+def device_selects(db_app):
+    """The columns of the device rows read, one set per statement."""
+    selects = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        match = DEVICE_SELECT.match(statement)
+        if match:
+            selects.append(
+                {
+                    column.split(" AS ")[0].strip().split(".")[-1]
+                    for column in match[1].split(",")
+                }
+            )
+
+    with db_app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield selects
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def set_calendar_synced(db_app, synced):
+    with db_app.app_context():
+        db.session.get(Device, HARDWARE_ID).cal_synced = synced
+        db.session.commit()
+
+
+def test_poll(db_app, poll, device_selects):
+    set_calendar_synced(db_app, True)
+    device_selects.clear()
+    assert poll(**POLL).status_code == 200
+    assert device_selects[0] == set(Device.PROFILES["poll"])
+    # commits expire the device, reading it again stays within the profile
+    assert set().union(*device_selects) == set(Device.PROFILES["poll"])
+
+
+def test_poll_with_calendar(db_app, poll, device_selects):
+    set_calendar_synced(db_app, False)
+    device_selects.clear()
+    assert poll(**POLL).status_code == 200
+    assert device_selects[:2] == [
+        set(Device.PROFILES["poll"]),
+        # the deferred group, the device is already known
+        set(Device.PROFILES["calendar"]) - {"hardware_id"},
+    ]
+    assert set().union(*device_selects) == set(
+        Device.PROFILES["poll"] + Device.PROFILES["calendar"]
+    )
+
+
+def test_login(db_client, device_selects):
+    response = db_client.post(
+        "/login", data={"hardware_id": HARDWARE_ID, "password": PASSWORD}
+    )
+    assert response.status_code == 302
+    assert device_selects == [set(Device.PROFILES["login"])]
+
+
+def test_ui_model(db_client, device_selects):
+    with db_client.session_transaction() as session:
+        session["_user_id"] = HARDWARE_ID
+    assert db_client.get("/thermostatmodel").status_code == 200
+    # the identity cache only checks the location
+    assert device_selects == [{"location_id"}, set(Device.PROFILES["ui"])]
+
+
+def test_plain_query_loads_the_poll_profile(db_app, device_selects):
+    with db_app.app_context():
+        db.session.get(Device, HARDWARE_ID)
+    assert device_selects == [set(Device.PROFILES["poll"])]
+
+
+def test_profiles_name_columns():
+    columns = set(Device.__table__.columns.keys())
+    for profile in Device.PROFILES.values():
+        assert set(profile) <= columns
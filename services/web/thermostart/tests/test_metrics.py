@@ -0,0 +1,54 @@
+from thermostart.metrics import CALENDAR_SYNCS, DB_COMMITS, REQUEST_LATENCY, Registry
+
+
+class TestRegistry:
+    def test_counter_and_gauge_exposition(self):
+        registry = Registry()
+        counter = registry.counter("emits_total", "Emits.", ["event"])
+        gauge = registry.gauge("rooms", "Rooms.")
+        counter.inc(event="source")
+        counter.inc(2, event="source")
+        gauge.set(4)
+        assert registry.render() == (
+            "# HELP emits_total Emits.\n"
+            "# TYPE emits_total counter\n"
+            'emits_total{event="source"} 3\n'
+            "# HELP rooms Rooms.\n"
+            "# TYPE rooms gauge\n"
+            "rooms 4\n"
+        )
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = Registry()
+        histogram = registry.histogram("latency", "Latency.", buckets=(0.1, 1))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(3)
+        text = registry.render()
+        assert 'latency_bucket{le="0.1"} 1\n' in text
+        assert 'latency_bucket{le="1"} 2\n' in text
+        assert 'latency_bucket{le="+Inf"} 3\n' in text
+        assert "latency_sum 3.55\n" in text
+        assert "latency_count 3\n" in text
+
+
+class TestMetricsEndpoint:
+    def test_poll_is_measured(self, db_client, poll):
+        polls = REQUEST_LATENCY.count(route="/api")
+        syncs = CALENDAR_SYNCS.value()
+
+        poll(pv="205", hw="4", fw="30040043")
+
+        assert REQUEST_LATENCY.count(route="/api") == polls + 1
+        assert DB_COMMITS.count(route="/api") > 0
+        # a fresh device has not received its calendar yet
+        assert CALENDAR_SYNCS.value() == syncs + 1
+
+        response = db_client.get("/metrics")
+        assert response.mimetype == "text/plain"
+        assert b'thermostart_request_duration_seconds_count{route="/api"}' in (
+            response.data
+        )
+        assert b"# TYPE thermostart_db_statements_per_request histogram" in (
+            response.data
+        )
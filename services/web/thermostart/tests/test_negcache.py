@@ -0,0 +1,129 @@
+import logging
+import time
+from types import SimpleNamespace
+from urllib.parse import urlencode
+
+import pytest
+from sqlalchemy import event
+
+from thermostart import db
+from thermostart.conftest import HARDWARE_ID, PASSWORD
+from thermostart.models import Device
+from thermostart.ts import negcache
+from thermostart.ts.negcache import UNDECODABLE, UNKNOWN, negative_cache
+from thermostart.ts.utils import encrypt_request
+
+POLL = {"pv": "205", "hw": "4", "fw": "30040043"}
+
+
+@pytest.fixture()
+def statements(db_app):
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        executed.append(statement)
+
+    with db_app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield executed
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture()
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(negcache, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    negative_cache.clear()
+    return clock
+
+
+def encrypted(password):
+    """A poll of the device encrypted with ``password``, and its payload."""
+    payload = encrypt_request(
+        urlencode({"u": HARDWARE_ID, "p": password} | POLL), password
+    )
+    return f"/api?_{HARDWARE_ID}_{payload}", payload
+
+
+def test_unknown_device_is_rejected_from_memory(poll, statements):
+    response = poll(hardware_id="ts-unknown")
+    assert response.status_code == 400
+    assert statements
+
+    statements.clear()
+    for path in ["/api", "/fw"]:
+        response = poll(path, hardware_id="ts-unknown")
+        assert response.status_code == 400
+        assert response.text == "no activated device"
+    assert statements == []
+
+
+def test_registering_clears_the_entry(db_app, poll):
+    assert poll(hardware_id="ts-new", **POLL).status_code == 400
+    with db_app.app_context():
+        device = Device(hardware_id="ts-new", password=PASSWORD)
+        device.location_id = 1
+        device.outside_temperature_timestamp = int(time.time())
+        db.session.add(device)
+        db.session.commit()
+    assert poll(hardware_id="ts-new", **POLL).status_code == 200
+
+
+def test_repeated_undecodable_request(db_client, poll, statements):
+    path, _ = encrypted("wrong")
+    assert db_client.get(path).text == "incorrect request"
+    statements.clear()
+    assert db_client.get(path).text == "incorrect request"
+    assert statements == []
+
+    # other requests of the device are still answered
+    assert poll(**POLL).status_code == 200
+    assert db_client.get(encrypted("other")[0]).status_code == 400
+    assert statements
+
+
+def test_password_change_clears_undecodable_requests(db_app, db_client):
+    path, payload = encrypted("changed")
+    assert db_client.get(path).status_code == 400
+    assert negative_cache.reject(HARDWARE_ID, payload) == UNDECODABLE
+    with db_app.app_context():
+        db.session.get(Device, HARDWARE_ID).password = "changed"
+        db.session.commit()
+    assert db_client.get(path).status_code == 200
+
+
+def test_entries_expire(clock):
+    negative_cache.unknown("ts-gone")
+    negative_cache.undecodable(HARDWARE_ID, "00")
+    assert negative_cache.reject("ts-gone", "") == UNKNOWN
+    assert negative_cache.reject(HARDWARE_ID, "00") == UNDECODABLE
+    assert negative_cache.reject(HARDWARE_ID, "01") is None
+
+    clock.now += negative_cache.seconds
+    assert negative_cache.reject("ts-gone", "") is None
+    assert negative_cache.reject(HARDWARE_ID, "00") is None
+
+
+def test_entries_are_bounded(clock, monkeypatch):
+    monkeypatch.setattr(negative_cache, "max_entries", 2)
+    for i in range(3):
+        negative_cache.unknown(f"ts-{i}")
+    assert negative_cache.reject("ts-0", "") is None
+    assert negative_cache.reject("ts-2", "") == UNKNOWN
+
+
+def test_rejections_are_summarised(clock, caplog):
+    negative_cache.unknown("ts-gone")
+    negative_cache.undecodable(HARDWARE_ID, "00")
+    with caplog.at_level(logging.WARNING, logger=negcache.__name__):
+        for _ in range(3):
+            negative_cache.reject("ts-gone", "")
+        assert caplog.records == []
+
+        clock.now += negative_cache.log_seconds
+        negative_cache.reject(HARDWARE_ID, "00")
+    assert [record.getMessage() for record in caplog.records] == [
+        "Rejected 3 requests of unknown devices and 1 undecodable requests "
+        f"in the last {negative_cache.log_seconds} seconds"
+    ]
@@ -0,0 +1,34 @@
+import threading
+
+from thermostart import db
+from thermostart.conftest import HARDWARE_ID
+from thermostart.offload import LARGE_SCHEDULE, offload
+
+
+def test_runs_inline_without_eventlet(db_app):
+    assert not offload.enabled
+    assert offload.run(threading.get_ident) == threading.get_ident()
+
+
+def test_runs_on_native_thread_when_enabled(db_app, monkeypatch):
+    monkeypatch.setattr(offload, "enabled", True)
+    assert offload.run(threading.get_ident) != threading.get_ident()
+
+
+def test_large_schedule_serialises_the_same(db_app, device, monkeypatch):
+    device.standard_week = [
+        {"start": [i % 7, i % 24, 0], "temperature": "home"}
+        for i in range(LARGE_SCHEDULE + 1)
+    ]
+    db.session.commit()
+
+    client = db_app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = HARDWARE_ID
+    offloaded = client.get("/thermostatmodel")
+
+    monkeypatch.setattr("thermostart.ui.routes.LARGE_SCHEDULE", 10**6)
+    inline = client.get("/thermostatmodel")
+    assert offloaded.status_code == inline.status_code == 200
+    assert offloaded.data == inline.data
+    assert offloaded.mimetype == inline.mimetype
@@ -0,0 +1,148 @@
+import pytest
+
+from thermostart import db
+from thermostart.conftest import HARDWARE_ID, PASSWORD
+from thermostart.events import rooms, socketio, ui_activity
+from thermostart.ts import outbox
+from thermostart.ts.utils import Source, decrypt_response
+
+POLL = {"pv": "205", "hw": "4", "fw": "30040043"}
+
+
+@pytest.fixture()
+def reply(db_app, poll):
+    def reply(**params):
+        response = poll(**POLL | params)
+        assert response.status_code == 200
+        return decrypt_response(response.data, PASSWORD)
+
+    # the first poll syncs the calendar
+    reply()
+    return reply
+
+
+@pytest.fixture()
+def store(db_app, db_client):
+    """Save the thermostat model from a browser, like the UI does."""
+    from thermostart.models import Device
+
+    with db_client.session_transaction() as session:
+        session["_user_id"] = HARDWARE_ID
+    socket = socketio.test_client(db_app, flask_test_client=db_client)
+
+    def store(ui_source, **changes):
+        with db_app.app_context():
+            device = db.session.get(Device, HARDWARE_ID)
+            model = {
+                field: getattr(device, field)
+                for field in [
+                    "exceptions",
+                    "predefined_temperatures",
+                    "predefined_labels",
+                    "standard_week",
+                    "dhw_programs",
+                    "ta",
+                    "dim",
+                    "sl",
+                    "sd",
+                    "locale",
+                    "host",
+                    "port",
+                    "source",
+                    "target_temperature",
+                ]
+            }
+        socket.emit(
+            "store-thermostat",
+            model | changes | {"ui_synced": False, "ui_source": ui_source},
+        )
+
+    yield store
+    socket.disconnect()
+    rooms.clear()
+    ui_activity.clear()
+
+
+def kinds(db_app):
+    from thermostart.models import Device
+
+    with db_app.app_context():
+        device = db.session.get(Device, HARDWARE_ID)
+        return [(command.kind, command.sent is not None) for command in device.commands]
+
+
+def test_changes_are_coalesced(db_app, reply, store):
+    store("pause_button", source=Source.PAUSE.value, target_temperature=125)
+    store("dim_toggle", dim=50)
+    assert kinds(db_app) == [("source", False), ("dim", False)]
+
+    xml = reply()
+    assert "<PAUSE>1</PAUSE><INIT><SRC>5</SRC></INIT><DIM>50</DIM>" in xml
+    for tag in ["<SVSET>", "<TA>", "<LOCALE>", "<SLS>", "<SD>"]:
+        assert tag not in xml
+
+
+def test_latest_value_is_sent_once(db_app, reply, store):
+    store("dim_toggle", dim=75)
+    store("dim_toggle", dim=50)
+    assert reply().count("<DIM>50</DIM>") == 1
+
+
+def test_reported_values_confirm(db_app, reply, store):
+    store("pause_button", source=Source.PAUSE.value)
+    assert "<PAUSE>1</PAUSE>" in reply()
+    assert kinds(db_app) == [("source", True)]
+
+    # the reply got lost, the thermostat still runs its week program
+    assert "<PAUSE>1</PAUSE>" in reply(src=str(Source.STD_WEEK.value))
+    assert "<PAUSE>" not in reply(src=str(Source.PAUSE.value))
+    assert kinds(db_app) == []
+
+
+def test_thermostat_changes_win_in_the_end(db_app, reply, store):
+    store("pause_button", source=Source.PAUSE.value)
+    for _ in range(outbox.SENDS):
+        assert "<PAUSE>1</PAUSE>" in reply(src=str(Source.STD_WEEK.value))
+    assert "<PAUSE>" not in reply(src=str(Source.STD_WEEK.value))
+    assert kinds(db_app) == []
+
+
+def test_unreported_settings_are_sent_again(db_app, reply, store):
+    store("statusled_toggle", sl=0)
+    # polls do not report sl, the next replies make up for a lost one
+    for _ in range(outbox.SENDS):
+        assert "<SLS>0</SLS>" in reply()
+        assert kinds(db_app) == [("sl", True)]
+
+    store("locale_toggle", locale="nl-NL")
+    xml = reply()
+    assert "<INIT><LOCALE>nl-NL</LOCALE></INIT>" in xml
+    assert "<SLS>" not in xml
+    assert kinds(db_app) == [("locale", True)]
+
+
+def test_repeated_ui_source_queues_nothing(db_app, reply, store):
+    store("dim_toggle", dim=50)
+    # a later save of the calendar repeats the last ui_source
+    store("dim_toggle", standard_week=[])
+    assert kinds(db_app) == [("dim", False)]
+
+
+def test_init_acknowledges_everything(db_app, reply, store):
+    store("temperature_calibration", ta=5)
+    assert "<TA>5</TA>" in reply(init="1")
+    assert kinds(db_app) == []
+
+
+def test_setpoint(db_app, reply, store):
+    store(
+        "direct_temperature_setter_up",
+        source=Source.SERVER.value,
+        target_temperature=215,
+    )
+    xml = reply()
+    assert "<PAUSE>0</PAUSE><INIT><SRC>2</SRC></INIT><SVSET>215</SVSET>" in xml
+
+
+def test_browser_only_changes():
+    assert outbox.command_for(None, {"host": "example.com"}, "host_changed") is None
@@ -0,0 +1,65 @@
+import cProfile
+import pstats
+
+import pytest
+
+from thermostart.profiling import collapsed_stacks, profiler
+
+TOKEN = {"Authorization": "Bearer letmein"}
+
+
+@pytest.fixture()
+def admin_client(db_app, db_client, tmp_path):
+    db_app.config["ADMIN_TOKEN"] = "letmein"
+    profiler.configure(output_dir=str(tmp_path))
+    yield db_client
+    profiler.configure(sample_rate=0)
+    profiler.reset()
+
+
+def work():
+    return sum(i * i for i in range(2000))
+
+
+def test_collapsed_stacks_include_callers():
+    profile = cProfile.Profile()
+    profile.runcall(work)
+    stacks = collapsed_stacks(pstats.Stats(profile))
+    assert any(";" in stack and ":work" in stack for stack in stacks)
+    assert all(value > 0 for value in stacks.values())
+
+
+class TestProfilerAdmin:
+    def test_disabled_without_token(self, db_client):
+        assert db_client.get("/admin/profiler").status_code == 404
+
+    def test_rejects_wrong_token(self, admin_client):
+        response = admin_client.get(
+            "/admin/profiler", headers={"Authorization": "Bearer nope"}
+        )
+        assert response.status_code == 403
+
+    def test_samples_polls_and_dumps(self, admin_client, poll, tmp_path):
+        response = admin_client.post(
+            "/admin/profiler", json={"sample_rate": 2}, headers=TOKEN
+        )
+        assert response.json["sample_rate"] == 2
+
+        for _ in range(4):
+            poll(pv="205", hw="4", fw="30040043")
+        assert profiler.samples == 2
+
+        admin_client.post("/admin/profiler", json={"dump": True}, headers=TOKEN)
+        assert pstats.Stats(str(tmp_path / "api.pstats")).total_calls > 0
+        collapsed = (tmp_path / "api.collapsed").read_text().splitlines()
+        assert all(line.rsplit(" ", 1)[1].isdigit() for line in collapsed)
+        assert (tmp_path / "allocations.txt").exists()
+
+    @pytest.mark.parametrize(
+        "body",
+        [{"sample_rate": "ten"}, {"sample_rate": -1}, {"sample_rate": True}, [1]],
+    )
+    def test_rejects_bad_settings(self, admin_client, body):
+        response = admin_client.post("/admin/profiler", json=body, headers=TOKEN)
+        assert response.status_code == 400
+        assert profiler.sample_rate == 0
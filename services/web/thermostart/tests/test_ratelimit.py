@@ -0,0 +1,110 @@
+from types import SimpleNamespace
+
+import pytest
+
+from thermostart.conftest import HARDWARE_ID, PASSWORD, TestConfig
+from thermostart.metrics import REQUESTS_LIMITED
+from thermostart.ts import ratelimit
+from thermostart.ts.ratelimit import TokenBuckets, rate_limiter
+from thermostart.ts.utils import decrypt_response
+
+POLL = {"pv": "205", "hw": "4", "fw": "30040043"}
+
+
+class LimitedConfig(TestConfig):
+    RATE_LIMIT_DEVICE_RATE = 0.5
+    RATE_LIMIT_DEVICE_BURST = 2
+    RATE_LIMIT_ADDRESS_RATE = 1
+    RATE_LIMIT_ADDRESS_BURST = 4
+    LOAD_SHED_CONCURRENCY = 10
+    LOAD_SHED_FACTOR = 6
+
+
+@pytest.fixture()
+def app_config():
+    return LimitedConfig
+
+
+@pytest.fixture()
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(ratelimit, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def limited(route, reason):
+    return dict((key, value) for _, key, value in REQUESTS_LIMITED.samples()).get(
+        (("route", route), ("reason", reason)), 0
+    )
+
+
+def test_token_buckets():
+    buckets = TokenBuckets(rate=1, burst=2)
+    assert buckets.take("a", 0) and buckets.take("a", 0)
+    assert not buckets.take("a", 0.5)
+    assert buckets.take("b", 0.5)
+    assert buckets.take("a", 1.5)
+    assert not buckets.take("a", 1.5)
+
+
+def test_limited_device_is_told_to_back_off(poll, clock):
+    before = limited("/api", "device")
+    for _ in range(2):
+        assert "<TH>6</TH>" not in decrypt_response(poll(**POLL).data, PASSWORD)
+
+    response = poll(**POLL)
+    assert response.status_code == 200
+    assert decrypt_response(response.data, PASSWORD) == (
+        "<ITHERMOSTAT><TH>6</TH></ITHERMOSTAT>"
+    )
+    assert limited("/api", "device") == before + 1
+
+    # the next full reply sets the throttle factor back
+    clock.now += 2
+    assert "<TH>3</TH>" in decrypt_response(poll(**POLL).data, PASSWORD)
+
+
+def test_unknown_device_is_refused_by_address(poll, clock):
+    statuses = [poll(hardware_id="ts-unknown").status_code for _ in range(5)]
+    assert statuses == [400] * 4 + [429]
+    assert poll(hardware_id="ts-unknown").headers["Retry-After"] == "1"
+
+
+def test_made_up_requests_leave_the_device_alone(db_client, poll, clock):
+    garbage = [
+        db_client.get(
+            f"/api?_{HARDWARE_ID}_{i:032x}",
+            environ_base={"REMOTE_ADDR": f"10.0.0.{i}"},
+        ).status_code
+        for i in range(10)
+    ]
+    assert garbage == [400] * 10
+    assert "<TH>6</TH>" not in decrypt_response(poll(**POLL).data, PASSWORD)
+
+
+def test_scanner_is_refused_by_address(poll, clock):
+    before = limited("/fw", "address")
+    statuses = [poll("/fw", f"ts-{i}").status_code for i in range(6)]
+    assert statuses == [400] * 4 + [429] * 2
+    assert limited("/fw", "address") == before + 2
+
+
+def test_overload_sheds_polls(poll, clock, monkeypatch):
+    poll(**POLL)
+    clock.now += 10
+    monkeypatch.setattr(rate_limiter, "in_flight", 10)
+
+    shed = poll(**POLL)
+    assert decrypt_response(shed.data, PASSWORD) == (
+        "<ITHERMOSTAT><TH>6</TH></ITHERMOSTAT>"
+    )
+    response = poll("/fw")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert rate_limiter.in_flight == 10
+
+
+def test_requests_are_counted_out(poll):
+    poll(**POLL)
+    poll("/fw", "ts-unknown")
+    assert rate_limiter.in_flight == 0
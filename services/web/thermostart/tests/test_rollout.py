@@ -0,0 +1,157 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from thermostart import db
+from thermostart.conftest import HARDWARE_ID, PASSWORD, TestConfig
+from thermostart.metrics import FIRMWARE_RETRIES, FIRMWARE_ROLLOUT_DEVICES
+from thermostart.models import Device
+from thermostart.ts import rollout as rollout_module
+from thermostart.ts.rollout import (
+    DONE,
+    FAILED,
+    OFFERED,
+    SENT,
+    TRANSFERRING,
+    WAITING,
+    rollout,
+)
+from thermostart.ts.utils import (
+    FIRMWARE_VERSIONS,
+    UPGRADED_VERSION_MINOR,
+    decrypt_response,
+    firmware_upgrade_needed,
+)
+
+OLD = FIRMWARE_VERSIONS[5]["sw"]
+NEW = OLD + UPGRADED_VERSION_MINOR
+
+
+class RolloutConfig(TestConfig):
+    FIRMWARE_ROLLOUT = True
+    FIRMWARE_ROLLOUT_SLOTS = 1
+    FIRMWARE_ROLLOUT_TIMEOUT = 60
+    FIRMWARE_ROLLOUT_RETRIES = 2
+
+
+@pytest.fixture()
+def app_config():
+    return RolloutConfig
+
+
+@pytest.fixture()
+def clock(db_app, monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(
+        rollout_module, "time", SimpleNamespace(monotonic=lambda: clock.now)
+    )
+    return clock
+
+
+@pytest.fixture()
+def second(db_app):
+    with db_app.app_context():
+        device = Device(hardware_id="ts-5678", password=PASSWORD)
+        device.location_id = 1
+        device.outside_temperature_timestamp = int(time.time())
+        db.session.add(device)
+        db.session.commit()
+    return "ts-5678"
+
+
+def poll_fw(poll, fw, hardware_id=HARDWARE_ID):
+    response = poll(hardware_id=hardware_id, pv="205", hw="5", fw=f"v{fw}")
+    assert response.status_code == 200
+    return "<FW>1</FW>" in decrypt_response(response.data, PASSWORD)
+
+
+def download(poll, hardware_id=HARDWARE_ID):
+    response = poll("/fw", hardware_id=hardware_id, hw="5")
+    response.close()
+    return response
+
+
+def test_firmware_upgrade_needed():
+    assert firmware_upgrade_needed(5, OLD)
+    assert not firmware_upgrade_needed(5, NEW)
+    assert not firmware_upgrade_needed(4, FIRMWARE_VERSIONS[4]["sw"])
+    assert not firmware_upgrade_needed(6, 0)
+
+
+def test_upgrade(poll, clock):
+    assert poll_fw(poll, OLD)
+    assert rollout.state(HARDWARE_ID) == OFFERED
+    # offered until the device downloads the image
+    assert poll_fw(poll, OLD)
+
+    response = download(poll)
+    assert response.status_code == 200
+    assert rollout.state(HARDWARE_ID) == SENT
+    assert not poll_fw(poll, OLD)
+
+    assert not poll_fw(poll, NEW)
+    assert rollout.state(HARDWARE_ID) == DONE
+    assert FIRMWARE_ROLLOUT_DEVICES.value(state=DONE) == 1
+    assert FIRMWARE_ROLLOUT_DEVICES.value(state=SENT) == 0
+
+
+def test_slots_limit_transfers(poll, clock, second):
+    assert poll_fw(poll, OLD)
+    assert not poll_fw(poll, OLD, second)
+    assert rollout.state(second) == WAITING
+
+    response = poll("/fw", hardware_id=second, hw="5")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "60"
+
+    # the slot is held until the image has been written out
+    response = poll("/fw", hw="5")
+    assert rollout.state(HARDWARE_ID) == TRANSFERRING
+    assert not poll_fw(poll, OLD, second)
+    response.close()
+    assert poll_fw(poll, OLD, second)
+
+
+def test_timeouts_are_retried(poll, clock, second):
+    retries = FIRMWARE_RETRIES.value()
+    assert poll_fw(poll, OLD)
+    clock.now += 60
+    # the device never came for the image, the slot went to the next one
+    assert poll_fw(poll, OLD, second)
+    assert rollout.state(HARDWARE_ID) == WAITING
+    assert FIRMWARE_RETRIES.value() == retries + 1
+
+    download(poll, second)
+    assert poll_fw(poll, OLD)
+    download(poll)
+    clock.now += 60
+    # sent, but still the old version after the timeout
+    assert not poll_fw(poll, OLD)
+    assert rollout.state(HARDWARE_ID) == FAILED
+    assert rollout.in_progress == 0
+
+
+def test_failed_download_frees_the_slot(poll, clock, monkeypatch):
+    def get_firmware(hw, patch):
+        raise OSError("no image")
+
+    monkeypatch.setattr("thermostart.ts.routes.get_firmware", get_firmware)
+    assert poll_fw(poll, OLD)
+    with pytest.raises(OSError):
+        download(poll)
+    assert rollout.state(HARDWARE_ID) == WAITING
+    assert poll_fw(poll, OLD)
+
+
+def test_other_devices_are_left_alone(poll, clock):
+    assert poll(pv="205", hw="4", fw="30040043").status_code == 200
+    assert not poll_fw(poll, NEW)
+    assert rollout.state(HARDWARE_ID) is None
+
+
+def test_disabled(poll, monkeypatch):
+    monkeypatch.setattr(rollout, "enabled", False)
+    assert not poll_fw(poll, OLD)
+    assert download(poll).status_code == 200
+    assert rollout.state(HARDWARE_ID) is None
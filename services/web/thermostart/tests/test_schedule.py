@@ -0,0 +1,169 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+import pytz
+
+from thermostart import db
+from thermostart.conftest import HARDWARE_ID
+from thermostart.models import Device, Location
+from thermostart.schedule import EXCEPTION, STD_WEEK, Block, Schedule
+
+TEMPERATURES = Device.get_default_predefined_temperatures()
+AMSTERDAM = pytz.timezone("Europe/Amsterdam")
+
+
+def at(*moment, tz=None):
+    """Unix time of a local moment in ``tz``, UTC when None."""
+    if tz is None:
+        return int(datetime(*moment, tzinfo=timezone.utc).timestamp())
+    return int(tz.localize(datetime(*moment)).timestamp())
+
+
+def week(*blocks):
+    return [{"start": list(start), "temperature": program} for start, program in blocks]
+
+
+def exception(start, end, program):
+    return {"start": list(start), "end": list(end), "temperature": program}
+
+
+DEFAULT = Schedule(Device.get_default_standard_week(), [], TEMPERATURES)
+
+
+def test_standard_week():
+    # monday 2024-07-01 08:00
+    assert DEFAULT.block_at(at(2024, 7, 1, 8)) == Block(
+        STD_WEEK,
+        "not_home",
+        150,
+        at(2024, 7, 1, 7, 30),
+        at(2024, 7, 1, 17),
+    )
+    assert DEFAULT.setpoint_at(at(2024, 7, 1, 7, 30)) == 150
+    assert DEFAULT.setpoint_at(at(2024, 7, 1, 7, 29)) == 180
+    assert DEFAULT.next_block(at(2024, 7, 1, 8)).start == at(2024, 7, 1, 17)
+
+
+def test_week_wraps_around():
+    # sunday 20:30 pause lasts until monday 06:30
+    block = DEFAULT.block_at(at(2024, 7, 1, 3))
+    assert (block.program, block.start, block.end) == (
+        "pause",
+        at(2024, 6, 30, 20, 30),
+        at(2024, 7, 1, 6, 30),
+    )
+    following = DEFAULT.next_block(at(2024, 7, 7, 21))
+    assert (following.program, following.start) == ("home", at(2024, 7, 8, 6, 30))
+
+
+def test_repeated_programs_are_no_switch():
+    schedule = Schedule(
+        week(((0, 6, 0), "home"), ((0, 9, 0), "home"), ((6, 22, 0), "home")),
+        [],
+        TEMPERATURES,
+    )
+    block = schedule.block_at(at(2024, 7, 3, 12))
+    assert (block.program, block.start, block.end) == ("home", None, None)
+    assert schedule.next_block(at(2024, 7, 3, 12)) is None
+
+
+def test_exceptions_count_months_from_zero_and_end_at_24():
+    schedule = Schedule(
+        Device.get_default_standard_week(),
+        [exception((2024, 6, 2, 12, 0), (2024, 6, 3, 24, 0), "comfort")],
+        TEMPERATURES,
+    )
+    block = schedule.block_at(at(2024, 7, 3, 12))
+    assert block == Block(EXCEPTION, "comfort", 215, at(2024, 7, 2, 12), at(2024, 7, 4))
+    # the standard week resumes in the middle of its pause block
+    following = schedule.next_block(at(2024, 7, 3, 12))
+    assert following == Block(
+        STD_WEEK, "pause", 125, at(2024, 7, 4), at(2024, 7, 4, 6, 30)
+    )
+    assert schedule.next_block(at(2024, 7, 2, 8)) == block._replace(
+        start=at(2024, 7, 2, 12)
+    )
+
+
+def test_last_exception_wins():
+    schedule = Schedule(
+        [],
+        [
+            exception((2024, 6, 1, 0, 0), (2024, 6, 5, 0, 0), "home"),
+            exception((2024, 6, 2, 0, 0), (2024, 6, 3, 0, 0), "anti_freeze"),
+        ],
+        TEMPERATURES,
+    )
+    assert schedule.setpoint_at(at(2024, 7, 1, 12)) == 180
+    assert schedule.setpoint_at(at(2024, 7, 2, 12)) == 50
+    assert schedule.block_at(at(2024, 7, 4, 12)).start == at(2024, 7, 3)
+    # nothing programmed outside the exceptions
+    assert schedule.block_at(at(2024, 7, 6)) is None
+    assert schedule.next_block(at(2024, 7, 6)) is None
+    assert schedule.next_block(at(2024, 6, 1)).start == at(2024, 7, 1)
+
+
+def test_local_time_and_daylight_saving():
+    schedule = Schedule(Device.get_default_standard_week(), [], TEMPERATURES, AMSTERDAM)
+    # 07:30 local is 05:30 UTC in summer, 06:30 in winter
+    assert schedule.setpoint_at(at(2024, 7, 1, 5, 30)) == 150
+    assert schedule.setpoint_at(at(2024, 1, 1, 5, 30)) == 180
+    # the clocks go back on sunday 2024-10-27
+    following = schedule.next_block(at(2024, 10, 26, 22))
+    assert following.start == at(2024, 10, 27, 7, 30, tz=AMSTERDAM)
+
+
+def test_empty_schedule():
+    schedule = Schedule(None, None, None)
+    assert schedule.block_at(0) is None
+    assert schedule.next_block(0) is None
+
+
+@pytest.fixture()
+def amsterdam(db_app):
+    with db_app.app_context():
+        db.session.add(Location(id=1, timezone="Europe/Amsterdam"))
+        # no such location, the schedule is in UTC
+        device = Device(hardware_id="ts-utc", password="pw")
+        device.location_id = 2
+        db.session.add(device)
+        db.session.commit()
+
+
+def test_program(db_client, amsterdam):
+    now = at(2024, 7, 1, 6)
+    response = db_client.get(f"/thermostat/{HARDWARE_ID}/program?at={now}")
+    assert response.json == {
+        "name": HARDWARE_ID,
+        "at": now,
+        "current": {
+            "source": STD_WEEK,
+            "program": "not_home",
+            "setpoint": 150,
+            "start": at(2024, 7, 1, 7, 30, tz=AMSTERDAM),
+            "end": at(2024, 7, 1, 17, tz=AMSTERDAM),
+        },
+        "next": {
+            "source": STD_WEEK,
+            "program": "home",
+            "setpoint": 180,
+            "start": at(2024, 7, 1, 17, tz=AMSTERDAM),
+            "end": at(2024, 7, 1, 20, 30, tz=AMSTERDAM),
+        },
+    }
+    assert db_client.get("/thermostat/unknown/program").status_code == 400
+
+
+def test_programs(db_client, amsterdam):
+    now = at(2024, 7, 1, 6)
+    response = db_client.get(
+        f"/thermostats/program?id={HARDWARE_ID},ts-utc,unknown&at={now}"
+    )
+    assert response.mimetype == "application/x-ndjson"
+    lines = {line["name"]: line for line in map(json.loads, response.data.splitlines())}
+    single = db_client.get(f"/thermostat/{HARDWARE_ID}/program?at={now}").json
+    assert lines[HARDWARE_ID] == single
+    # 06:00 in UTC, before the 06:30 switch to home
+    assert lines["ts-utc"]["current"]["program"] == "pause"
+    assert lines["unknown"] == {"name": "unknown", "error": "no activated device"}
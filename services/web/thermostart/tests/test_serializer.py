@@ -0,0 +1,105 @@
+import pytest
+from flask import jsonify
+
+from thermostart import db, serializer
+from thermostart.conftest import HARDWARE_ID
+from thermostart.serializer import View
+from thermostart.ts.routes import THERMOSTAT
+from thermostart.ui.routes import THERMOSTAT_MODEL
+
+
+@pytest.fixture()
+def encoded(monkeypatch):
+    """Names of the fields encoded since the fixture was set up."""
+    names = []
+    dumps = serializer.dumps
+
+    def _encode(values):
+        names.extend(values)
+        return {name: dumps(value) for name, value in values.items()}
+
+    monkeypatch.setattr(serializer, "_encode", _encode)
+    THERMOSTAT.clear()
+    THERMOSTAT_MODEL.clear()
+    return names
+
+
+@pytest.fixture()
+def ui_client(db_app):
+    client = db_app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = HARDWARE_ID
+    return client
+
+
+@pytest.mark.parametrize("fast", [True, False])
+def test_same_body_as_jsonify(db_app, device, encoded, monkeypatch, fast):
+    if not fast:
+        monkeypatch.setattr(serializer, "orjson", None)
+    for view in [THERMOSTAT, THERMOSTAT_MODEL]:
+        expected = jsonify(view.values(device)).get_data()
+        assert view.response(device).get_data() == expected
+
+
+def test_non_ascii(monkeypatch):
+    value = {"city": "Zürich", "temperature": 21.5}
+    assert serializer.loads(serializer.dumps(value)) == value
+    # orjson writes UTF-8 where json, like jsonify, escapes
+    if serializer.orjson is not None:
+        assert (
+            serializer.dumps(value) == '{"city":"Zürich","temperature":21.5}'.encode()
+        )
+    monkeypatch.setattr(serializer, "orjson", None)
+    assert serializer.dumps(value) == b'{"city":"Z\\u00fcrich","temperature":21.5}'
+
+
+def test_only_changed_fields_are_encoded(db_app, device, encoded):
+    first = THERMOSTAT.encode(device)
+    assert sorted(encoded) == sorted(THERMOSTAT.fields)
+
+    encoded.clear()
+    assert THERMOSTAT.encode(device) == first
+    assert encoded == []
+
+    device.room_temperature = 215
+    device.ot25 = 40
+    THERMOSTAT.encode(device)
+    assert sorted(encoded) == ["ot", "room_temperature"]
+
+
+def test_lists_changed_in_place(db_app, device, encoded):
+    THERMOSTAT.encode(device)
+    device.exceptions.append({"start": [2024, 0, 1, 0, 0], "temperature": "home"})
+    encoded.clear()
+    expected = jsonify(THERMOSTAT.values(device)).get_data()
+    assert THERMOSTAT.response(device).get_data() == expected
+    assert encoded == ["exceptions"]
+
+
+def test_volatile_fields_are_always_encoded(db_app, device, encoded):
+    THERMOSTAT_MODEL.encode(device)
+    encoded.clear()
+    THERMOSTAT_MODEL.encode(device)
+    assert encoded == ["utc_offset"]
+
+
+def test_least_recently_used_devices_are_dropped(db_app, device, encoded):
+    view = View("test", {"name": "hardware_id"}, max_devices=1)
+    view.encode(device)
+    view.encode(type("Other", (), {"hardware_id": "other"}))
+    encoded.clear()
+    view.encode(device)
+    assert encoded == ["name"]
+
+
+def test_endpoints_see_committed_changes(db_app, device, ui_client, encoded):
+    assert ui_client.get("/thermostatmodel").json["target_temperature"] == 0
+    assert ui_client.get(f"/thermostat/{HARDWARE_ID}").json["firmware"] == 0
+
+    device.target_temperature = 190
+    device.fw = 30040043
+    db.session.commit()
+    model = ui_client.get("/thermostatmodel")
+    assert model.mimetype == "application/json"
+    assert model.json["target_temperature"] == 190
+    assert ui_client.get(f"/thermostat/{HARDWARE_ID}").json["firmware"] == 30040043
@@ -0,0 +1,59 @@
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+from thermostart.conftest import HARDWARE_ID, PASSWORD
+from thermostart.ts.simulator import Stats, VirtualThermostat, run_fleet
+from thermostart.ts.utils import decrypt_request, encrypt_request
+
+
+def test_request_encryption_round_trip():
+    assert decrypt_request(encrypt_request("pv=205&hw=4", PASSWORD), PASSWORD) == (
+        "pv=205&hw=4"
+    )
+
+
+def test_stats_percentiles():
+    stats = Stats()
+    for ms in range(1, 101):
+        stats.record(ms / 1000, ok=ms != 100)
+    summary = stats.summary()
+    assert summary["p50_ms"] == pytest.approx(51)
+    assert summary["p99_ms"] == pytest.approx(100)
+    assert summary["error_rate"] == pytest.approx(0.01)
+
+
+@pytest.mark.parametrize("hw", [1, 4, 5])
+def test_virtual_thermostat_speaks_the_protocol(db_client, hw):
+    device = VirtualThermostat(HARDWARE_ID, PASSWORD, hw=hw)
+
+    response = db_client.get(device.request_path())
+    assert response.status_code == 200
+    xml = device.handle_response(response.data)
+    assert xml.startswith("<ITHERMOSTAT><CAL>")
+    assert "<INIT>" in xml
+    assert not device.needs_init
+
+    response = db_client.get(device.request_path())
+    assert "<CAL>" not in device.handle_response(response.data)
+
+
+def test_run_fleet_against_local_server(db_app):
+    server = make_server("127.0.0.1", 0, db_app)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        result = run_fleet(
+            f"http://127.0.0.1:{server.port}",
+            [VirtualThermostat(HARDWARE_ID, PASSWORD)],
+            duration=1,
+            concurrency=1,
+            time_scale=0.02,
+            integrations=1,
+        )
+    finally:
+        server.shutdown()
+    assert result["devices"]["requests"] > 1
+    assert result["devices"]["error_rate"] == 0
+    assert result["integrations"]["requests"] >= 1
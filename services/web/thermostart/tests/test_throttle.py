@@ -0,0 +1,64 @@
+import re
+
+import pytest
+
+from thermostart.clock import clock
+from thermostart.conftest import HARDWARE_ID, PASSWORD
+from thermostart.events import rooms, ui_activity
+from thermostart.throttle import throttle
+from thermostart.ts.utils import decrypt_response
+
+POLL = {"pv": "205", "hw": "4", "fw": "30040043"}
+
+
+@pytest.fixture()
+def th(db_app, poll):
+    """Poll and return the <TH> factor of the reply, None when absent."""
+
+    def th(**params):
+        response = poll(**POLL | params)
+        assert response.status_code == 200
+        match = re.search(r"<TH>(\d+)</TH>", decrypt_response(response.data, PASSWORD))
+        return match and int(match.group(1))
+
+    yield th
+    rooms.clear()
+    ui_activity.clear()
+
+
+def test_idle_device_backs_off_once(th):
+    assert th() == throttle.idle_factor > 0
+    assert th() is None
+    assert th(init="1") == throttle.idle_factor
+
+
+def test_open_browser_resets_throttle(th):
+    th()
+    rooms[HARDWARE_ID] += 1
+    assert th() == 0
+    del rooms[HARDWARE_ID]
+    ui_activity[HARDWARE_ID] = clock.time() - throttle.active_seconds - 1
+    assert th() == throttle.idle_factor
+
+
+def test_recent_activity_keeps_device_active(th):
+    th()
+    ui_activity[HARDWARE_ID] = clock.time()
+    assert th() == 0
+
+
+def test_pending_change_resets_throttle():
+    assert throttle.factor(HARDWARE_ID, False, clock.time()) == throttle.idle_factor
+    assert throttle.factor(HARDWARE_ID, True, clock.time()) == 0
+
+
+def test_disabled(th, monkeypatch):
+    monkeypatch.setattr(throttle, "idle_factor", 0)
+    assert th() is None
+
+
+def test_factor_is_restored_after_shedding(th, monkeypatch):
+    monkeypatch.setattr(throttle, "idle_factor", 0)
+    throttle.shed(HARDWARE_ID, 6)
+    assert th() == 0
+    assert th() is None
@@ -0,0 +1,191 @@
+import random
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from thermostart import db
+from thermostart.clock import clock
+from thermostart.conftest import HARDWARE_ID, TestConfig
+from thermostart.events import rooms, socketio, ui_activity
+from thermostart.metrics import PROGRAM_TIMERS
+from thermostart.models import Device
+from thermostart.transitions import TimerWheel, transitions
+
+
+def at(*moment):
+    return int(datetime(*moment, tzinfo=timezone.utc).timestamp())
+
+
+# monday 2024-07-01, the default standard week switches to not_home at 07:30
+NOW = at(2024, 7, 1, 7)
+
+
+def test_wheel_fires_on_time():
+    rng = random.Random(50)
+    wheel = TimerWheel(now=1000, slots=4, levels=3)
+    # up to twice beyond the 64 ticks of the top level
+    timers = {key: 1000 + rng.randint(1, 128) for key in range(200)}
+    for key, due in timers.items():
+        wheel.set(key, due)
+    assert len(wheel) == 200
+
+    for now in range(1001, 1130):
+        fired = wheel.advance(now)
+        assert sorted(fired) == sorted(k for k, due in timers.items() if due == now)
+    assert len(wheel) == 0
+
+
+def test_wheel_set_and_cancel():
+    wheel = TimerWheel(now=0, slots=4, levels=2)
+    wheel.set("a", 10)
+    wheel.set("b", 3)
+    wheel.set("a", 5)
+    wheel.cancel("b")
+    wheel.cancel("unknown")
+    assert wheel.advance(4) == []
+    assert wheel.advance(100) == ["a"]
+
+    # past timers fire on the next tick
+    wheel.set("c", 50)
+    assert "c" in wheel
+    assert wheel.advance(101) == ["c"]
+    # an empty wheel jumps ahead
+    assert wheel.advance(10**6) == []
+    assert wheel.now == 10**6
+
+
+class ProgramEventsConfig(TestConfig):
+    PROGRAM_EVENTS = True
+
+
+@pytest.fixture()
+def app_config():
+    return ProgramEventsConfig
+
+
+@pytest.fixture()
+def browser(db_app, db_client, monkeypatch):
+    """A browser of the device, the tests turn the wheel themselves."""
+    monkeypatch.setattr(transitions, "_start", lambda: None)
+    clock.freeze(NOW)
+    transitions.clear()
+    with db_client.session_transaction() as session:
+        session["_user_id"] = HARDWARE_ID
+    socket = socketio.test_client(db_app, flask_test_client=db_client)
+    yield socket
+    if socket.is_connected():
+        socket.disconnect()
+    rooms.clear()
+    ui_activity.clear()
+    clock.unfreeze()
+
+
+def programs(socket):
+    return [
+        event["args"][0]
+        for event in socket.get_received()
+        if event["name"] == "program"
+    ]
+
+
+def test_first_browser_gets_the_program(browser):
+    assert transitions.armed(HARDWARE_ID)
+    assert PROGRAM_TIMERS.value() == 1
+    assert transitions.advance(NOW) == []
+    assert transitions.advance(NOW + 1) == [HARDWARE_ID]
+
+    [program] = programs(browser)
+    assert program["at"] == NOW + 1
+    assert program["current"]["program"] == "home"
+    assert program["current"]["end"] == at(2024, 7, 1, 7, 30)
+    assert program["next"]["program"] == "not_home"
+
+
+def test_event_at_the_switch(browser):
+    transitions.advance(NOW + 1)
+    browser.get_received()
+
+    switch = at(2024, 7, 1, 7, 30)
+    assert transitions.advance(switch - 1) == []
+    assert transitions.advance(switch) == [HARDWARE_ID]
+    [program] = programs(browser)
+    assert program["current"]["program"] == "not_home"
+    assert program["current"]["start"] == switch
+    assert program["next"]["start"] == at(2024, 7, 1, 17)
+
+
+def test_schedule_change_is_sent_again(db_app, browser):
+    transitions.advance(NOW + 1)
+    browser.get_received()
+    with db_app.app_context():
+        device = db.session.get(Device, HARDWARE_ID)
+        device.exceptions = [
+            {
+                "start": [2024, 6, 1, 6, 0],
+                "end": [2024, 6, 1, 8, 0],
+                "temperature": "comfort",
+            }
+        ]
+        db.session.commit()
+
+    assert transitions.advance(NOW + 2) == [HARDWARE_ID]
+    [program] = programs(browser)
+    assert program["current"]["program"] == "comfort"
+    assert program["next"]["start"] == at(2024, 7, 1, 8)
+
+
+def test_rooms_without_browsers_are_not_timed(browser):
+    browser.disconnect()
+    assert not transitions.armed(HARDWARE_ID)
+    assert PROGRAM_TIMERS.value() == 0
+    assert transitions.advance(at(2024, 7, 2)) == []
+
+
+def test_disabled(db_app, db_client, monkeypatch):
+    monkeypatch.setattr(transitions, "enabled", False)
+    with db_client.session_transaction() as session:
+        session["_user_id"] = HARDWARE_ID
+    socket = socketio.test_client(db_app, flask_test_client=db_client)
+    assert not transitions.armed(HARDWARE_ID)
+    socket.disconnect()
+    rooms.clear()
+    ui_activity.clear()
+
+
+def wait_for_program(socket, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if received := programs(socket):
+            return received[-1]
+        time.sleep(0.01)
+    raise AssertionError("no program event")
+
+
+def test_thread_starts_again_for_a_schedule_change(db_app, db_client, monkeypatch):
+    monkeypatch.setattr(transitions, "tick", 0.05)
+    transitions.clear()
+    with db_app.app_context():
+        device = db.session.get(Device, HARDWARE_ID)
+        # a program that never switches, nothing stays on the wheel
+        device.standard_week = [{"start": [0, 0, 0], "temperature": "home"}]
+        db.session.commit()
+    with db_client.session_transaction() as session:
+        session["_user_id"] = HARDWARE_ID
+    socket = socketio.test_client(db_app, flask_test_client=db_client)
+    try:
+        assert wait_for_program(socket)["current"]["program"] == "home"
+        deadline = time.monotonic() + 5
+        while transitions._thread is not None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert transitions._thread is None
+
+        with db_app.app_context():
+            device = db.session.get(Device, HARDWARE_ID)
+            device.standard_week = [{"start": [0, 0, 0], "temperature": "comfort"}]
+            db.session.commit()
+        assert wait_for_program(socket)["current"]["program"] == "comfort"
+    finally:
+        socket.disconnect()
+        rooms.clear()
+        ui_activity.clear()
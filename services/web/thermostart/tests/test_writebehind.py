@@ -0,0 +1,96 @@
+import json
+
+import pytest
+
+from thermostart import db
+from thermostart.config import data_path
+from thermostart.conftest import HARDWARE_ID, TestConfig
+from thermostart.writebehind import write_behind
+
+POLL = {"pv": "205", "hw": "4", "fw": "30040043", "ot0": "0300"}
+
+
+@pytest.fixture()
+def app_config(tmp_path):
+    class WriteBehindConfig(TestConfig):
+        WRITE_BEHIND = True
+        # flushed by the tests themselves
+        WRITE_BEHIND_INTERVAL = 3600
+        WRITE_BEHIND_JOURNAL = str(tmp_path / "telemetry.journal")
+
+    return WriteBehindConfig
+
+
+def stored(db_app, *fields):
+    from thermostart.models import Device
+
+    with db_app.app_context():
+        device = db.session.get(Device, HARDWARE_ID)
+        return tuple(getattr(device, field) for field in fields)
+
+
+def test_telemetry_is_written_in_batches(db_app, poll, app_config):
+    assert poll(**POLL).status_code == 200
+    assert stored(db_app, "room_temperature", "ot0") == (0, 0)
+    assert write_behind.pending(HARDWARE_ID)["room_temperature"] == 205
+
+    # an unchanged poll adds nothing to the journal
+    assert poll(**POLL).status_code == 200
+    with open(app_config.WRITE_BEHIND_JOURNAL) as f:
+        assert [json.loads(line) for line in f] == [
+            [
+                HARDWARE_ID,
+                {"room_temperature": 205, "ot0": 0x300, "hw": 4, "fw": 30040043},
+            ]
+        ]
+
+    assert write_behind.flush() == 1
+    assert stored(db_app, "room_temperature", "ot0", "hw") == (205, 0x300, 4)
+    assert write_behind.pending(HARDWARE_ID) == {}
+
+
+def test_control_fields_stay_synchronous(db_app, poll):
+    assert poll(**POLL).status_code == 200
+    # the calendar was sent with this poll
+    assert stored(db_app, "cal_synced") == (True,)
+    with pytest.raises(ValueError):
+        write_behind.write(type("D", (), {"hardware_id": HARDWARE_ID}), {"source": 1})
+
+
+def test_journal_is_recovered(db_app, app_config):
+    with open(app_config.WRITE_BEHIND_JOURNAL, "w") as f:
+        f.write(json.dumps([HARDWARE_ID, {"room_temperature": 190}]) + "\n")
+        f.write(json.dumps([HARDWARE_ID, {"room_temperature": 195, "oo": 1}]) + "\n")
+        f.write('["cut off')
+
+    write_behind.init_app(db_app)
+    assert write_behind.pending(HARDWARE_ID) == {"room_temperature": 195, "oo": 1}
+    write_behind.flush()
+    assert stored(db_app, "room_temperature", "oo") == (195, 1)
+
+    write_behind.init_app(db_app)
+    assert write_behind.pending(HARDWARE_ID) == {}
+
+
+def test_journal_is_synced_once_per_batch(db_app, poll, monkeypatch):
+    synced = []
+    monkeypatch.setattr("thermostart.writebehind.os.fsync", synced.append)
+    assert poll(**POLL).status_code == 200
+    assert poll(**POLL | {"pv": "210"}).status_code == 200
+    assert synced == []
+    write_behind.flush()
+    assert len(synced) == 1
+
+
+@pytest.mark.parametrize(
+    "url, db_home, expected",
+    [
+        ("sqlite:////home/app/data/thermostart.db", "", "/home/app/data/journal"),
+        ("postgresql://app@db/thermostart", "/home/app/data", "/home/app/data/journal"),
+        ("sqlite://", "", "journal"),
+    ],
+)
+def test_journal_defaults_to_the_data_folder(monkeypatch, url, db_home, expected):
+    monkeypatch.setenv("DATABASE_URL", url)
+    monkeypatch.setenv("DB_HOME", db_home)
+    assert data_path("journal") == expected
@@ -0,0 +1,61 @@
+from thermostart.events import rooms, ui_activity
+from thermostart.ts import outbox
+
+
+class Throttle:
+    """Picks the <TH> poll throttle factor of a thermostat.
+
+    A device is busy while a browser has its room open, while a UI or
+    calendar change waits to be sent and for ``active_seconds`` after the
+    last UI activity; it then polls at the default rate (factor 0) so changes
+    land within seconds. Other devices are told to back off to
+    ``idle_factor``. The factor is only sent when it changes or the device
+    initialises, an ``idle_factor`` of 0 never sends it.
+    """
+
+    def __init__(self):
+        self.idle_factor = 0
+        self.active_seconds = 300
+        self._sent = {}
+
+    def init_app(self, app):
+        self.idle_factor = app.config["THROTTLE_IDLE_FACTOR"]
+        self.active_seconds = app.config["THROTTLE_ACTIVE_SECONDS"]
+        self._sent.clear()
+        app.extensions["throttle"] = self
+
+    @property
+    def enabled(self):
+        return self.idle_factor > 0
+
+    def factor(self, hardware_id, pending, now):
+        if pending or hardware_id in rooms:
+            return 0
+        last_activity = ui_activity.get(hardware_id)
+        if last_activity is not None and now - last_activity < self.active_seconds:
+            return 0
+        return self.idle_factor
+
+    def element(self, device, now, init=False):
+        """The <TH> element for a poll of ``device``, empty when unchanged."""
+        if not self.enabled and device.hardware_id not in self._sent:
+            return ""
+        pending = device.cal_synced is False or outbox.pending(device)
+        factor = self.factor(device.hardware_id, pending, now)
+        if not init and self._sent.get(device.hardware_id) == factor:
+            return ""
+        self._sent[device.hardware_id] = factor
+        return f"<TH>{factor}</TH>"
+
+    def unchanged(self, hardware_id, now):
+        """Whether an idle poll of a synced device would send no <TH>."""
+        if not self.enabled and hardware_id not in self._sent:
+            return True
+        return self._sent.get(hardware_id) == self.factor(hardware_id, False, now)
+
+    def shed(self, hardware_id, factor):
+        """Note a <TH> sent by the rate limiter, the next poll sets it back."""
+        self._sent[hardware_id] = factor
+
+
+throttle = Throttle()
@@ -0,0 +1,236 @@
+import logging
+import math
+import threading
+import time
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from thermostart.clock import clock
+from thermostart.metrics import PROGRAM_TIMERS, SOCKETIO_EMITS
+from thermostart.schedule import Schedule, timezones
+
+_LOGGER = logging.getLogger(__name__)
+
+# device columns the program of a device depends on
+SCHEDULE_COLUMNS = (
+    "standard_week",
+    "exceptions",
+    "predefined_temperatures",
+    "location_id",
+)
+# devices loaded per query when many switch at the same tick
+CHUNK_SIZE = 500
+
+
+class TimerWheel:
+    """Hierarchical timing wheel with one timer per key, times in ticks.
+
+    Level 0 has ``slots`` slots of one tick, every slot of the level above
+    spans a whole turn of the level below. A timer waits in the lowest level
+    that reaches its tick and drops a level each time the wheel below it
+    completes a turn, so setting, cancelling and advancing cost the same
+    however many timers there are. Timers beyond the top level wait in it
+    and are placed again as it turns.
+    """
+
+    def __init__(self, now=0, slots=64, levels=4):
+        self.now = now
+        self.slots = slots
+        self.levels = levels
+        self._wheels = [[{} for _ in range(slots)] for _ in range(levels)]
+        self._timers = {}
+
+    def __len__(self):
+        return len(self._timers)
+
+    def __contains__(self, key):
+        return key in self._timers
+
+    def set(self, key, due):
+        """Set the timer of ``key`` to tick ``due``, or the next tick if past."""
+        self.cancel(key)
+        self._place(key, max(due, self.now + 1))
+
+    def cancel(self, key):
+        position = self._timers.pop(key, None)
+        if position is not None:
+            level, slot = position
+            del self._wheels[level][slot][key]
+
+    def _place(self, key, due):
+        delta = due - self.now
+        level = 0
+        while level < self.levels - 1 and delta >= self.slots ** (level + 1):
+            level += 1
+        slot = due // self.slots**level % self.slots
+        self._wheels[level][slot][key] = due
+        self._timers[key] = (level, slot)
+
+    def advance(self, to):
+        """Turn the wheel to tick ``to``, the keys of the timers due by then."""
+        if not self._timers:
+            self.now = max(self.now, to)
+            return []
+        fired = []
+        while self.now < to:
+            self.now += 1
+            # the top level first, its timers may drop into the slots below
+            for level in range(self.levels - 1, 0, -1):
+                span = self.slots**level
+                if self.now % span == 0:
+                    slot = self._wheels[level][self.now // span % self.slots]
+                    timers = list(slot.items())
+                    slot.clear()
+                    for key, due in timers:
+                        self._place(key, due)
+            slot = self._wheels[0][self.now % self.slots]
+            fired.extend(slot)
+            for key in slot:
+                del self._timers[key]
+            slot.clear()
+        return fired
+
+
+class Transitions:
+    """Pushes the program of a device to its browsers when it switches.
+
+    Each device room with browsers in it has a timer in a TimerWheel, set to
+    the next block of the compiled schedule of the device (see
+    thermostart.schedule). When it fires, a "program" event with the current
+    and next block goes to the room and the timer is set to the block after
+    that. The first browser of a room gets the event on the next tick, and so
+    does a room whose device changes its schedule. A thread turns the wheel
+    every ``tick`` seconds while any timer is set and ends with the last
+    room, devices without browsers cost nothing.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.tick = 1.0
+        self.app = None
+        self.socketio = None
+        self.wheel = TimerWheel()
+        self._rooms = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def init_app(self, app):
+        self.enabled = app.config["PROGRAM_EVENTS"]
+        self.tick = app.config["PROGRAM_EVENTS_TICK"]
+        self.app = app
+        self.socketio = app.extensions["socketio"]
+        self.clear()
+        app.extensions["transitions"] = self
+
+    def clear(self):
+        with self._lock:
+            self._rooms.clear()
+            self.wheel = TimerWheel(math.floor(clock.time() / self.tick))
+            PROGRAM_TIMERS.set(0)
+
+    def armed(self, hardware_id):
+        return hardware_id in self.wheel
+
+    def join(self, hardware_id):
+        """Start timing the device, its room got its first browser."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._rooms.add(hardware_id)
+            self._set(hardware_id, clock.time())
+        self._start()
+
+    def leave(self, hardware_id):
+        """Stop timing the device, the last browser left its room."""
+        with self._lock:
+            self._rooms.discard(hardware_id)
+            self.wheel.cancel(hardware_id)
+            PROGRAM_TIMERS.set(len(self.wheel))
+
+    def invalidate(self, hardware_id):
+        """Send the program of the device again, its schedule changed."""
+        with self._lock:
+            if hardware_id not in self._rooms:
+                return
+            self._set(hardware_id, clock.time())
+        # the thread ends when no timer is left, as with programs that
+        # never switch
+        self._start()
+
+    def _set(self, hardware_id, at):
+        self.wheel.set(hardware_id, math.ceil(at / self.tick))
+        PROGRAM_TIMERS.set(len(self.wheel))
+
+    def advance(self, now):
+        """Send the program events due by unix time ``now``, their device ids."""
+        with self._lock:
+            due = self.wheel.advance(math.floor(now / self.tick))
+            PROGRAM_TIMERS.set(len(self.wheel))
+        for i in range(0, len(due), CHUNK_SIZE):
+            self._send(due[i : i + CHUNK_SIZE], int(now))
+        if due and self.wheel:
+            # a no-op on the thread, which is running
+            self._start()
+        return due
+
+    def _send(self, hardware_ids, now):
+        from thermostart import db
+        from thermostart.models import Device
+
+        with self.app.app_context():
+            try:
+                devices = (
+                    Device.query.options(Device.profile("schedule"))
+                    .filter(Device.hardware_id.in_(hardware_ids))
+                    .all()
+                )
+                zones = timezones(device.location_id for device in devices)
+            finally:
+                db.session.remove()
+        for device in devices:
+            program = Schedule.of(device, zones.get(device.location_id)).program(now)
+            self.socketio.emit("program", program, namespace="/", to=device.hardware_id)
+            SOCKETIO_EMITS.inc(event="program")
+            if program["next"] is None:
+                continue
+            with self._lock:
+                # unless the last browser left meanwhile
+                if device.hardware_id in self._rooms:
+                    self._set(device.hardware_id, program["next"]["start"])
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="program-events", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.tick)
+            try:
+                self.advance(clock.time())
+            except Exception:
+                _LOGGER.exception("Sending program events failed")
+            with self._lock:
+                if not self.wheel:
+                    self._thread = None
+                    return
+
+
+transitions = Transitions()
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_programs(session, flush_context):
+    from thermostart.models import Device
+
+    if not transitions._rooms:
+        return
+    for instance in session.dirty:
+        if isinstance(instance, Device):
+            attrs = inspect(instance).attrs
+            if any(attrs[column].history.has_changes() for column in SCHEDULE_COLUMNS):
+                transitions.invalidate(instance.hardware_id)
@@ -0,0 +1,73 @@
+import hashlib
+import json
+import threading
+from urllib.parse import parse_qsl, urlencode
+
+
+def redact(query):
+    """Drop the password from a decrypted device request."""
+    return urlencode([(k, v) for k, v in parse_qsl(query) if k != "p"])
+
+
+def digest(data):
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class Capture:
+    """Appends decrypted device traffic to a JSON lines file for replay.
+
+    Each line holds the protocol time of the request (t), the route (path),
+    the hardware id (id), the decrypted request without password (q), the
+    status (s), the time it took to answer in ms (ms) and the plain reply
+    (r). Firmware images are recorded by their sha256 (rh) only.
+    """
+
+    def __init__(self):
+        self.path = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.configure(app.config["CAPTURE_FILE"])
+        app.extensions["capture"] = self
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def configure(self, path):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self.path = path or None
+
+    def record(self, t, path, hardware_id, query, status, duration, reply):
+        entry = {
+            "t": t,
+            "path": path,
+            "id": hardware_id,
+            "q": redact(query),
+            "s": status,
+            "ms": round(duration * 1000, 3),
+        }
+        if path == "/api":
+            entry["r"] = reply
+        else:
+            entry["rh"] = digest(reply)
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self.path is None:
+                return
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line)
+            self._file.flush()
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+capture = Capture()
@@ -0,0 +1,112 @@
+import threading
+from collections import Counter
+from urllib.parse import parse_qs
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from thermostart.throttle import throttle
+
+from .utils import decrypt_request
+
+# utc offsets only change on quarter hours
+TZ_PERIOD = 900
+
+
+def fingerprint(tsreq):
+    """Everything in a parsed device request except its clock."""
+    return tuple(sorted((k, tuple(v)) for k, v in tsreq.items() if k != "ts"))
+
+
+def idle_reply(tz):
+    return f"<ITHERMOSTAT><TZ>{tz}</TZ></ITHERMOSTAT>"
+
+
+class Entry:
+    __slots__ = ("password", "fingerprint", "expires", "reply", "data")
+
+    def __init__(self, password, fingerprint, expires, reply, data):
+        self.password = password
+        self.fingerprint = fingerprint
+        self.expires = expires
+        self.reply = reply
+        self.data = data
+
+
+class ReplyCache:
+    """Encrypted replies to polls that change nothing, per device.
+
+    api() stores its reply when a poll only got the time zone back and
+    changed nothing. A later poll with the same request (apart from the
+    thermostat clock, which must be within 60 seconds) gets the same
+    ciphertext without a database query, until the time zone or weather may
+    need an update, the throttle factor changes or the device row is
+    written. Writes are seen through the ORM of this process, so the cache
+    is only correct with a single worker.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._entries = {}
+        self._generations = Counter()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.enabled = app.config["REPLY_CACHE"]
+        self.clear()
+        app.extensions["reply_cache"] = self
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+
+    def generation(self, hardware_id):
+        return self._generations[hardware_id]
+
+    def invalidate(self, hardware_id):
+        with self._lock:
+            self._entries.pop(hardware_id, None)
+            self._generations[hardware_id] += 1
+
+    def lookup(self, hardware_id, payload, now):
+        """(request, parsed request, reply, ciphertext) of a hit, or None."""
+        entry = self._entries.get(hardware_id)
+        if entry is None or now >= entry.expires:
+            return None
+        try:
+            tsreq = decrypt_request(payload, entry.password)
+        except Exception:
+            return None
+        query = parse_qs(tsreq)
+        if fingerprint(query) != entry.fingerprint:
+            return None
+        if "ts" not in query or abs(int(query["ts"][0]) - now) > 60:
+            return None
+        if not throttle.unchanged(hardware_id, now):
+            return None
+        return tsreq, query, entry.reply, entry.data
+
+    def store(self, device, tsreq, now, reply, data, generation):
+        """Remember a reply unless the device was written after ``generation``."""
+        # api() fetches the weather once the timestamp is an hour old
+        expires = min(
+            now - now % TZ_PERIOD + TZ_PERIOD,
+            (device.outside_temperature_timestamp or 0) + 3601,
+        )
+        entry = Entry(device.password, fingerprint(tsreq), expires, reply, data)
+        with self._lock:
+            if self._generations[device.hardware_id] == generation:
+                self._entries[device.hardware_id] = entry
+
+
+reply_cache = ReplyCache()
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_devices(session, flush_context):
+    from thermostart.models import Command, Device
+
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, (Device, Command)):
+            reply_cache.invalidate(instance.hardware_id)
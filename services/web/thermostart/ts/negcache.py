@@ -0,0 +1,131 @@
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from thermostart.metrics import REQUESTS_REJECTED
+
+_LOGGER = logging.getLogger(__name__)
+
+UNKNOWN = "unknown"
+UNDECODABLE = "undecodable"
+
+
+class NegativeCache:
+    """Rejects requests of unknown devices and repeated garbage from memory.
+
+    An unregistered hardware id is remembered for ``seconds``, as is the
+    exact payload of a request that could not be decrypted (a thermostat
+    sends a new one every time, scanners repeat theirs). Repeats are
+    rejected without a query and counted in one log line every
+    ``log_seconds`` instead of one each. Registering a device, or changing
+    its password, drops its entries in this process. Other processes do not
+    see that, so they leave unknown hardware ids out (``unknowns``).
+    """
+
+    def __init__(self):
+        self.seconds = 300
+        self.max_entries = 10000
+        self.log_seconds = 60
+        self.unknowns = True
+        self._entries = OrderedDict()
+        self._rejected = Counter()
+        self._logged = time.monotonic()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.seconds = app.config["NEGATIVE_CACHE_SECONDS"]
+        self.max_entries = app.config["NEGATIVE_CACHE_SIZE"]
+        self.log_seconds = app.config["NEGATIVE_CACHE_LOG_SECONDS"]
+        self.unknowns = app.config["NEGATIVE_CACHE_UNKNOWN"]
+        self.clear()
+        app.extensions["negative_cache"] = self
+
+    @property
+    def enabled(self):
+        return self.seconds > 0
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._rejected.clear()
+            self._logged = time.monotonic()
+
+    def _add(self, key, reason):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (reason, time.monotonic() + self.seconds)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def unknown(self, hardware_id):
+        if self.unknowns:
+            self._add(hardware_id, UNKNOWN)
+
+    def undecodable(self, hardware_id, payload):
+        self._add((hardware_id, payload), UNDECODABLE)
+
+    def reject(self, hardware_id, payload):
+        """UNKNOWN or UNDECODABLE for a request to reject, otherwise None."""
+        if not self._entries:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            for key in (hardware_id, (hardware_id, payload)):
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                reason, expires = entry
+                if now >= expires:
+                    del self._entries[key]
+                    continue
+                self._rejected[reason] += 1
+                break
+            else:
+                return None
+            summary = now - self._logged >= self.log_seconds
+            if summary:
+                rejected = dict(self._rejected)
+                self._rejected.clear()
+                self._logged = now
+        REQUESTS_REJECTED.inc(reason=reason)
+        if summary:
+            _LOGGER.warning(
+                "Rejected %d requests of unknown devices and %d undecodable "
+                "requests in the last %d seconds",
+                rejected.get(UNKNOWN, 0),
+                rejected.get(UNDECODABLE, 0),
+                self.log_seconds,
+            )
+        return reason
+
+    def invalidate(self, hardware_id):
+        with self._lock:
+            for key in list(self._entries):
+                if key == hardware_id or (
+                    isinstance(key, tuple) and key[0] == hardware_id
+                ):
+                    del self._entries[key]
+
+
+negative_cache = NegativeCache()
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_registrations(session, flush_context):
+    from thermostart.models import Device
+
+    if not negative_cache._entries:
+        return
+    for instance in session.new:
+        if isinstance(instance, Device):
+            negative_cache.invalidate(instance.hardware_id)
+    for instance in session.dirty:
+        if isinstance(instance, Device):
+            if inspect(instance).attrs.password.history.has_changes():
+                negative_cache.invalidate(instance.hardware_id)
@@ -0,0 +1,148 @@
+import logging
+
+from .utils import Source
+
+_LOGGER = logging.getLogger(__name__)
+
+# the command a change in the browser queues, by its ui_source
+UI_COMMANDS = {
+    "pause_button": "source",
+    "direct_temperature_setter_up": "setpoint",
+    "direct_temperature_setter_down": "setpoint",
+    "temperature_calibration": "ta",
+    "dim_toggle": "dim",
+    "locale_toggle": "locale",
+    "statusled_toggle": "sl",
+    "display_mode_toggle": "sd",
+}
+
+# device fields sent by each kind of command
+FIELDS = {
+    "source": ("source",),
+    "setpoint": ("source", "target_temperature"),
+    "ta": ("ta",),
+    "dim": ("dim",),
+    "locale": ("locale",),
+    "sl": ("sl",),
+    "sd": ("sd",),
+}
+
+
+# replies a command is sent in when polls do not confirm it
+SENDS = 3
+
+
+def _reported(tsreq, param):
+    try:
+        return int(tsreq[param][0])
+    except (KeyError, IndexError, ValueError):
+        return None
+
+
+# polls report these fields back, so they confirm the commands that set them
+CONFIRMED_BY = {
+    "source": lambda device, tsreq: _reported(tsreq, "src") == device.source,
+    "setpoint": lambda device, tsreq: (
+        _reported(tsreq, "src") == device.source
+        and _reported(tsreq, "csv") == device.target_temperature
+    ),
+}
+
+
+def command_for(device, values, ui_source):
+    """Kind of command for a browser change of ``device`` to ``values``.
+
+    None when ``ui_source`` is not about the thermostat or left its fields as
+    they were, as the browser repeats its last ui_source with every save.
+    """
+    kind = UI_COMMANDS.get(ui_source)
+    if kind is None:
+        return None
+    if all(values.get(field) == getattr(device, field) for field in FIELDS[kind]):
+        return None
+    return kind
+
+
+def queue(device, kind):
+    from thermostart.models import Command
+
+    if kind is not None:
+        device.commands.append(Command(kind=kind))
+
+
+def acknowledge(device, tsreq, everything=False):
+    """Drop the commands the device confirmed, returns how many changed.
+
+    A reply may be lost on its way to the thermostat, so a command that was
+    sent is only done once the poll reports the values it set. Thermostats
+    do not report ta, dim, locale, sl and sd, these commands are sent in
+    ``SENDS`` replies instead. Unconfirmed commands are sent again with the
+    next reply, at most ``SENDS`` times, so a change made on the thermostat
+    itself wins in the end. A reply to an initialising device carries its
+    full state, which makes ``everything`` done.
+    """
+    changed = 0
+    for command in list(device.commands):
+        if not everything and command.sent is None:
+            continue
+        confirmed = CONFIRMED_BY.get(command.kind)
+        if (
+            everything
+            or command.sends >= SENDS
+            or (confirmed is not None and confirmed(device, tsreq))
+        ):
+            if not everything and confirmed is not None and command.sends >= SENDS:
+                _LOGGER.warning(
+                    "%s did not confirm its %s command after %d replies",
+                    device.hardware_id,
+                    command.kind,
+                    command.sends,
+                    extra={"hardware_id": device.hardware_id},
+                )
+            device.commands.remove(command)
+        else:
+            command.sent = None
+        changed += 1
+    return changed
+
+
+def pending(device):
+    """True while commands wait to be sent or confirmed."""
+    return bool(device.commands)
+
+
+def drain(device, now):
+    """Reply elements for the unsent commands, which are marked sent."""
+    kinds = set()
+    for command in device.commands:
+        if command.sent is None:
+            command.sent = now
+            command.sends += 1
+            kinds.add(command.kind)
+    if not kinds:
+        return ""
+    fields = {field for kind in kinds for field in FIELDS[kind]}
+
+    # the device state holds the latest value, so a field changed twice
+    # since the last poll is sent once
+    xml = ""
+    if "source" in fields:
+        xml += f"<PAUSE>{int(device.source == Source.PAUSE.value)}</PAUSE>"
+    init = ""
+    if "source" in fields:
+        init += f"<SRC>{device.source}</SRC>"
+    if "locale" in fields:
+        init += f"<LOCALE>{device.locale}</LOCALE>"
+    if init:
+        xml += f"<INIT>{init}</INIT>"
+    if "target_temperature" in fields:
+        xml += f"<SVSET>{device.target_temperature}</SVSET>"
+    if "ta" in fields:
+        xml += f"<TA>{device.ta}</TA>"
+    if "dim" in fields:
+        xml += f"<DIM>{device.dim}</DIM>"
+    if "sl" in fields:
+        xml += f"<SLS>{device.sl}</SLS>"
+    if "sd" in fields:
+        xml += f"<SD>{device.sd}</SD>"
+    return xml
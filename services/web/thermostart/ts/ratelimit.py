@@ -0,0 +1,139 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response
+
+from thermostart.metrics import REQUESTS_LIMITED
+from thermostart.throttle import throttle
+
+from .utils import encrypt_response
+
+# buckets kept per kind of key, the least recently used go first
+MAX_BUCKETS = 10000
+
+
+class TokenBuckets:
+    """Token buckets holding up to ``burst`` tokens, refilled at ``rate`` per second."""
+
+    def __init__(self, rate, burst, max_buckets=MAX_BUCKETS):
+        self.rate = rate
+        self.burst = burst
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()
+
+    def take(self, key, now):
+        """Take a token for ``key``, False when its bucket is empty."""
+        tokens, last = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_buckets:
+            self._buckets.popitem(last=False)
+        return allowed
+
+    def clear(self):
+        self._buckets.clear()
+
+
+class RateLimiter:
+    """Keeps devices and scanners from taking the worker of /api and /fw.
+
+    Every remote address gets a token bucket, and so does every hardware id
+    once a request of it could be decrypted, so that requests made up by
+    others cannot use up the bucket of a device. While
+    more than ``shed_concurrency`` device requests are in progress, or when
+    a bucket is empty, a poll of a device whose password is known gets a
+    reply that only raises its <TH> throttle factor to ``shed_factor``; the
+    next full reply sets it back. Other requests get 429, or 503 under
+    overload, with a Retry-After.
+    """
+
+    def __init__(self):
+        self.devices = None
+        self.addresses = None
+        self.shed_concurrency = 0
+        self.shed_factor = 0
+        self.in_flight = 0
+        self._replies = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        config = app.config
+        self.devices = self._buckets(
+            config["RATE_LIMIT_DEVICE_RATE"], config["RATE_LIMIT_DEVICE_BURST"]
+        )
+        self.addresses = self._buckets(
+            config["RATE_LIMIT_ADDRESS_RATE"], config["RATE_LIMIT_ADDRESS_BURST"]
+        )
+        self.shed_concurrency = config["LOAD_SHED_CONCURRENCY"]
+        self.shed_factor = config["LOAD_SHED_FACTOR"]
+        self.in_flight = 0
+        self._replies.clear()
+        app.extensions["rate_limiter"] = self
+
+    @staticmethod
+    def _buckets(rate, burst):
+        return TokenBuckets(rate, burst) if rate > 0 else None
+
+    def remember(self, hardware_id, password):
+        """Keep the shed reply of a device that sent a valid request."""
+        known = self._replies.get(hardware_id)
+        if known is None or known[0] != password:
+            reply = f"<ITHERMOSTAT><TH>{self.shed_factor}</TH></ITHERMOSTAT>"
+            self._replies[hardware_id] = (password, encrypt_response(reply, password))
+
+    def start(self, route, hardware_id, address):
+        """Count a device request in, a response when it is not to be handled.
+
+        The hardware id is not known to be genuine yet, only the address
+        bucket is charged here, see admit.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.in_flight += 1
+            if 0 < self.shed_concurrency < self.in_flight:
+                reason = "overload"
+            elif self.addresses and address and not self.addresses.take(address, now):
+                reason = "address"
+            else:
+                return None
+        return self._limit(route, hardware_id, reason)
+
+    def admit(self, route, hardware_id):
+        """Charge the bucket of a device that sent a valid request, as start."""
+        if self.devices is None:
+            return None
+        with self._lock:
+            if self.devices.take(hardware_id, time.monotonic()):
+                return None
+        return self._limit(route, hardware_id, "device")
+
+    def _limit(self, route, hardware_id, reason):
+        REQUESTS_LIMITED.inc(route=route, reason=reason)
+        known = self._replies.get(hardware_id)
+        if route == "/api" and known is not None:
+            throttle.shed(hardware_id, self.shed_factor)
+            return Response(
+                response=known[1], status=200, mimetype="application/octet-stream"
+            )
+        if reason == "overload":
+            return self._refusal(503, 1)
+        buckets = self.devices if reason == "device" else self.addresses
+        return self._refusal(429, math.ceil(1 / buckets.rate))
+
+    def finish(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    @staticmethod
+    def _refusal(status, retry_after):
+        response = Response(response="too many requests", status=status)
+        response.headers["Retry-After"] = str(retry_after)
+        return response
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,127 @@
+"""
+Replays a capture (see CAPTURE_FILE) against a fresh in-memory server.
+
+    python -m thermostart.ts.replay capture.jsonl --password secret --speed 10
+
+Every request is sent with the protocol clock frozen at the recorded time,
+so replies only differ from the recording when the server behaves
+differently. The capture does not hold passwords; the devices of the fresh
+server all get --password. Weather is marked fresh, so a replay never calls
+the weather service. The report lists latencies next to the recorded ones
+and the requests whose replies did not match.
+"""
+
+import argparse
+import json
+import time
+
+from thermostart import create_app, db
+from thermostart.clock import clock
+from thermostart.config import Config
+
+from .capture import digest, load
+from .simulator import Stats
+from .utils import decrypt_response, encrypt_request
+
+
+class ReplayConfig(Config):
+    SQLALCHEMY_DATABASE_URI = "sqlite://"
+    CAPTURE_FILE = ""
+    WRITE_BEHIND = False
+    # a replay polls faster than the devices did, and its clock is frozen
+    RATE_LIMIT_DEVICE_RATE = 0
+    RATE_LIMIT_ADDRESS_RATE = 0
+    LOAD_SHED_CONCURRENCY = 0
+
+
+def seed_devices(entries, password, timezone="UTC"):
+    from thermostart.models import Device, Location
+
+    location = Location(country="Replay", city="Replay", timezone=timezone)
+    location.latitude = location.longitude = 0
+    db.session.add(location)
+    db.session.flush()
+    for hardware_id in dict.fromkeys(entry["id"] for entry in entries):
+        device = Device(hardware_id=hardware_id, password=password)
+        device.location_id = location.id
+        device.outside_temperature_timestamp = 2**31 - 1
+        db.session.add(device)
+    db.session.commit()
+
+
+def replay(entries, password, speed=None, app=None, timezone="UTC", max_diffs=10):
+    """Send ``entries`` to ``app`` (a fresh server by default) and compare.
+
+    ``speed`` is a multiple of the recorded pace, None replays as fast as
+    possible.
+    """
+    if app is None:
+        app = create_app(ReplayConfig)
+        with app.app_context():
+            db.create_all()
+            seed_devices(entries, password, timezone)
+
+    client = app.test_client()
+    replayed, recorded = Stats(), Stats()
+    matched, diffs = 0, []
+    start = time.monotonic()
+    try:
+        for i, entry in enumerate(entries):
+            if speed:
+                due = start + (entry["t"] - entries[0]["t"]) / speed
+                time.sleep(max(0.0, due - time.monotonic()))
+
+            clock.freeze(entry["t"])
+            payload = encrypt_request(f"p={password}&{entry['q']}", password)
+            sent = time.perf_counter()
+            response = client.get(f"{entry['path']}?_{entry['id']}_{payload}")
+            replayed.record(time.perf_counter() - sent, response.status_code == 200)
+            recorded.record(entry["ms"] / 1000, entry["s"] == 200)
+
+            reply = None
+            if response.status_code == 200:
+                reply = decrypt_response(response.data, password)
+            if "r" in entry:
+                same = response.status_code == entry["s"] and reply == entry["r"]
+                expected = entry["r"]
+            else:
+                same = reply is not None and digest(reply) == entry["rh"]
+                expected, reply = entry["rh"], reply and digest(reply)
+            if same:
+                matched += 1
+            elif len(diffs) < max_diffs:
+                diffs.append({"index": i, "expected": expected, "actual": reply})
+    finally:
+        clock.unfreeze()
+    replayed.stop()
+    recorded.stop()
+
+    return {
+        "requests": len(entries),
+        "matched": matched,
+        "mismatched": len(entries) - matched,
+        "replayed": replayed.summary(),
+        "recorded": recorded.summary(),
+        "diffs": diffs,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="replay", formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("capture", help="Capture file written through CAPTURE_FILE")
+    parser.add_argument("--password", required=True, help="Password of the devices")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=None,
+        help="Multiple of the recorded pace (1, 10, ...), as fast as possible if unset",
+    )
+    parser.add_argument("--timezone", default="UTC", help="Time zone of the devices")
+    args = parser.parse_args()
+
+    result = replay(
+        load(args.capture), args.password, speed=args.speed, timezone=args.timezone
+    )
+    print(json.dumps(result, indent=2))
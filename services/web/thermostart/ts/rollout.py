@@ -0,0 +1,187 @@
+import threading
+import time
+
+from flask import Response
+
+from thermostart.metrics import FIRMWARE_RETRIES, FIRMWARE_ROLLOUT_DEVICES
+
+from .utils import firmware_upgrade_needed
+
+WAITING = "waiting"
+OFFERED = "offered"
+TRANSFERRING = "transferring"
+SENT = "sent"
+DONE = "done"
+FAILED = "failed"
+STATES = (WAITING, OFFERED, TRANSFERRING, SENT, DONE, FAILED)
+
+# states holding one of the slots
+SLOT_STATES = (OFFERED, TRANSFERRING)
+# seconds a download that was not offered waits for a free slot
+RETRY_AFTER = 60
+
+# states that end after the timeout, and count as a failed attempt then
+TIMED_STATES = (OFFERED, TRANSFERRING, SENT)
+
+
+class Transfer:
+    __slots__ = ("state", "attempts", "deadline")
+
+    def __init__(self):
+        self.state = None
+        self.attempts = 0
+        self.deadline = None
+
+
+class Rollout:
+    """Offers new firmware to a few thermostats at a time.
+
+    A poll of a thermostat of one of the ``hardware`` revisions that runs
+    older firmware makes it WAITING. While fewer than ``slots`` transfers
+    are OFFERED or TRANSFERRING, a waiting device gets <FW>1</FW>, which
+    makes it download the image from /fw. Once the image is sent the slot
+    is free again, and the device is DONE when it polls with the new
+    version. A device that does not fetch the image, or does not come back
+    upgraded, within ``timeout`` seconds waits for another attempt, up to
+    ``retries`` times, and is FAILED after that. /fw requests that were not
+    offered need a free slot as well. The state is kept per process.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.hardware = frozenset()
+        self.slots = 0
+        self.timeout = 0
+        self.retries = 0
+        self._transfers = {}
+        self._timed = set()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config["FIRMWARE_ROLLOUT"]
+        self.hardware = frozenset(
+            int(hw) for hw in config["FIRMWARE_ROLLOUT_HW"].split(",") if hw.strip()
+        )
+        self.slots = config["FIRMWARE_ROLLOUT_SLOTS"]
+        self.timeout = config["FIRMWARE_ROLLOUT_TIMEOUT"]
+        self.retries = config["FIRMWARE_ROLLOUT_RETRIES"]
+        self.clear()
+        app.extensions["rollout"] = self
+
+    def clear(self):
+        with self._lock:
+            self._transfers.clear()
+            self._timed.clear()
+            for state in STATES:
+                FIRMWARE_ROLLOUT_DEVICES.set(0, state=state)
+
+    def state(self, hardware_id):
+        transfer = self._transfers.get(hardware_id)
+        return transfer and transfer.state
+
+    def pending(self, hardware_id):
+        """True while the device is to be upgraded, its polls are not idle."""
+        return self.state(hardware_id) in (WAITING,) + TIMED_STATES
+
+    @property
+    def in_progress(self):
+        return sum(
+            self._transfers[hardware_id].state in SLOT_STATES
+            for hardware_id in self._timed
+        )
+
+    def _set(self, transfer, hardware_id, state, now=None):
+        if transfer.state is not None:
+            FIRMWARE_ROLLOUT_DEVICES.dec(state=transfer.state)
+        FIRMWARE_ROLLOUT_DEVICES.inc(state=state)
+        transfer.state = state
+        if state in TIMED_STATES:
+            transfer.deadline = now + self.timeout
+            self._timed.add(hardware_id)
+        else:
+            transfer.deadline = None
+            self._timed.discard(hardware_id)
+
+    def _fail(self, transfer, hardware_id):
+        if transfer.attempts < self.retries:
+            FIRMWARE_RETRIES.inc()
+            self._set(transfer, hardware_id, WAITING)
+        else:
+            self._set(transfer, hardware_id, FAILED)
+
+    def _expire(self, now):
+        for hardware_id in [
+            h for h in self._timed if self._transfers[h].deadline <= now
+        ]:
+            self._fail(self._transfers[hardware_id], hardware_id)
+
+    def _claim(self, transfer, hardware_id, state, now):
+        """Give the device a slot, False when all of them are taken."""
+        if self.in_progress >= self.slots:
+            return False
+        transfer.attempts += 1
+        self._set(transfer, hardware_id, state, now)
+        return True
+
+    def offer(self, hardware_id, hw, fw):
+        """True when a poll of the device is to be answered with <FW>1</FW>."""
+        if not self.enabled:
+            return False
+        needed = hw in self.hardware and firmware_upgrade_needed(hw, fw)
+        transfer = self._transfers.get(hardware_id)
+        if transfer is None and not needed:
+            return False
+
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if transfer is None:
+                transfer = self._transfers[hardware_id] = Transfer()
+                self._set(transfer, hardware_id, WAITING)
+            if not needed:
+                if transfer.state != DONE:
+                    self._set(transfer, hardware_id, DONE)
+                return False
+            if transfer.state == WAITING:
+                self._claim(transfer, hardware_id, OFFERED, now)
+            return transfer.state == OFFERED
+
+    def start(self, hardware_id):
+        """Count a firmware download in, False when no slot is free for it."""
+        if not self.enabled:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            transfer = self._transfers.get(hardware_id)
+            if transfer is not None and transfer.state in SLOT_STATES:
+                self._set(transfer, hardware_id, TRANSFERRING, now)
+                return True
+            transfer = transfer or Transfer()
+            if not self._claim(transfer, hardware_id, TRANSFERRING, now):
+                return False
+            self._transfers[hardware_id] = transfer
+            return True
+
+    def finish(self, hardware_id, sent=True):
+        """Free the slot of a firmware download, ``sent`` when it did not fail."""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            transfer = self._transfers.get(hardware_id)
+            if transfer is None or transfer.state != TRANSFERRING:
+                return
+            if sent:
+                self._set(transfer, hardware_id, SENT, now)
+            else:
+                self._fail(transfer, hardware_id)
+
+    def refusal(self):
+        response = Response(response="firmware rollout busy", status=503)
+        response.headers["Retry-After"] = str(RETRY_AFTER)
+        return response
+
+
+rollout = Rollout()
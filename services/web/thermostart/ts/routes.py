@@ -1,31 +1,128 @@
-import calendar
+import hmac
 import json
 import logging
 import time
 from datetime import datetime, timedelta, timezone
 from urllib.parse import parse_qs
 
-import requests
-from flask import Blueprint, Response, jsonify, make_response, request
-from flask_socketio import emit
+from flask import (
+    Blueprint,
+    Response,
+    current_app,
+    g,
+    jsonify,
+    make_response,
+    request,
+    stream_with_context,
+)
+from flask_login import current_user
 
 from thermostart import db
-from thermostart.models import Device, Location
-
-from .utils import (
-    Source,
-    decrypt_request,
-    encrypt_response,
-    firmware_upgrade_needed,
-    get_firmware,
+from thermostart.clock import clock
+from thermostart.devicelog import Payload
+from thermostart.events import notify
+from thermostart.feed import feed
+from thermostart.metrics import (
+    CALENDAR_SYNCS,
+    FIRMWARE_BYTES,
+    REPLY_CACHE_HITS,
+    WEATHER_FETCHES,
+    WEATHER_LATENCY,
 )
+from thermostart.models import Device, Location
+from thermostart.offload import offload
+from thermostart.schedule import Schedule, exception_time, timezones
+from thermostart.serializer import View
+from thermostart.throttle import throttle
+from thermostart.writebehind import write_behind
+
+from . import outbox
+from .capture import capture
+from .fastpath import idle_reply, reply_cache
+from .negcache import UNDECODABLE, UNKNOWN, negative_cache
+from .ratelimit import rate_limiter
+from .rollout import rollout
+from .utils import Source, decrypt_request, encrypt_response, get_firmware
 
 _LOGGER = logging.getLogger(__name__)
 ts = Blueprint("ts", __name__)
+# endpoints for integrations, served by the full app only
+integrations = Blueprint("integrations", __name__)
 
 # tomorrow.io (weather) api key
 TOMORROW_APIKEY = "gFUNhMZ2o4VotYhmcLrul3WYy7I2X9rN"
 
+# OpenTherm data ids reported by the thermostat
+OT_PARAMS = Device.OT_COLUMNS
+
+
+def calendar_xml(device, cal_version):
+    """The <CAL> element with the standard week and exceptions of ``device``."""
+    std_week = ""
+    for block in device.standard_week:
+        std_week = std_week + "s{:01d}{:02d}{:02d}{:03d}{:01d}".format(
+            # Monday-Sunday (1-7)
+            block["start"][0] + 1,
+            block["start"][1],
+            block["start"][2],
+            device.predefined_temperatures[block["temperature"]],
+            0,
+        )
+
+    exc_week = ""
+    local = timezone(timedelta(seconds=-time.timezone))
+    for block in device.exceptions:
+        start = exception_time(block["start"]).replace(tzinfo=local)
+        end = exception_time(block["end"]).replace(tzinfo=local)
+        start = int(start.astimezone(timezone.utc).timestamp())
+        end = int(end.astimezone(timezone.utc).timestamp())
+        exc_week = exc_week + "x{:08X}{:08X}{:03d}{:01d}X".format(
+            start, end, device.predefined_temperatures[block["temperature"]], 0
+        )
+
+    xml = "<CAL>"
+    xml += "v{:04X}".format(cal_version & 0xFFFF)
+    xml += std_week + exc_week
+    xml += "</CAL>"
+    return xml
+
+
+# replies to the requests the negative cache rejects
+REJECTIONS = {UNKNOWN: "no activated device", UNDECODABLE: "incorrect request"}
+
+
+def _request_hardware_id():
+    arg = str(next(iter(request.args), "")).split("_")
+    return arg[1] if len(arg) > 2 else None
+
+
+@ts.before_request
+def start_request():
+    # one protocol timestamp per request, frozen when replaying a capture
+    g.now = int(clock.time())
+    g.started = time.perf_counter()
+    return rate_limiter.start(request.path, _request_hardware_id(), request.remote_addr)
+
+
+@ts.teardown_request
+def finish_request(exc):
+    rate_limiter.finish()
+
+
+@ts.after_request
+def capture_request(response):
+    if capture.enabled and "tsreq" in g and "reply" in g:
+        capture.record(
+            g.now,
+            request.path,
+            g.hardware_id,
+            g.tsreq,
+            response.status_code,
+            time.perf_counter() - g.started,
+            g.reply,
+        )
+    return response
+
 
 # WARNING: not to be used, needs reversing, web firmware is not working
 @ts.route("/fw")
@@ -34,12 +131,15 @@ def firmware_update():
     arg = str(next(iter(request.args)))
     arg = arg.split("_")
     hardware_id = arg[1]
+    if rejected := negative_cache.reject(hardware_id, arg[2]):
+        return Response(response=REJECTIONS[rejected], status=400)
 
     _LOGGER.info(
         "Got firmare request from %s with hardware id %s and request %s..",
         request.remote_addr,
         arg[1],
         arg[2][:20],
+        extra={"hardware_id": hardware_id, "remote_addr": request.remote_addr},
     )
 
     device = Device.query.get(hardware_id)
@@ -49,38 +149,55 @@ def firmware_update():
             request.remote_addr,
             arg[1],
         )
+        negative_cache.unknown(hardware_id)
         return Response(response="no activated device", status=400)
 
     try:
-        tsreq = decrypt_request(arg[2], device.password)
-        tsreq = parse_qs(tsreq)
+        g.tsreq = decrypt_request(arg[2], device.password)
+        tsreq = parse_qs(g.tsreq)
     except Exception:
         _LOGGER.warn(
             "Request from device with IP %s and hardware id %s cannot be decoded.",
             request.remote_addr,
             arg[1],
         )
+        negative_cache.undecodable(hardware_id, arg[2])
         return Response(response="incorrect request", status=400)
+    g.hardware_id = hardware_id
 
     # validate decryption and url decoding
     if tsreq["p"][0] != device.password:
         return Response(response="password mismatch", status=400)
+    if limited := rate_limiter.admit(request.path, hardware_id):
+        return limited
 
     hw = int(tsreq["hw"][0])
+    if not rollout.start(hardware_id):
+        return rollout.refusal()
 
     _LOGGER.info(
         "Sending patched firmware to %s with hardware id %s, revision %d",
         request.remote_addr,
         arg[1],
         hw,
+        extra={"hardware_id": hardware_id, "remote_addr": request.remote_addr},
     )
 
     patch = {"hostname": device.host, "port": device.port, "replace_yourowl.com": True}
-    data = get_firmware(hw, patch)
-    data = encrypt_response(data, device.password)
+    # building and encrypting an image takes long, keep the hub free meanwhile
+    try:
+        data = offload.run(get_firmware, hw, patch)
+        g.reply = data
+        data = offload.run(encrypt_response, data, device.password)
+    except Exception:
+        rollout.finish(hardware_id, sent=False)
+        raise
+    FIRMWARE_BYTES.inc(len(data), route="/fw")
 
     response = make_response(data)
     response.headers.set("Content-Type", "text/plain")
+    # the rollout slot is taken until the image has been written out
+    response.call_on_close(lambda: rollout.finish(hardware_id))
     return response
 
 
@@ -127,187 +244,153 @@ def api():
     <TH></TH> -- 0-10 # The throttle factor property specifies the value of the server polling delay. A factor of 1 translates to delays of 10, 15, 20, 25, etc. seconds. A factor of 0 disables the throttling and defaults to 5 seconds.
     <TS></TS> -- 0 # Epoch time (GMT) in seconds
     """
+    now = g.now
     arg = str(next(iter(request.args)))
     arg = arg.split("_")
     hardware_id = arg[1]
+    if rejected := negative_cache.reject(hardware_id, arg[2]):
+        return Response(response=REJECTIONS[rejected], status=400)
 
     _LOGGER.info(
         "Got api request from %s with hardware id %s and request %s..",
         request.remote_addr,
         arg[1],
         arg[2][:20],
+        extra={"hardware_id": hardware_id, "remote_addr": request.remote_addr},
     )
 
-    device = Device.query.get(hardware_id)
+    # most polls change nothing and get the same reply as last time
+    if reply_cache.enabled and (hit := reply_cache.lookup(hardware_id, arg[2], now)):
+        g.tsreq, tsreq, g.reply, data = hit
+        g.hardware_id = hardware_id
+        if limited := rate_limiter.admit(request.path, hardware_id):
+            return limited
+        REPLY_CACHE_HITS.inc()
+        _LOGGER.info(
+            "Request %s:%s - %s",
+            request.remote_addr,
+            arg[1],
+            Payload(tsreq),
+            extra={"hardware_id": hardware_id, "payload": True},
+        )
+        _LOGGER.info(
+            "Response %s:%s - %s",
+            request.remote_addr,
+            arg[1],
+            Payload(g.reply),
+            extra={"hardware_id": hardware_id, "payload": True},
+        )
+        return Response(response=data, status=200, mimetype="application/octet-stream")
+    generation = reply_cache.generation(hardware_id)
+    last_event = feed.last_id
+
+    device = Device.query.options(Device.profile("poll")).get(hardware_id)
     if device is None:
         _LOGGER.warn(
             "Device with IP %s and hardware id %s is trying to communicate, but has not been registered.",
             request.remote_addr,
             arg[1],
         )
+        negative_cache.unknown(hardware_id)
         return Response(response="no activated device", status=400)
 
     try:
-        tsreq = decrypt_request(arg[2], device.password)
-        tsreq = parse_qs(tsreq)
+        g.tsreq = decrypt_request(arg[2], device.password)
+        tsreq = parse_qs(g.tsreq)
     except Exception:
         _LOGGER.warn(
             "Request from device with IP %s and hardware id %s cannot be decoded.",
             request.remote_addr,
             arg[1],
         )
+        negative_cache.undecodable(hardware_id, arg[2])
         return Response(response="incorrect request", status=400)
+    g.hardware_id = hardware_id
+    rate_limiter.remember(hardware_id, device.password)
+    if limited := rate_limiter.admit(request.path, hardware_id):
+        return limited
 
-    _LOGGER.info("Request %s:%s - %s", request.remote_addr, arg[1], tsreq | {"p": None})
+    _LOGGER.info(
+        "Request %s:%s - %s",
+        request.remote_addr,
+        arg[1],
+        Payload(tsreq),
+        extra={"hardware_id": hardware_id, "payload": True},
+    )
 
     xml = "<ITHERMOSTAT>"
 
     if device.cal_synced is False:
-        xml += "<CAL>"
-
-        std_week = ""
-        for block in device.standard_week:
-            std_week = std_week + "s{:01d}{:02d}{:02d}{:03d}{:01d}".format(
-                # Monday-Sunday (1-7)
-                block["start"][0] + 1,
-                block["start"][1],
-                block["start"][2],
-                device.predefined_temperatures[block["temperature"]],
-                0,
-            )
-
-        exc_week = ""
-        for block in device.exceptions:
-            # month in javascript starts at 0, so increase by one
-            start = datetime(
-                block["start"][0],
-                block["start"][1] + 1,
-                block["start"][2],
-                0,
-                0,
-                tzinfo=timezone(timedelta(seconds=-time.timezone)),
-            )
-            end = datetime(
-                block["end"][0],
-                block["end"][1] + 1,
-                block["end"][2],
-                0,
-                0,
-                tzinfo=timezone(timedelta(seconds=-time.timezone)),
-            )
-            # time in javascript implementation could start/end at 24, to not trigger an exception we use timedelta to add it
-            start = start + timedelta(
-                hours=block["start"][3], minutes=block["start"][4]
-            )
-            end = end + timedelta(hours=block["end"][3], minutes=block["end"][4])
-            start = int(start.astimezone(timezone.utc).timestamp())
-            end = int(end.astimezone(timezone.utc).timestamp())
-            exc_week = exc_week + "x{:08X}{:08X}{:03d}{:01d}X".format(
-                start, end, device.predefined_temperatures[block["temperature"]], 0
-            )
-
         cal_version = device.cal_version + 1
-        xml += "v{:04X}".format(cal_version & 0xFFFF)
-        xml += std_week + exc_week
-        xml += "</CAL>"
+        xml += calendar_xml(device, cal_version)
 
         device.cal_version = cal_version
         device.cal_synced = True
         db.session.commit()
+        CALENDAR_SYNCS.inc()
 
-    if int(tsreq["pv"][0]) != device.room_temperature:
-        device.room_temperature = tsreq["pv"][0]
-        db.session.commit()
-        emit(
-            "room_temperature",
-            {"room_temperature": int(tsreq["pv"][0])},
-            namespace="/",
-            to=hardware_id,
-        )
+    # telemetry is written behind, compare with the values still pending
+    pending = write_behind.pending(hardware_id)
+    telemetry = {}
+
+    room_temperature = int(tsreq["pv"][0])
+    if room_temperature != pending.get("room_temperature", device.room_temperature):
+        telemetry["room_temperature"] = room_temperature
 
     if kp := tsreq.get("kp"):
         kp = float(kp[0])
-        if kp != device.kp:
-            device.kp = kp
-            db.session.commit()
+        if kp != pending.get("kp", device.kp):
+            telemetry["kp"] = kp
 
     if ti := tsreq.get("ti"):
         ti = float(ti[0])
-        if ti != device.ti:
-            device.ti = ti
-            db.session.commit()
+        if ti != pending.get("ti", device.ti):
+            telemetry["ti"] = ti
 
     if td := tsreq.get("td"):
         td = float(td[0])
-        if td != device.td:
-            device.td = td
-            db.session.commit()
+        if td != pending.get("td", device.td):
+            telemetry["td"] = td
 
     if oo := tsreq.get("oo"):
         oo = int(oo[0])
-        if oo != device.oo:
-            device.oo = oo
-            db.session.commit()
+        if oo != pending.get("oo", device.oo):
+            telemetry["oo"] = oo
 
-    otparams = [
-        "ot0",
-        "ot1",
-        "ot3",
-        "ot17",
-        "ot18",
-        "ot19",
-        "ot25",
-        "ot26",
-        "ot27",
-        "ot28",
-        "ot34",
-        "ot56",
-        "ot125",
-    ]
-    otchanged = False
-    for param in otparams:
+    for param in OT_PARAMS:
         if param in tsreq:
             otvalue = int(tsreq[param][0], 16)
-            if otvalue != 0xDEAD and otvalue != getattr(device, param):
-                setattr(device, param, otvalue)
-                otchanged = True
-    if otchanged:
-        db.session.commit()
+            if otvalue != 0xDEAD and otvalue != pending.get(
+                param, getattr(device, param)
+            ):
+                telemetry[param] = otvalue
 
     hw = int(tsreq["hw"][0])
-    if hw != device.hw:
-        hw = int(tsreq["hw"][0])
-        device.hw = hw
-        db.session.commit()
+    if hw != pending.get("hw", device.hw):
+        telemetry["hw"] = hw
 
     if hw == 5:
         fw = int(tsreq["fw"][0][1:])
     else:
         fw = int(tsreq["fw"][0])
-    if fw != device.fw:
-        device.fw = fw
-        db.session.commit()
+    if fw != pending.get("fw", device.fw):
+        telemetry["fw"] = fw
 
-    # TODO: further look into why firmware update process leaks and crashes
-    # if firmware_upgrade_needed(hw, fw):
-    #     xml += "<FW>1</FW>"
+    write_behind.write(device, telemetry)
 
-    if int(tsreq["pv"][0]) != device.room_temperature:
-        device.room_temperature = tsreq["pv"][0]
-        db.session.commit()
-        emit(
-            "room_temperature",
-            {"room_temperature": int(tsreq["pv"][0])},
-            namespace="/",
-            to=hardware_id,
-        )
+    # only a few devices at a time are told to download new firmware
+    if rollout.offer(hardware_id, hw, fw):
+        xml += "<FW>1</FW>"
+
+    if "room_temperature" in telemetry:
+        notify(hardware_id, "room_temperature", {"room_temperature": room_temperature})
 
     if (
         not device.outside_temperature_timestamp
-        or datetime.fromtimestamp(device.outside_temperature_timestamp)
-        + timedelta(seconds=3600)
-        < datetime.utcnow()
+        or device.outside_temperature_timestamp + 3600 < now
     ):
+        import requests
+
         location = Location.query.filter_by(id=device.location_id).one()
         if location is None:
             return Response(response="no location", status=400)
@@ -317,24 +400,29 @@ def api():
             "apikey": TOMORROW_APIKEY,
         }
         url = "https://api.tomorrow.io/v4/weather/realtime"
-        response = requests.request("GET", url, params=querystring)
+        WEATHER_FETCHES.inc()
+        with WEATHER_LATENCY.time():
+            response = requests.request("GET", url, params=querystring)
         response = json.loads(response.text)
         outside_temperature = int(response["data"]["values"]["temperature"] * 10)
 
         xml += f"<BVSET>{outside_temperature}</BVSET>"
-        emit(
+        notify(
+            hardware_id,
             "outside_temperature",
             {
                 "location": location.city,
                 "outside_temperature": outside_temperature,
                 "outside_temperature_icon": None,
             },
-            namespace="/",
-            to=hardware_id,
         )
 
         device.outside_temperature = outside_temperature
-        device.outside_temperature_timestamp = calendar.timegm(time.gmtime())
+        device.outside_temperature_timestamp = now
+        db.session.commit()
+
+    # commands of earlier replies are done once the poll reports their values
+    if outbox.acknowledge(device, tsreq, everything="init" in tsreq):
         db.session.commit()
 
     # we need to initialize (device probably had a reboot)
@@ -355,30 +443,11 @@ def api():
             f"<PID><KP>{device.kp}</KP><TI>{device.ti}</TI><TD>{device.td}</TD></PID>"
         )
 
-    # is there a change from the webinterface?
-    elif device.ui_synced is False:
-
-        # somebody pressed pause?
-        if device.ui_source == "pause_button":
-            pause = int(device.source == Source.PAUSE.value)
-            xml += f"<PAUSE>{pause}</PAUSE>"
-            xml += f"<INIT><SRC>{device.source}</SRC></INIT>"
-        elif (
-            device.ui_source == "direct_temperature_setter_up"
-            or device.ui_source == "direct_temperature_setter_down"
-        ):
-            xml += "<PAUSE>0</PAUSE>"
-            xml += f"<INIT><SRC>{device.source}</SRC></INIT>"
-            xml += f"<SVSET>{device.target_temperature}</SVSET>"
-        else:
-            xml += f"<TA>{device.ta}</TA>"
-            xml += f"<DIM>{device.dim}</DIM>"
-            xml += f"<INIT><LOCALE>{device.locale}</LOCALE></INIT>"
-            xml += f"<SLS>{device.sl}</SLS>"
-            xml += f"<SD>{device.sd}</SD>"
-
-        # we have synced to the device
-        device.ui_synced = True
+    # are there changes from the webinterface?
+    elif changes := outbox.drain(device, now):
+        xml += changes
+
+        # sent, confirmed by a later poll or sent again
         db.session.commit()
 
     elif "src" in tsreq:
@@ -393,13 +462,12 @@ def api():
         ):
             device.source = Source.MANUAL.value
             db.session.commit()
-            emit(
+            notify(
+                hardware_id,
                 "target_temperature",
                 {"target_temperature": int(tsreq["csv"][0])},
-                namespace="/",
-                to=hardware_id,
             )
-            emit("source", {"source": tssrc}, namespace="/", to=hardware_id)
+            notify(hardware_id, "source", {"source": tssrc})
 
         elif tssrc == Source.CRASH.value:
 
@@ -409,24 +477,18 @@ def api():
             xml += "<PAUSE>0</PAUSE>"
             xml += f"<INIT><SRC>{Source.STD_WEEK.value}</SRC></INIT>"
 
-            emit(
-                "source",
-                {"source": Source.STD_WEEK.value},
-                namespace="/",
-                to=hardware_id,
-            )
+            notify(hardware_id, "source", {"source": Source.STD_WEEK.value})
 
         elif tssrc != device.source:
             device.source = tssrc
             db.session.commit()
 
             # communicate new state to ui
-            emit("source", {"source": tssrc}, namespace="/", to=hardware_id)
+            notify(hardware_id, "source", {"source": tssrc})
 
     updatetime = False
     if "ts" in tsreq:
         # Time on thermostat must be updated when difference is greater than 60 seconds
-        now = int(time.time())
         ts_req = int(tsreq["ts"][0])
         if abs(ts_req - now) > 60:
             updatetime = True
@@ -435,82 +497,361 @@ def api():
 
     if updatetime:
         # Time (GMT) in seconds
-        xml += f"<TS>{int(time.time())}</TS>"
+        xml += f"<TS>{now}</TS>"
 
     # time zone offset in minutes (signed).
-    tz = int(device.utc_offset_in_seconds() / 60)
+    tz = int(device.utc_offset_in_seconds(datetime.fromtimestamp(now)) / 60)
     xml += f"<TZ>{tz}</TZ>"
 
+    # poll less often while nobody is looking and nothing is pending
+    xml += throttle.element(device, now, init="init" in tsreq)
+
     xml += "</ITHERMOSTAT>"
 
-    _LOGGER.info("Response %s:%s - %s", request.remote_addr, arg[1], xml)
+    _LOGGER.info(
+        "Response %s:%s - %s",
+        request.remote_addr,
+        arg[1],
+        Payload(xml),
+        extra={"hardware_id": hardware_id, "payload": True},
+    )
 
+    g.reply = xml
     data = encrypt_response(xml, device.password)
+    # nothing was written or pushed to the ui, the next poll may be the same
+    if (
+        reply_cache.enabled
+        and xml == idle_reply(tz)
+        and feed.last_id == last_event
+        and not rollout.pending(hardware_id)
+    ):
+        reply_cache.store(device, tsreq, now, xml, data, generation)
     return Response(response=data, status=200, mimetype="application/octet-stream")
 
 
-@ts.route("/thermostat/<device_id>", methods=["GET", "POST"])
-def thermostat(device_id):
+def _authorized(device):
+    auth = request.authorization
+    if auth is not None:
+        return auth.username == device.hardware_id and auth.password == device.password
+    return current_user.is_authenticated and current_user.get_id() == device.hardware_id
+
+
+def _admin_authorized():
+    token = current_app.config["ADMIN_TOKEN"]
+    auth = request.headers.get("Authorization", "")
+    return bool(token) and hmac.compare_digest(auth, f"Bearer {token}")
+
+
+def _snapshot(device):
+    return {
+        "room_temperature": device.room_temperature,
+        "target_temperature": device.target_temperature,
+        "outside_temperature": device.outside_temperature,
+        "source": device.source,
+    }
+
+
+def _sse_message(event_id, event, data):
+    data = json.dumps(data, separators=(",", ":"))
+    return f"id: {event_id}\nevent: {event}\ndata: {data}\n\n"
+
+
+@integrations.route("/thermostat/<device_id>/events")
+def thermostat_events(device_id):
+    """
+    Change feed for integrations. Streams the state changes of a device as
+    server-sent events, each carrying only the fields that changed. Clients
+    authenticate with basic auth (hardware id and password) or a UI session and
+    resume with the Last-Event-ID header. When the requested id is unknown a
+    snapshot event with the full state is sent first.
+
+    Clients that cannot keep a stream open pass ?wait=<seconds> to long-poll
+    instead and get the pending events back as a JSON document.
+    """
     device = Device.query.get(device_id)
     if device is None:
         return Response(response="no activated device", status=400)
-    if request.method == "GET":
+    if not _authorized(device):
+        return Response(
+            response="unauthorized",
+            status=401,
+            headers={"WWW-Authenticate": 'Basic realm="thermostart"'},
+        )
+
+    last_id = request.headers.get("Last-Event-ID", request.args.get("last_event_id"))
+    try:
+        last_id = int(last_id)
+    except (TypeError, ValueError):
+        last_id = None
+
+    events = feed.since(device_id, last_id) if last_id is not None else None
+    snapshot = _snapshot(device) if events is None else None
+    if snapshot is not None:
+        last_id = feed.last_id
+        events = []
+    # do not hold on to a database connection while the client is waiting
+    db.session.close()
+
+    if (wait := request.args.get("wait", type=float)) is not None:
+        if not events and snapshot is None:
+            events = feed.wait(device_id, last_id, timeout=min(wait, 60))
+            if events is None:
+                return Response(response="feed expired, reconnect", status=409)
+        if events:
+            last_id = events[-1][0]
         return jsonify(
-            name=device.hardware_id,
-            room_temperature=device.room_temperature,
-            target_temperature=device.target_temperature,
-            outside_temperature=device.outside_temperature,
-            predefined_temperatures=device.predefined_temperatures,
-            standard_week=device.standard_week,
-            exceptions=device.exceptions,
-            source=device.source,
-            firmware=device.fw,
-            ot={
-                "enabled": device.oo,
-                "raw": {
-                    "ot0": device.ot0,
-                    "ot1": device.ot1,
-                    "ot3": device.ot3,
-                    "ot17": device.ot17,
-                    "ot18": device.ot18,
-                    "ot19": device.ot19,
-                    "ot25": device.ot25,
-                    "ot26": device.ot26,
-                    "ot27": device.ot27,
-                    "ot28": device.ot28,
-                    "ot34": device.ot34,
-                    "ot56": device.ot56,
-                    "ot125": device.ot125,
-                },
-            },
+            last_event_id=last_id,
+            snapshot=snapshot,
+            events=[{"id": i, "event": e, "data": d} for i, e, d in events],
         )
-    else:
-        data = request.json
 
-        if data.get("target_temperature"):
-            device.target_temperature = data.get("target_temperature")
+    keepalive = current_app.config["FEED_KEEPALIVE_SECONDS"]
+
+    def stream(last_id, events):
+        if snapshot is not None:
+            yield _sse_message(last_id, "snapshot", snapshot)
+        while True:
+            for event_id, event, data in events:
+                yield _sse_message(event_id, event, data)
+                last_id = event_id
+            events = feed.wait(device_id, last_id, timeout=keepalive)
+            if events is None:
+                # fell behind the buffer, the client reconnects for a snapshot
+                return
+            if not events:
+                yield ": keepalive\n\n"
+
+    return Response(
+        stream(last_id, events),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# columns needed to describe a thermostat to integrations
+THERMOSTAT_COLUMNS = [
+    Device.hardware_id,
+    Device.room_temperature,
+    Device.target_temperature,
+    Device.outside_temperature,
+    Device.predefined_temperatures,
+    Device.standard_week,
+    Device.exceptions,
+    Device.source,
+    Device.fw,
+    Device.oo,
+] + [getattr(Device, param) for param in OT_PARAMS]
+
+# columns needed to work out the program of a thermostat
+SCHEDULE_COLUMNS = [getattr(Device, column) for column in Device.PROFILES["schedule"]]
+
+# keep IN lists well below the bound parameter limits of the database
+BULK_CHUNK_SIZE = 500
+
+
+THERMOSTAT = View(
+    "thermostat",
+    dict(
+        name="hardware_id",
+        room_temperature="room_temperature",
+        target_temperature="target_temperature",
+        outside_temperature="outside_temperature",
+        predefined_temperatures="predefined_temperatures",
+        standard_week="standard_week",
+        exceptions="exceptions",
+        source="source",
+        firmware="fw",
+        ot=lambda device: {
+            "enabled": device.oo,
+            "raw": {param: getattr(device, param) for param in Device.OT_COLUMNS},
+        },
+    ),
+)
+
+
+def _thermostat_dict(device):
+    return THERMOSTAT.values(device)
+
+
+def _apply_update(device, data):
+    if data.get("target_temperature"):
+        device.target_temperature = data.get("target_temperature")
+
+    if data.get("exceptions"):
+        device.exceptions = data.get("exceptions")
+
+    if data.get("standard_week"):
+        device.standard_week = data.get("standard_week")
+
+    if data.get("predefined_temperatures"):
+        device.predefined_temperatures = data.get("predefined_temperatures")
+
+    if data.get("outside_temperature"):
+        device.outside_temperature = data.get("outside_temperature")
+
+    if data.get("room_temperature"):
+        device.room_temperature = data.get("room_temperature")
+
+    if data.get("pause"):
+        # like the pause button of the ui
+        command = outbox.command_for(
+            device, {"source": Source.PAUSE.value}, "pause_button"
+        )
+        device.source = Source.PAUSE.value
+        pause_temperature = (device.predefined_temperatures or {}).get("pause")
+        if pause_temperature is not None:
+            device.target_temperature = pause_temperature
+        outbox.queue(device, command)
+
 
-        if data.get("exceptions"):
-            device.exceptions = data.get("exceptions")
+def _ndjson(items):
+    for item in items:
+        yield json.dumps(item, separators=(",", ":")) + "\n"
 
-        if data.get("standard_week"):
-            device.standard_week = data.get("standard_week")
 
-        if data.get("predefined_temperatures"):
-            device.predefined_temperatures = data.get("predefined_temperatures")
+def _chunks(items, size=BULK_CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
 
-        if data.get("outside_temperature"):
-            device.outside_temperature = data.get("outside_temperature")
 
-        if data.get("room_temperature"):
-            device.room_temperature = data.get("room_temperature")
+def _request_ids():
+    ids = [i for arg in request.args.getlist("id") for i in arg.split(",") if i]
+    return list(dict.fromkeys(ids))
 
-        if data.get("pause"):
-            device.room_temperature = data.get("pause")
-            device.ui_synced = False
-            device.ui_source = "pause_button"
-            device.source = Source.PAUSE.value
 
-        device.commit()
+def _program(device, tz, at):
+    return {"name": device.hardware_id} | Schedule.of(device, tz).program(at)
 
-    return Response(response="invalid method", status=400)
+
+@integrations.route("/thermostat/<device_id>", methods=["GET", "POST"])
+def thermostat(device_id):
+    device = Device.query.get(device_id)
+    if device is None:
+        return Response(response="no activated device", status=400)
+    if request.method == "GET":
+        return THERMOSTAT.response(device)
+
+    _apply_update(device, request.json)
+    db.session.commit()
+    return Response(response="ok", status=200)
+
+
+@integrations.route("/thermostats", methods=["GET", "POST"])
+def thermostats():
+    """
+    Bulk variant of /thermostat/<device_id>, answered as newline delimited JSON.
+
+    GET takes the hardware ids as repeated or comma separated ?id= arguments
+    and returns one line per thermostat, or an error line for unknown ids.
+    POST takes a list of updates, each naming its thermostat in "name", and
+    applies all of them in one transaction; nothing is applied when one of
+    the thermostats is unknown or not authorized. Writes need the ADMIN_TOKEN
+    as bearer token, or the credentials of every thermostat they update as
+    for /thermostat/<device_id>/events.
+    """
+    if request.method == "GET":
+        ids = _request_ids()
+
+        def rows():
+            missing = set(ids)
+            for chunk in _chunks(ids):
+                query = db.session.query(*THERMOSTAT_COLUMNS).filter(
+                    Device.hardware_id.in_(chunk)
+                )
+                for row in query.yield_per(100):
+                    missing.discard(row.hardware_id)
+                    yield _thermostat_dict(row)
+            for hardware_id in ids:
+                if hardware_id in missing:
+                    yield {"name": hardware_id, "error": "no activated device"}
+
+        return Response(
+            stream_with_context(_ndjson(rows())), mimetype="application/x-ndjson"
+        )
+
+    updates = request.json
+    if not isinstance(updates, list) or not all(
+        isinstance(u, dict) and u.get("name") for u in updates
+    ):
+        return Response(response="expected a list of named updates", status=400)
+
+    ids = list(dict.fromkeys(u["name"] for u in updates))
+    devices = {}
+    for chunk in _chunks(ids):
+        for device in Device.query.filter(Device.hardware_id.in_(chunk)):
+            devices[device.hardware_id] = device
+    if missing := [i for i in ids if i not in devices]:
+        return Response(
+            _ndjson({"name": i, "error": "no activated device"} for i in missing),
+            status=400,
+            mimetype="application/x-ndjson",
+        )
+
+    if not _admin_authorized() and (
+        denied := [i for i in ids if not _authorized(devices[i])]
+    ):
+        return Response(
+            _ndjson({"name": i, "error": "unauthorized"} for i in denied),
+            status=401,
+            headers={"WWW-Authenticate": 'Basic realm="thermostart"'},
+            mimetype="application/x-ndjson",
+        )
+
+    for update in updates:
+        _apply_update(devices[update["name"]], update)
+    db.session.commit()
+
+    return Response(
+        _ndjson({"name": i, "status": "ok"} for i in ids),
+        mimetype="application/x-ndjson",
+    )
+
+
+@integrations.route("/thermostat/<device_id>/program")
+def thermostat_program(device_id):
+    """
+    The program of a thermostat at ?at=<unix time>, now by default, and the
+    one it switches to next. Both come with their setpoint, source (standard
+    week or exception) and start and end, worked out from the standard week
+    and exceptions in the time zone of the thermostat. Manual changes and
+    pauses on the thermostat are not taken into account.
+    """
+    device = Device.query.options(Device.profile("schedule")).get(device_id)
+    if device is None:
+        return Response(response="no activated device", status=400)
+    at = request.args.get("at", type=int)
+    at = int(clock.time()) if at is None else at
+    tz = timezones([device.location_id]).get(device.location_id)
+    return jsonify(_program(device, tz, at))
+
+
+@integrations.route("/thermostats/program")
+def thermostat_programs():
+    """
+    Bulk variant of /thermostat/<device_id>/program for the hardware ids in
+    repeated or comma separated ?id= arguments, answered as newline
+    delimited JSON with an error line for unknown ids.
+    """
+    ids = _request_ids()
+    at = request.args.get("at", type=int)
+    at = int(clock.time()) if at is None else at
+
+    def rows():
+        missing = set(ids)
+        for chunk in _chunks(ids):
+            devices = (
+                db.session.query(*SCHEDULE_COLUMNS)
+                .filter(Device.hardware_id.in_(chunk))
+                .all()
+            )
+            zones = timezones(device.location_id for device in devices)
+            for device in devices:
+                missing.discard(device.hardware_id)
+                yield _program(device, zones.get(device.location_id), at)
+        for hardware_id in ids:
+            if hardware_id in missing:
+                yield {"name": hardware_id, "error": "no activated device"}
+
+    return Response(
+        stream_with_context(_ndjson(rows())), mimetype="application/x-ndjson"
+    )
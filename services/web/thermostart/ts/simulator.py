@@ -0,0 +1,419 @@
+"""
+Virtual thermostat fleet for load testing a running server.
+
+Every virtual thermostat speaks the real device protocol: RC4 encrypted
+/api?_<hardware_id>_<payload> polls carrying pv, hw, fw, src, csv, ts and
+OpenTherm values, starting with an init poll, and it waits between polls
+as long as the throttle factor sent by the server tells it to.
+
+    python -m thermostart.ts.simulator --url http://localhost:3888 \\
+        --devices 200 --register --duration 60
+
+--register adds the virtual thermostats to the database the server uses
+(DATABASE_URL) and marks their weather as fresh, so the load test does not
+reach out to the weather service. Add --integrations to also simulate Home
+Assistant style clients, either polling /thermostat/<device_id> or
+subscribing to the change feed.
+"""
+
+import argparse
+import heapq
+import json
+import logging
+import random
+import re
+import threading
+import time
+from urllib.parse import urlencode
+
+import requests
+
+from .utils import FIRMWARE_VERSIONS, Source, decrypt_response, encrypt_request
+
+_LOGGER = logging.getLogger(__name__)
+
+# typical OpenTherm readings, 0xDEAD marks ids the boiler does not support
+OT_VALUES = {
+    "ot0": 0x0300,
+    "ot1": 0x2800,
+    "ot3": 0x0101,
+    "ot17": 0x0000,
+    "ot18": 0x0180,
+    "ot19": 0xDEAD,
+    "ot25": 0x2D00,
+    "ot26": 0x2A00,
+    "ot27": 0x0A00,
+    "ot28": 0x2800,
+    "ot34": 0xDEAD,
+    "ot56": 0x3C00,
+    "ot125": 0x0300,
+}
+
+TAG = re.compile(r"<(TH|SVSET|SRC|PAUSE)>(-?\d+)</")
+
+
+def poll_interval(throttle):
+    # a throttle factor of 0 polls every 5 seconds, 1 every 10, 2 every 15, ...
+    return 5 * (throttle + 1)
+
+
+class VirtualThermostat:
+    def __init__(self, hardware_id, password, hw=4, rng=None):
+        self.hardware_id = hardware_id
+        self.password = password
+        self.hw = hw
+        self.fw = FIRMWARE_VERSIONS[hw]["sw"]
+        self.rng = rng or random.Random()
+        self.room_temperature = 200 + self.rng.randint(-15, 15)
+        self.target_temperature = 180
+        self.source = Source.STD_WEEK.value
+        self.throttle = 0
+        self.needs_init = True
+
+    def request_path(self, now=None, path="/api"):
+        now = time.time() if now is None else now
+        if self.rng.random() < 0.1:
+            self.room_temperature += self.rng.choice((-1, 1))
+
+        params = {
+            "u": self.hardware_id,
+            "p": self.password,
+            "pv": self.room_temperature,
+            "hw": self.hw,
+            # HW5 firmware prefixes its version with a letter
+            "fw": f"A{self.fw}" if self.hw == 5 else self.fw,
+            "src": self.source,
+            "csv": self.target_temperature,
+            "ts": int(now),
+            "oo": 1,
+            "kp": "20.0",
+            "ti": "600.0",
+            "td": "-1.00",
+        }
+        params |= {param: f"{value:04X}" for param, value in OT_VALUES.items()}
+        if self.needs_init:
+            params["init"] = 1
+
+        payload = encrypt_request(urlencode(params), self.password)
+        return f"{path}?_{self.hardware_id}_{payload}"
+
+    def handle_response(self, body):
+        xml = decrypt_response(body, self.password)
+        for tag, value in TAG.findall(xml):
+            if tag == "TH":
+                self.throttle = int(value)
+            elif tag == "SVSET":
+                self.target_temperature = int(value)
+            elif tag == "SRC":
+                self.source = int(value)
+        self.needs_init = False
+        return xml
+
+    @property
+    def interval(self):
+        return poll_interval(self.throttle)
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.started = time.monotonic()
+        self.stopped = None
+        self._lock = threading.Lock()
+
+    def record(self, latency, ok=True):
+        with self._lock:
+            self.latencies.append(latency)
+            if not ok:
+                self.errors += 1
+
+    def stop(self, at=None):
+        self.stopped = time.monotonic() if at is None else at
+
+    def percentile(self, p):
+        if not self.latencies:
+            return 0.0
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))]
+
+    def summary(self):
+        elapsed = (self.stopped or time.monotonic()) - self.started
+        total = len(self.latencies)
+        return {
+            "requests": total,
+            "throughput": total / elapsed if elapsed else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "error_rate": self.errors / total if total else 0.0,
+        }
+
+
+def _poll_devices(url, devices, stats, deadline, time_scale, timeout, rng):
+    session = requests.Session()
+    now = time.monotonic()
+    queue = [
+        (now + rng.uniform(0, d.interval * time_scale), i)
+        for i, d in enumerate(devices)
+    ]
+    heapq.heapify(queue)
+    while queue:
+        due, i = heapq.heappop(queue)
+        if due >= deadline:
+            break
+        time.sleep(max(0.0, due - time.monotonic()))
+
+        device = devices[i]
+        start = time.monotonic()
+        try:
+            response = session.get(url + device.request_path(), timeout=timeout)
+            ok = response.status_code == 200
+            if ok:
+                device.handle_response(response.content)
+        except Exception as e:
+            _LOGGER.debug("Poll of %s failed: %s", device.hardware_id, e)
+            ok = False
+        stats.record(time.monotonic() - start, ok)
+
+        jitter = rng.uniform(0.9, 1.1)
+        heapq.heappush(queue, (start + device.interval * time_scale * jitter, i))
+
+
+def _poll_integration(url, device, stats, deadline, interval, timeout):
+    session = requests.Session()
+    while time.monotonic() < deadline:
+        start = time.monotonic()
+        try:
+            response = session.get(
+                f"{url}/thermostat/{device.hardware_id}", timeout=timeout
+            )
+            ok = response.status_code == 200
+        except Exception:
+            ok = False
+        stats.record(time.monotonic() - start, ok)
+        time.sleep(max(0.0, min(interval, deadline - time.monotonic())))
+
+
+def _subscribe_integration(url, device, stats, deadline, events):
+    session = requests.Session()
+    last_id = None
+    while time.monotonic() < deadline:
+        start = time.monotonic()
+        headers = {"Last-Event-ID": last_id} if last_id else {}
+        try:
+            with session.get(
+                f"{url}/thermostat/{device.hardware_id}/events",
+                auth=(device.hardware_id, device.password),
+                headers=headers,
+                stream=True,
+                timeout=(5, 30),
+            ) as response:
+                stats.record(time.monotonic() - start, response.status_code == 200)
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith("id: "):
+                        last_id = line[4:]
+                        events.append(last_id)
+                    if time.monotonic() >= deadline:
+                        break
+        except Exception:
+            stats.record(time.monotonic() - start, False)
+            time.sleep(1)
+
+
+def run_fleet(
+    url,
+    devices,
+    duration,
+    concurrency=8,
+    time_scale=1.0,
+    timeout=10,
+    integrations=0,
+    integration_mode="poll",
+    integration_interval=5,
+    seed=None,
+):
+    """Poll ``url`` with ``devices`` for ``duration`` seconds and return stats."""
+    url = url.rstrip("/")
+    rng = random.Random(seed)
+    deadline = time.monotonic() + duration
+    device_stats, integration_stats, events = Stats(), Stats(), []
+
+    threads = []
+    for n in range(min(concurrency, len(devices))):
+        threads.append(
+            threading.Thread(
+                target=_poll_devices,
+                args=(
+                    url,
+                    devices[n::concurrency],
+                    device_stats,
+                    deadline,
+                    time_scale,
+                    timeout,
+                    random.Random(rng.random()),
+                ),
+                daemon=True,
+            )
+        )
+    for device in devices[:integrations]:
+        if integration_mode == "sse":
+            target = _subscribe_integration
+            args = (url, device, integration_stats, deadline, events)
+        else:
+            target = _poll_integration
+            args = (
+                url,
+                device,
+                integration_stats,
+                deadline,
+                integration_interval,
+                timeout,
+            )
+        threads.append(threading.Thread(target=target, args=args, daemon=True))
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=max(0.0, deadline - time.monotonic()) + timeout + 1)
+    # rates are per second of the run, not of the time spent winding down
+    device_stats.stop(at=deadline)
+    integration_stats.stop(at=deadline)
+
+    result = {"devices": device_stats.summary()}
+    if integrations:
+        result["integrations"] = integration_stats.summary()
+        if integration_mode == "sse":
+            result["integrations"]["events"] = len(events)
+    return result
+
+
+def create_fleet(
+    count, prefix="sim", password="simulator", hws=(1, 2, 3, 4, 5), seed=None
+):
+    rng = random.Random(seed)
+    return [
+        VirtualThermostat(
+            f"{prefix}{i:05d}",
+            password,
+            hw=hws[i % len(hws)],
+            rng=random.Random(rng.random()),
+        )
+        for i in range(count)
+    ]
+
+
+def register_fleet(devices, weather=False):
+    """Add the virtual thermostats to the database configured by DATABASE_URL."""
+    from thermostart import create_app, db
+    from thermostart.models import Device
+
+    app = create_app()
+    with app.app_context():
+        existing = {
+            hardware_id
+            for (hardware_id,) in db.session.query(Device.hardware_id).filter(
+                Device.hardware_id.in_([d.hardware_id for d in devices])
+            )
+        }
+        for virtual in devices:
+            if virtual.hardware_id in existing:
+                continue
+            device = Device(hardware_id=virtual.hardware_id, password=virtual.password)
+            device.location_id = 3145  # Amsterdam
+            device.hw = virtual.hw
+            if not weather:
+                # far in the future, so the server never refreshes the weather
+                device.outside_temperature_timestamp = 2**31 - 1
+            db.session.add(device)
+        db.session.commit()
+
+
+def print_report(result):
+    for name, summary in result.items():
+        print(
+            "{:<13} {:>7} requests {:>9.1f} req/s  p50 {:>7.1f} ms  p99 {:>7.1f} ms  "
+            "errors {:>6.2%}".format(
+                name,
+                summary["requests"],
+                summary["throughput"],
+                summary["p50_ms"],
+                summary["p99_ms"],
+                summary["error_rate"],
+            )
+        )
+        if "events" in summary:
+            print(f"{'':<13} {summary['events']:>7} change events received")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="simulator", formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--url", default="http://localhost:3888", help="Server URL")
+    parser.add_argument("--devices", type=int, default=100, help="Virtual devices")
+    parser.add_argument("--prefix", default="sim", help="Hardware id prefix")
+    parser.add_argument("--password", default="simulator", help="Device password")
+    parser.add_argument(
+        "--hw", type=int, nargs="+", default=[1, 2, 3, 4, 5], help="Hardware mix"
+    )
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to run")
+    parser.add_argument(
+        "--concurrency", type=int, default=8, help="Concurrent HTTP clients"
+    )
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        default=1.0,
+        help="Multiplier for poll intervals, 0.1 polls ten times as often",
+    )
+    parser.add_argument("--timeout", type=float, default=10, help="Request timeout")
+    parser.add_argument(
+        "--register", action="store_true", help="Register the devices first"
+    )
+    parser.add_argument(
+        "--weather",
+        action="store_true",
+        help="Let the server fetch weather for registered devices",
+    )
+    parser.add_argument(
+        "--integrations", type=int, default=0, help="Simulated integrations"
+    )
+    parser.add_argument(
+        "--integration-mode",
+        choices=["poll", "sse"],
+        default="poll",
+        help="Poll /thermostat/<id> or subscribe to the change feed",
+    )
+    parser.add_argument(
+        "--integration-interval",
+        type=float,
+        default=5,
+        help="Seconds between integration polls",
+    )
+    parser.add_argument("--seed", type=int, help="Random seed")
+    parser.add_argument("--json", action="store_true", help="Print JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    fleet = create_fleet(
+        args.devices, args.prefix, args.password, tuple(args.hw), args.seed
+    )
+    if args.register:
+        register_fleet(fleet, weather=args.weather)
+
+    result = run_fleet(
+        args.url,
+        fleet,
+        args.duration,
+        concurrency=args.concurrency,
+        time_scale=args.time_scale,
+        timeout=args.timeout,
+        integrations=args.integrations,
+        integration_mode=args.integration_mode,
+        integration_interval=args.integration_interval,
+        seed=args.seed,
+    )
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
@@ -1,10 +1,20 @@
 import base64
+import logging
+import mmap
 import os
+import struct
+import threading
+import zlib
 from binascii import hexlify
 from enum import Enum
+from typing import TYPE_CHECKING
 
 from Crypto.Cipher import ARC4
-from intelhex import HexReaderError, IntelHex
+
+if TYPE_CHECKING:
+    from intelhex import IntelHex
+
+_LOGGER = logging.getLogger(__name__)
 
 
 class Source(Enum):
@@ -41,13 +51,9 @@ UPGRADED_VERSION_MINOR = 101
 
 
 def firmware_upgrade_needed(hw, fw):
-    if hw < 5:
+    if hw < 5 or hw >= len(FIRMWARE_VERSIONS):
         return False
-    return next(
-        item
-        for item in FIRMWARE_VERSIONS
-        if item["sw"] + UPGRADED_VERSION_MINOR != fw and item["hw"] == hw
-    )
+    return FIRMWARE_VERSIONS[hw]["sw"] + UPGRADED_VERSION_MINOR != fw
 
 
 def decrypt_request(request, passwd):
@@ -70,7 +76,18 @@ def encrypt_response(response, passwd):
     return base64.b16encode(response).lower()
 
 
-def patchfirmware(h: IntelHex, hw, patch):
+# the thermostat side of decrypt_request and encrypt_response
+def encrypt_request(request, passwd):
+    return encrypt_response(request, passwd).upper().decode()
+
+
+def decrypt_response(response, passwd):
+    tempkey = passwd + TS_MASTER_KEY[len(passwd) :]
+    arc4 = ARC4.new(tempkey.encode())
+    return arc4.decrypt(base64.b16decode(response, casefold=True)).decode()
+
+
+def patchfirmware(h: "BinaryImage | IntelHex", hw, patch):
     # offsets as displayed in IDA need to be multiplied by 2
 
     # Patch #1: we patch the version number
@@ -254,19 +271,13 @@ BLOCKSIZE = 256
 
 
 def ts_fw_checksum(data):
-    reg = 0
     if isinstance(data, str):
-        for octet in data:
-            reg += ord(octet)
-    else:
-        for octet in data:
-            reg += octet
+        data = data.encode("latin-1")
+    return (256 - sum(data)) & 0xFF
 
-    return (256 - reg) & 0xFF
 
-
-def get_blocks(h: IntelHex, start, end):
-    r = ""
+def get_blocks(h: "BinaryImage | IntelHex", start, end):
+    r = []
     for addr in range(start, end, BLOCKSIZE):
         data = h.tobinarray(addr, size=BLOCKSIZE)
         header = ":{:04X}0000".format(int(addr / BLOCKSIZE))
@@ -276,14 +287,142 @@ def get_blocks(h: IntelHex, start, end):
             hexlify(bytearray(data)).upper().decode(),
             ts_fw_checksum(data),
         )
-        r = r + line
-    return r
+        r.append(line)
+    return "".join(r)
 
 
-def hex2patchedts(fin, hw, patch):
+# A flat image of a .hex file holds every byte from address 0 to the max
+# address, gaps filled with 0xFF, after a header with the max address and
+# the crc32 of the data
+IMAGE_MAGIC = b"TSFW"
+IMAGE_HEADER = struct.Struct("<4sII")
+
+_images = {}
+_images_lock = threading.Lock()
+
+
+class BinaryImage:
+    """The part of the IntelHex interface used for patching, on a flat image.
+
+    The image is copied, so the read only mapping it came from stays as is.
+    """
+
+    def __init__(self, data):
+        self._buf = bytearray(data)
+
+    def maxaddr(self):
+        return len(self._buf) - 1
+
+    def gets(self, addr, length):
+        if addr < 0 or addr + length > len(self._buf):
+            raise IndexError(f"no data at {addr:#x}, length {length}")
+        return bytes(self._buf[addr : addr + length])
+
+    def puts(self, addr, s):
+        end = addr + len(s)
+        if end > len(self._buf):
+            self._buf.extend(b"\xff" * (end - len(self._buf)))
+        self._buf[addr:end] = s
+
+    def find(self, sub):
+        return self._buf.find(sub)
+
+    def tobinarray(self, start, size):
+        data = self._buf[start : start + size]
+        return data + b"\xff" * (size - len(data))
+
+
+def image_path(filename):
+    return os.path.splitext(filename)[0] + ".bin"
+
+
+def convert_image(filename):
+    """The flat image of a .hex file, None when it cannot be read."""
+    # only processes that convert firmware need intelhex
+    from intelhex import HexReaderError, IntelHex
+
     try:
-        h = IntelHex(fin)
+        h = IntelHex(filename)
     except HexReaderError:
+        return None
+    data = h.tobinstr(0, h.maxaddr())
+    return IMAGE_HEADER.pack(IMAGE_MAGIC, h.maxaddr(), zlib.crc32(data)) + data
+
+
+def save_image(path, image):
+    # other workers may convert at the same time, the last rename wins
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(image)
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _image_data(image):
+    """The data of a flat image, None when its header does not match it."""
+    if len(image) < IMAGE_HEADER.size:
+        return None
+    magic, maxaddr, checksum = IMAGE_HEADER.unpack_from(image)
+    data = memoryview(image)[IMAGE_HEADER.size :]
+    if magic != IMAGE_MAGIC or len(data) != maxaddr + 1 or zlib.crc32(data) != checksum:
+        return None
+    return data
+
+
+def _read_image(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return _image_data(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def _map_image(filename):
+    path = image_path(filename)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(filename):
+        data = _read_image(path)
+        if data is not None:
+            return data
+        _LOGGER.warning("Converting corrupt firmware image %s again", path)
+    image = convert_image(filename)
+    if image is None:
+        return None
+    try:
+        save_image(path, image)
+    except OSError as e:
+        _LOGGER.warning("Keeping firmware image %s in memory: %s", path, e)
+        return _image_data(image)
+    data = _read_image(path)
+    if data is None:
+        raise Exception("corrupt firmware image {}".format(path))
+    return data
+
+
+def map_image(filename):
+    """Read only view of the flat image of a .hex file, converted on first use.
+
+    Every process maps the image once and shares its pages with the others,
+    None when the .hex file cannot be read.
+    """
+    with _images_lock:
+        data = _images.get(filename)
+        if data is None:
+            data = _images[filename] = _map_image(filename)
+    return data
+
+
+def firmware_image(filename):
+    """A patchable copy of a base image, None when its .hex cannot be read."""
+    data = map_image(filename)
+    return None if data is None else BinaryImage(data)
+
+
+def hex2patchedts(fin, hw, patch):
+    h = firmware_image(fin)
+    if h is None:
         return 1
 
     assert (h.maxaddr() + 1) % BLOCKSIZE == 0
@@ -309,9 +448,8 @@ def hex2patchedts(fin, hw, patch):
 
 # EJE Electronics hex format, version 79
 def hex2patched_eje(fin, hw, patch):
-    try:
-        h = IntelHex(fin)
-    except HexReaderError:
+    h = firmware_image(fin)
+    if h is None:
         return 1
 
     assert (h.maxaddr() + 1) % BLOCKSIZE == 0
@@ -345,12 +483,16 @@ def get_firmware_name(hw, do_patch=False):
     return "ts_hw{}_{}.upd".format(hw, version)
 
 
+def firmware_path(hw):
+    filename = "TS_HW{}_{}.hex".format(hw, FIRMWARE_VERSIONS[hw]["sw"])
+    return os.path.join(os.getenv("APP_FOLDER"), "firmware", filename)
+
+
 def get_firmware(hw, patch=None):
     if hw < 0 or hw > 5:
         raise Exception("no compatible firmware available")
 
-    filename = "TS_HW{}_{}.hex".format(hw, FIRMWARE_VERSIONS[hw]["sw"])
-    filename = os.path.join(os.getenv("APP_FOLDER"), "firmware", filename)
+    filename = firmware_path(hw)
 
     if len(patch) > 0:
         patch |= {
@@ -370,7 +512,6 @@ def get_firmware(hw, patch=None):
 if __name__ == "__main__":
 
     import argparse
-    import logging
     from http.server import BaseHTTPRequestHandler, HTTPServer
     from urllib.parse import parse_qs
 
@@ -388,6 +529,7 @@ if __name__ == "__main__":
         "--password", type=str, required=True, help="Password used for decryption"
     )
     save = subparsers.add_parser("save", help="Save firmware")
+    subparsers.add_parser("convert", help="Convert firmware to memory mapped images")
     for subparser in [serve, save]:
         subparser.add_argument(
             "--hw",
@@ -420,6 +562,16 @@ if __name__ == "__main__":
         parser.parse_args(["--help"])
         exit(0)
 
+    if args.command == "convert":
+        for hw in range(1, len(FIRMWARE_VERSIONS)):
+            filename = firmware_path(hw)
+            image = convert_image(filename)
+            if image is None:
+                exit("Cannot read firmware {}".format(filename))
+            save_image(image_path(filename), image)
+            logging.info("Firmware image written to: %s", image_path(filename))
+        exit(0)
+
     patch = {}
     if args.enablepatch is True:
         if args.patch_hostname:
@@ -0,0 +1,239 @@
+import atexit
+import json
+import logging
+import os
+import threading
+
+from sqlalchemy import case, update
+
+from thermostart.metrics import WRITE_BEHIND_BATCH
+
+_LOGGER = logging.getLogger(__name__)
+
+# device columns that may reach the database a moment after the poll
+TELEMETRY_FIELDS = frozenset(
+    [
+        "room_temperature",
+        "kp",
+        "ti",
+        "td",
+        "oo",
+        "hw",
+        "fw",
+        "ot0",
+        "ot1",
+        "ot3",
+        "ot17",
+        "ot18",
+        "ot19",
+        "ot25",
+        "ot26",
+        "ot27",
+        "ot28",
+        "ot34",
+        "ot56",
+        "ot125",
+    ]
+)
+
+
+class WriteBehind:
+    """Collects telemetry updates of all polls and writes them in batches.
+
+    Pending values are written with one UPDATE every ``interval`` seconds,
+    or as soon as ``max_devices`` devices have pending values. Each update is
+    appended to ``journal_path`` first, and the journal is read back on
+    start, so a process that dies before a flush loses nothing. The journal
+    is synced to disk once per flush, which leaves the values of the last
+    ``interval`` to an OS crash or power loss. Control fields such as
+    ``source`` and ``cal_synced`` never go through here.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.interval = 0.25
+        self.max_devices = 200
+        self.journal_path = None
+        self.app = None
+        self._pending = {}
+        self._journal = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        self.enabled = app.config["WRITE_BEHIND"]
+        self.interval = app.config["WRITE_BEHIND_INTERVAL"]
+        self.max_devices = app.config["WRITE_BEHIND_MAX_DEVICES"]
+        self.journal_path = app.config["WRITE_BEHIND_JOURNAL"] or None
+        self.app = app
+        with self._lock:
+            self._close_journal()
+            self._pending = self._recover()
+        if self._pending:
+            self._start()
+        app.extensions["write_behind"] = self
+
+    def pending(self, hardware_id):
+        with self._lock:
+            return dict(self._pending.get(hardware_id, ()))
+
+    def write(self, device, values):
+        """Store telemetry ``values`` of ``device``, now or with the next flush."""
+        if not values:
+            return
+        if not self.enabled:
+            from thermostart import db
+
+            for field, value in values.items():
+                setattr(device, field, value)
+            db.session.commit()
+            return
+
+        if not TELEMETRY_FIELDS.issuperset(values):
+            raise ValueError(f"{set(values) - TELEMETRY_FIELDS} are not telemetry")
+        with self._lock:
+            if self.journal_path is not None:
+                self._append_journal(device.hardware_id, values)
+            self._pending.setdefault(device.hardware_id, {}).update(values)
+            full = len(self._pending) >= self.max_devices
+        self._start()
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write all pending values, returns the number of devices written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                flushing = self._rotate_journal()
+            if not batch:
+                return 0
+            try:
+                self._execute(batch)
+            except Exception:
+                _LOGGER.exception("Writing telemetry of %d devices failed", len(batch))
+                with self._lock:
+                    for hardware_id, values in batch.items():
+                        self._pending[hardware_id] = values | self._pending.get(
+                            hardware_id, {}
+                        )
+                return 0
+            if flushing is not None:
+                os.remove(flushing)
+            WRITE_BEHIND_BATCH.observe(len(batch))
+            return len(batch)
+
+    def _execute(self, batch):
+        from thermostart import db
+        from thermostart.models import Device
+
+        columns = set().union(*batch.values())
+        values = {}
+        for column in columns:
+            changes = {
+                hardware_id: fields[column]
+                for hardware_id, fields in batch.items()
+                if column in fields
+            }
+            values[column] = case(
+                changes, value=Device.hardware_id, else_=getattr(Device, column)
+            )
+        statement = (
+            update(Device)
+            .where(Device.hardware_id.in_(batch))
+            .values(values)
+            .execution_options(synchronize_session=False)
+        )
+        with self.app.app_context():
+            db.session.execute(statement)
+            db.session.commit()
+
+    def _start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None:
+                atexit.register(self.flush)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="write-behind", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def _append_journal(self, hardware_id, values):
+        if self._journal is None:
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._journal.write(json.dumps([hardware_id, values]) + "\n")
+        self._journal.flush()
+
+    def _sync_journal(self):
+        if self._journal is not None:
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+
+    def _close_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _rotate_journal(self):
+        """Move the journal aside until the values in it have been written."""
+        if self.journal_path is None or not os.path.exists(self.journal_path):
+            return None
+        # one fsync per batch, instead of one per poll
+        self._sync_journal()
+        self._close_journal()
+        flushing = self.journal_path + ".flushing"
+        if os.path.exists(flushing):
+            # a failed flush left its values pending, keep them in one file
+            with open(flushing, "a", encoding="utf-8") as f, open(
+                self.journal_path, encoding="utf-8"
+            ) as journal:
+                f.write(journal.read())
+                f.flush()
+                os.fsync(f.fileno())
+            os.remove(self.journal_path)
+        else:
+            os.replace(self.journal_path, flushing)
+        return flushing
+
+    def _recover(self):
+        """Pending values from journals a previous process did not flush."""
+        pending = {}
+        if self.journal_path is None:
+            return pending
+        paths = [self.journal_path + ".flushing", self.journal_path]
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        hardware_id, values = json.loads(line)
+                    except ValueError:
+                        # the last line of a crashed process may be cut off
+                        continue
+                    pending.setdefault(hardware_id, {}).update(values)
+        if pending:
+            _LOGGER.info("Recovered telemetry of %d devices", len(pending))
+            # rewrite them as one journal, the next flush clears it
+            with open(self.journal_path + ".recovered", "w", encoding="utf-8") as f:
+                for hardware_id, values in pending.items():
+                    f.write(json.dumps([hardware_id, values]) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(self.journal_path + ".recovered", self.journal_path)
+        if os.path.exists(paths[0]):
+            os.remove(paths[0])
+        return pending
+
+
+write_behind = WriteBehind()